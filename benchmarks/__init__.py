@@ -0,0 +1,4 @@
+"""
+Outils de test et de mesure des performances d'Email Manager V3
+(serveur IMAP local, générateurs de corpus, benchmarks).
+"""
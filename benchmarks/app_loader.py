@@ -0,0 +1,66 @@
+"""
+Chargement du moteur d'Email Manager V3 pour les benchmarks
+Le script principal porte un nom non importable ("email_manager_v3 (2).py"):
+il est chargé par importlib puis instancié sans interface.
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_FILE = ROOT / "email_manager_v3 (2).py"
+
+# Règles représentatives de la configuration de production
+DEFAULT_RULES = [
+    {"name": "Factures", "field": "Sujet", "condition": "contient", "keyword": "facture",
+     "action": "Déplacer vers", "folder": "CA", "case_sensitive": False, "priority": 2},
+    {"name": "A lire", "field": "Sujet", "condition": "contient", "keyword": "a lire",
+     "action": "Déplacer vers", "folder": "CA", "case_sensitive": False, "priority": 2},
+    {"name": "Krysto", "field": "Expéditeur", "condition": "contient", "keyword": "krysto",
+     "action": "Déplacer vers", "folder": "rapport", "case_sensitive": False, "priority": 2},
+    {"name": "Velten", "field": "Sujet ou Corps", "condition": "contient", "keyword": "velten",
+     "action": "Déplacer vers", "folder": "important", "case_sensitive": False, "priority": 2},
+    {"name": "Relances", "field": "Sujet", "condition": "correspond à (regex)",
+     "keyword": r"relance\s*:\s*devis \d+", "action": "Marquer comme important",
+     "folder": "", "case_sensitive": False, "priority": 3},
+    {"name": "Newsletters", "field": "Domaine expéditeur", "condition": "contient un de (liste)",
+     "keyword": "news.fr, promo.com, infolettre.nc", "action": "Déplacer vers",
+     "folder": "Newsletters", "case_sensitive": False, "priority": 5},
+]
+
+_module = None
+
+
+def load_app_module():
+    """Importer le script principal comme module (une seule fois)"""
+    global _module
+    if _module is None:
+        if str(ROOT) not in sys.path:
+            sys.path.insert(0, str(ROOT))
+        spec = importlib.util.spec_from_file_location("email_manager_v3", APP_FILE)
+        _module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_module)
+    return _module
+
+
+def create_manager(data_dir, host="127.0.0.1", port=143, user="moi@exemple.nc",
+                   password="secret", rules=None, **settings):
+    """EmailManager sans interface, configuré pour un serveur IMAP local.
+
+    settings: valeurs des variables de configuration, par nom sans le suffixe
+    _var (ex: batch_size="100", dry_run=True).
+    """
+    module = load_app_module()
+    manager = module.EmailManager(headless=True, data_dir=data_dir)
+    manager.server_var.set(host)
+    manager.port_var.set(str(port))
+    manager.use_ssl_var.set(False)
+    manager.email_var.set(user)
+    manager.password_var.set(password)
+    manager.max_emails_var.set("0")
+    manager.rules = [dict(rule) for rule in (DEFAULT_RULES if rules is None else rules)]
+
+    for name, value in settings.items():
+        getattr(manager, f"{name}_var").set(value)
+    return manager
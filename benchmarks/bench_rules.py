@@ -0,0 +1,249 @@
+"""
+Microbenchmark du moteur de règles d'Email Manager V3
+Génère des jeux de règles et de chaînes de 10 à 10 000 règles couvrant tous
+les champs et toutes les conditions de check_single_condition (regex et listes
+comprises), puis chronomètre analyze_email_v3 sur un corpus de messages déjà
+parsés et décodés: le réseau et le parsing MIME sont hors mesure, seules la
+correspondance des règles et la construction de l'action sont comptées.
+
+Utilisation:
+    python -m benchmarks.bench_rules --sizes 10 100 1000 10000
+    python -m benchmarks.bench_rules --compare benchmarks/results/rules-abc1234.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.app_loader import create_manager
+from benchmarks.bench_throughput import RESULTS_DIR, git_commit
+from benchmarks.corpus import CorpusGenerator
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+FIELDS = ["Sujet", "Expéditeur", "Corps", "Destinataire", "Sujet ou Corps", "Domaine expéditeur"]
+CONDITIONS = ["contient", "ne contient pas", "commence par", "finit par", "est exactement",
+              "n'est pas", "correspond à (regex)", "contient un de (liste)"]
+AND_FIELDS = ["Sujet", "Expéditeur", "Corps", "Destinataire"]
+AND_CONDITIONS = ["contient", "ne contient pas", "commence par", "finit par", "est exactement"]
+
+# Mots présents dans le corpus (règles qui correspondent parfois)
+HIT_WORDS = ["facture", "réunion", "relance", "commande", "velten", "krysto", "news.fr",
+             "nouméa", "congés", "sécurité", "devis", "promo.com"]
+# Conditions toujours vraies sur un texte quelconque: combinées à un ET qui échoue
+NEGATIVE_CONDITIONS = ("ne contient pas", "n'est pas")
+
+
+class RuleSetGenerator:
+    """Jeux de règles et de chaînes déterministes pour une graine donnée"""
+
+    def __init__(self, seed=7, hit_ratio=0.002, chain_ratio=0.2, chain_length=5):
+        self.seed = seed
+        self.hit_ratio = hit_ratio
+        self.chain_ratio = chain_ratio
+        self.chain_length = chain_length
+
+    def generate(self, count):
+        """Retourner (rules, chains) totalisant count règles"""
+        rng = random.Random(f"{self.seed}-{count}")
+        rules = [self.rule(rng, index) for index in range(count)]
+
+        chained = int(count * self.chain_ratio)
+        chains = []
+        for start in range(0, chained, self.chain_length):
+            chains.append({
+                "name": f"Chaîne {len(chains) + 1}",
+                "priority": rng.randint(1, 100),
+                "rules": rules[start:start + self.chain_length],
+                "stop_on_match": True,
+                "enabled": rng.random() > 0.05
+            })
+        return rules[chained:], chains
+
+    def rule(self, rng, index):
+        """Une règle: champ x condition en rotation, mot-clé qui échoue sauf hit_ratio"""
+        field = FIELDS[index % len(FIELDS)]
+        condition = CONDITIONS[(index // len(FIELDS)) % len(CONDITIONS)]
+        hit = rng.random() < self.hit_ratio
+        rule = {
+            "name": f"Règle {index}",
+            "field": field,
+            "condition": condition,
+            "keyword": self.keyword(rng, condition, hit),
+            "action": rng.choice(["Déplacer vers", "Copier vers", "Marquer comme lu",
+                                  "Marquer comme important"]),
+            "folder": f"Tri/{index % 50}",
+            "case_sensitive": rng.random() < 0.2,
+            "priority": rng.randint(1, 10),
+            "mark_after_action": rng.random() < 0.3
+        }
+
+        # Conditions négatives: vraies presque partout, le ET échoue sauf hit
+        if condition in NEGATIVE_CONDITIONS or rng.random() < 0.15:
+            and_condition = rng.choice(AND_CONDITIONS[:1] + AND_CONDITIONS[2:])
+            rule.update({
+                "and_field": rng.choice(AND_FIELDS),
+                "and_condition": and_condition,
+                "and_keyword": self.keyword(rng, and_condition, hit)
+            })
+        return rule
+
+    def keyword(self, rng, condition, hit):
+        """Mot-clé adapté à la condition"""
+        word = rng.choice(HIT_WORDS) if hit else f"zq{rng.getrandbits(32):x}"
+        if condition == "correspond à (regex)":
+            return rng.choice([rf"\b{word}\b", rf"{word}\s*\d+", rf"(?:re|tr)\s*:\s*{word}",
+                               rf"^{word}", rf"{word}.*(urgent|important)"])
+        if condition == "contient un de (liste)":
+            decoys = [f"zq{rng.getrandbits(24):x}" for _ in range(rng.randint(2, 8))]
+            decoys.insert(rng.randrange(len(decoys) + 1), word)
+            return ", ".join(decoys)
+        return word
+
+
+def build_corpus(manager, count, seed):
+    """Emails extraits (MessageRecord), prêts pour analyze_email_v3"""
+    corpus = []
+    for uid, (raw, flags, _) in enumerate(CorpusGenerator(seed=seed).generate(count), 1):
+        flag_bytes = (" ".join(flags)).encode()
+        corpus.append(manager.message_record(uid, b"FLAGS (" + flag_bytes + b")", raw))
+    return corpus
+
+
+def classify_all(manager, corpus, stats):
+    """Classer tout le corpus une fois, retourner le nombre de décisions"""
+    decided = 0
+    for record in corpus:
+        if manager.analyze_email_v3(record, stats):
+            decided += 1
+    return decided
+
+
+def new_stats():
+    """Compteurs attendus par analyze_email_v3"""
+    return {"cc_moved": 0, "rules_applied": 0, "chains_applied": 0}
+
+
+def measure(manager, corpus, min_time):
+    """Débit (répétitions jusqu'à min_time) puis allocations sur un passage"""
+    classify_all(manager, corpus, new_stats())  # échauffement (caches regex, etc.)
+
+    gc.collect()
+    passes = 0
+    timings = []
+    started = time.perf_counter()
+    while True:
+        pass_started = time.perf_counter()
+        decided = classify_all(manager, corpus, new_stats())
+        timings.append(time.perf_counter() - pass_started)
+        passes += 1
+        if time.perf_counter() - started >= min_time:
+            break
+
+    best = min(timings)
+    tracemalloc.start()
+    baseline_blocks = len(tracemalloc.take_snapshot().traces)
+    baseline, _ = tracemalloc.get_traced_memory()
+    stats = new_stats()
+    peak_total = 0
+    for item in corpus:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        classify_all(manager, [item], stats)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    current, _ = tracemalloc.get_traced_memory()
+    retained_blocks = len(tracemalloc.take_snapshot().traces) - baseline_blocks
+    tracemalloc.stop()
+
+    return {
+        "passes": passes,
+        "ops_per_s": round(len(corpus) / best, 1),
+        "us_per_message": round(best / len(corpus) * 1e6, 2),
+        "mean_pass_s": round(sum(timings) / len(timings), 4),
+        "decided": decided,
+        "alloc_peak_bytes_per_message": round(peak_total / len(corpus), 1),
+        "alloc_retained_bytes": current - baseline,
+        "alloc_retained_blocks": retained_blocks,
+        "matches": stats
+    }
+
+
+def compare(results, previous_path):
+    """Afficher l'écart de débit avec un fichier de résultats précédent"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {run["rules"]: run for run in json.load(f)["runs"]}
+
+    print(f"\n📊 Comparaison avec {previous_path}")
+    for run in results["runs"]:
+        before = previous.get(run["rules"])
+        if not before:
+            continue
+        delta = (run["ops_per_s"] / before["ops_per_s"] - 1) * 100
+        print(f"  • {run['rules']:>6} règles: {delta:+.1f}% "
+              f"({before['ops_per_s']:.0f} → {run['ops_per_s']:.0f} messages/s)")
+
+
+def main():
+    """Lancer le microbenchmark en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Microbenchmark du moteur de règles")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Nombres de règles (chaînes comprises)")
+    parser.add_argument("--messages", type=int, default=500, help="Taille du corpus")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hit-ratio", type=float, default=0.002,
+                        help="Part des règles dont le mot-clé existe dans le corpus")
+    parser.add_argument("--chain-ratio", type=float, default=0.2,
+                        help="Part des règles regroupées en chaînes")
+    parser.add_argument("--min-time", type=float, default=2.0,
+                        help="Durée minimale de mesure par taille, en secondes")
+    parser.add_argument("--output", help="Fichier JSON de résultats "
+                                         "(défaut: benchmarks/results/rules-<commit>.json)")
+    parser.add_argument("--compare", help="Fichier de résultats précédent à comparer")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    generator = RuleSetGenerator(seed=args.seed, hit_ratio=args.hit_ratio,
+                                 chain_ratio=args.chain_ratio)
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"messages": args.messages, "seed": args.seed, "hit_ratio": args.hit_ratio,
+                     "chain_ratio": args.chain_ratio},
+        "runs": []
+    }
+
+    with tempfile.TemporaryDirectory(prefix="email_manager_rules_") as data_dir:
+        manager = create_manager(data_dir)
+        corpus = build_corpus(manager, args.messages, args.seed)
+
+        for count in args.sizes:
+            manager.rules, manager.rule_chains = generator.generate(count)
+            run = measure(manager, corpus, args.min_time)
+            run.update({"rules": count, "chains": len(manager.rule_chains)})
+            results["runs"].append(run)
+            print(f"⚙️ {count:>6} règles: {run['ops_per_s']:>10.1f} messages/s "
+                  f"({run['us_per_message']:.1f} µs/message) - "
+                  f"{run['alloc_peak_bytes_per_message']:.0f} o alloués/message - "
+                  f"{run['decided']}/{len(corpus)} classés")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"rules-{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"\n💾 Résultats: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Benchmark de débit de bout en bout d'Email Manager V3
+Pour chaque taille de corpus (1k, 10k, 100k messages par défaut), le serveur
+IMAP local et le moteur sans interface tournent dans deux processus séparés:
+le pic de mémoire mesuré est celui du moteur seul. Les résultats (débit,
+latences p50/p95/p99 par message, octets échangés, pic RSS, détail des étapes)
+sont écrits dans un fichier JSON comparable d'un commit à l'autre.
+
+Utilisation:
+    python -m benchmarks.bench_throughput --sizes 1000 10000
+    python -m benchmarks.bench_throughput --sizes 1000 --network production
+    python -m benchmarks.bench_throughput --sizes 1000 --network adsl --no-compress
+    python -m benchmarks.bench_throughput --compare benchmarks/results/throughput-abc1234.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.net_shaper import NETWORK_PROFILES, network_profile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def peak_rss_bytes():
+    """Pic de mémoire résidente du processus courant (None si indisponible)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: Ko, macOS: octets
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_commit():
+    """Commit courant (court), ou None hors dépôt git"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_process(count, seed, latency, attachment_ratio, compress, ready, stop):
+    """Processus serveur: générer le corpus, servir jusqu'au signal d'arrêt"""
+    from benchmarks.corpus import populate_store
+    from benchmarks.imap_stub_server import DEFAULT_CAPABILITIES, IMAPStubServer, MailStore
+
+    store = MailStore()
+    started = time.perf_counter()
+    corpus_bytes = populate_store(store, count, seed=seed, attachment_ratio=attachment_ratio)
+    generation_s = time.perf_counter() - started
+
+    capabilities = [name for name in DEFAULT_CAPABILITIES
+                    if compress or not name.startswith("COMPRESS=")]
+    with IMAPStubServer(store, latency=latency or None, capabilities=capabilities) as server:
+        ready.put({"address": server.address, "corpus_bytes": corpus_bytes,
+                   "generation_s": round(generation_s, 3)})
+        stop.wait()
+        ready.put({"commands": server.commands_received,
+                   "folders": {name: len(mailbox.messages)
+                               for name, mailbox in store.mailboxes.items()}})
+
+
+def engine_process(host, port, settings, network, results):
+    """Processus client: analyse complète par le moteur sans interface"""
+    from benchmarks.app_loader import create_manager
+    from benchmarks.net_shaper import NetworkProfile, shaped
+
+    with tempfile.TemporaryDirectory(prefix="email_manager_bench_") as data_dir:
+        manager = create_manager(data_dir, host, port, **settings)
+        if network:
+            from imap_transport import InstrumentedIMAP4
+            manager.connection_factory = lambda: shaped(InstrumentedIMAP4)(
+                host, port, network=NetworkProfile(**network))
+        stats = manager.run_headless()
+    results.put({"stats": stats, "peak_rss_bytes": peak_rss_bytes()})
+
+
+def run_size(count, args):
+    """Mesurer une taille de corpus, retourner le résultat sérialisable"""
+    context = multiprocessing.get_context("spawn")
+    ready, stop, results = context.Queue(), context.Event(), context.Queue()
+
+    server = context.Process(target=server_process, name="imap-stub",
+                             args=(count, args.seed, args.latency, args.attachment_ratio,
+                                   not args.no_compress, ready, stop))
+    server.start()
+    try:
+        corpus = ready.get(timeout=3600)
+        host, port = corpus["address"]
+        print(f"📬 {count} messages générés ({corpus['corpus_bytes'] / 1048576:.1f} Mo) "
+              f"en {corpus['generation_s']:.1f} s")
+
+        settings = {"batch_size": str(args.batch_size), "dry_run": args.dry_run}
+        engine = context.Process(target=engine_process, name="engine",
+                                 args=(host, port, settings, args.network_settings, results))
+        engine.start()
+        outcome = results.get(timeout=args.timeout)
+        engine.join()
+    finally:
+        stop.set()
+    server_info = ready.get(timeout=60)
+    server.join()
+
+    stats = outcome["stats"]
+    perf = stats.get("perf", {})
+    message_stage = perf.get("stages", {}).get("message", {})
+    counters = perf.get("counters", {})
+    return {
+        "messages": count,
+        "processed": stats.get("processed"),
+        "errors": stats.get("errors"),
+        "elapsed_s": perf.get("elapsed_s"),
+        "messages_per_s": perf.get("messages_per_s"),
+        "latency_ms": {key: message_stage.get(f"{key}_ms") for key in ("p50", "p95", "p99")},
+        "bytes_in": counters.get("bytes_in"),
+        "bytes_out": counters.get("bytes_out"),
+        "uncompressed_in": counters.get("uncompressed_in"),
+        "uncompressed_out": counters.get("uncompressed_out"),
+        "peak_rss_bytes": outcome["peak_rss_bytes"],
+        "corpus_bytes": corpus["corpus_bytes"],
+        "actions": {key: stats.get(key) for key in ("cc_moved", "rules_applied", "chains_applied")},
+        "server_commands": server_info["commands"],
+        "folders_after": server_info["folders"],
+        "stages": perf.get("stages", {})
+    }
+
+
+def compare(results, previous_path):
+    """Afficher l'écart de débit et de p95 avec un fichier de résultats précédent"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {run["messages"]: run for run in json.load(f)["runs"]}
+
+    print(f"\n📊 Comparaison avec {previous_path}")
+    for run in results["runs"]:
+        before = previous.get(run["messages"])
+        if not before:
+            continue
+        rate_delta = (run["messages_per_s"] / before["messages_per_s"] - 1) * 100 \
+            if before.get("messages_per_s") else 0.0
+        p95_before = before["latency_ms"]["p95"] or 0.0
+        p95_delta = (run["latency_ms"]["p95"] / p95_before - 1) * 100 if p95_before else 0.0
+        print(f"  • {run['messages']:>7} messages: débit {rate_delta:+.1f}% "
+              f"({before['messages_per_s']:.0f} → {run['messages_per_s']:.0f}/s), "
+              f"p95 {p95_delta:+.1f}%")
+
+
+def main():
+    """Lancer le benchmark en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Benchmark de débit d'Email Manager V3")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Tailles de corpus à mesurer (nombre de messages)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Latence ajoutée par le serveur à chaque commande, en secondes")
+    parser.add_argument("--network", choices=sorted(NETWORK_PROFILES),
+                        help="Conditions réseau simulées côté client (RTT, débit, blocages)")
+    parser.add_argument("--rtt", type=float, help="Aller-retour réseau simulé, en secondes")
+    parser.add_argument("--bandwidth", type=float, help="Débit descendant simulé, en octets/s")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--attachment-ratio", type=float, default=0.03)
+    parser.add_argument("--no-compress", action="store_true",
+                        help="Serveur sans COMPRESS=DEFLATE (échanges en clair)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Analyser sans déplacer (pas de COPY/MOVE/STORE)")
+    parser.add_argument("--timeout", type=float, default=6 * 3600,
+                        help="Durée maximale d'une analyse, en secondes")
+    parser.add_argument("--output", help="Fichier JSON de résultats "
+                                         "(défaut: benchmarks/results/throughput-<commit>.json)")
+    parser.add_argument("--compare", help="Fichier de résultats précédent à comparer")
+    args = parser.parse_args()
+    args.network_settings = None
+    if args.network or args.rtt is not None or args.bandwidth is not None:
+        network = network_profile(args.network, rtt=args.rtt, bandwidth=args.bandwidth)
+        args.network_settings = network.to_dict()
+        print(f"📡 Réseau simulé: {network.describe()}")
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"seed": args.seed, "latency": args.latency, "batch_size": args.batch_size,
+                     "attachment_ratio": args.attachment_ratio, "dry_run": args.dry_run,
+                     "compress": not args.no_compress, "network": args.network_settings},
+        "runs": []
+    }
+
+    for count in args.sizes:
+        print(f"\n🚀 Benchmark: {count} messages")
+        run = run_size(count, args)
+        results["runs"].append(run)
+        rss = run["peak_rss_bytes"]
+        print(f"✅ {run['processed']} traités en {run['elapsed_s']:.1f} s - "
+              f"{run['messages_per_s']:.1f} emails/s - p50={run['latency_ms']['p50']:.2f}ms "
+              f"p95={run['latency_ms']['p95']:.2f}ms p99={run['latency_ms']['p99']:.2f}ms")
+        ratio = run["uncompressed_in"] / run["bytes_in"] if run["uncompressed_in"] else None
+        print(f"📶 Reçu: {run['bytes_in'] / 1048576:.1f} Mo"
+              + (f" (compression ×{ratio:.1f})" if ratio else "")
+              + f" - Envoyé: {run['bytes_out'] / 1024:.1f} Ko"
+              + (f" - Pic RSS moteur: {rss / 1048576:.0f} Mo" if rss else ""))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"throughput-{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    print(f"\n💾 Résultats: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Générateur de boîtes aux lettres synthétiques pour les benchmarks
+Corpus reproductible (graine) avec des en-têtes réalistes: sujets français en
+mots encodés RFC 2047, corps multipart texte/HTML, pièces jointes, et des
+destinataires en copie qui exercent la logique CC d'analyze_email_v3.
+"""
+
+import base64
+import quopri
+import random
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.utils import format_datetime
+
+USER_EMAIL = "moi@exemple.nc"
+
+SUBJECTS = [
+    "Facture n°{n} - {mois}",
+    "Réunion d'équipe du {jour} {mois}",
+    "Relance : devis {n}",
+    "Votre commande n°{n} a été expédiée",
+    "Compte rendu de la réunion de {mois}",
+    "Invitation : déjeuner de fin d'année",
+    "Rappel : échéance de paiement du {jour} {mois}",
+    "Les nouveautés de {mois} — offres spéciales",
+    "Problème d'accès à la messagerie",
+    "Congés d'été : planning de l'équipe",
+    "A lire : note de service n°{n}",
+    "RE: Livraison prévue à Nouméa",
+    "TR: Contrat de maintenance {n}",
+    "Suivi du dossier Velten",
+    "Mise à jour sécurité de votre compte",
+]
+
+MONTHS_FR = ["janvier", "février", "mars", "avril", "mai", "juin", "juillet",
+             "août", "septembre", "octobre", "novembre", "décembre"]
+
+SENDERS = [
+    ("Service Comptabilité", "compta@fournisseur.fr"),
+    ("Jean-François Lefèvre", "jf.lefevre@krysto.nc"),
+    ("Hélène Dupré", "helene.dupre@entreprise.nc"),
+    ("Boutique en ligne", "commandes@promo.com"),
+    ("La Lettre", "infos@news.fr"),
+    ("Support technique", "support@hebergeur.com"),
+    ("Mairie de Nouméa", "contact@ville-noumea.nc"),
+    ("Noël Müller", "noel.muller@velten.de"),
+    ("Infolettre", "no-reply@infolettre.nc"),
+    ("Équipe RH", "rh@entreprise.nc"),
+]
+
+COLLEAGUES = ["paul@entreprise.nc", "marie@entreprise.nc", "equipe@entreprise.nc",
+              "direction@entreprise.nc", "comptable@cabinet.nc"]
+
+PARAGRAPHS = [
+    "Bonjour,\n\nVeuillez trouver ci-joint le document demandé. N'hésitez pas à revenir vers nous "
+    "pour toute question.",
+    "Comme convenu lors de notre échange téléphonique, je vous confirme les éléments suivants : "
+    "livraison prévue la semaine prochaine, règlement à trente jours.",
+    "Merci de bien vouloir valider le devis avant la fin du mois afin que nous puissions "
+    "planifier l'intervention.",
+    "La réunion aura lieu en salle de conférence. Un ordre du jour détaillé sera envoyé "
+    "la veille.",
+    "Cordialement,\n\nL'équipe",
+    "Pour vous désinscrire de cette liste, cliquez sur le lien en bas de page.",
+]
+
+
+class CorpusGenerator:
+    """Messages bruts déterministes pour une graine donnée"""
+
+    def __init__(self, seed=42, user_email=USER_EMAIL, attachment_ratio=0.03,
+                 html_ratio=0.4, now=None):
+        self.seed = seed
+        self.user_email = user_email
+        self.attachment_ratio = attachment_ratio
+        self.html_ratio = html_ratio
+        self.now = now or datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+    def generate(self, count):
+        """Itérer sur count tuples (raw, flags, internaldate)"""
+        rng = random.Random(self.seed)
+        for index in range(count):
+            yield self.message(rng, index)
+
+    def message(self, rng, index):
+        """Construire un message: en-têtes, corps et flags IMAP"""
+        sender_name, sender = rng.choice(SENDERS)
+        subject = rng.choice(SUBJECTS).format(n=rng.randint(1000, 99999),
+                                              jour=rng.randint(1, 28),
+                                              mois=rng.choice(MONTHS_FR))
+        sent = self.now - timedelta(days=rng.random() * 120, seconds=rng.randint(0, 86400))
+
+        to_addrs, cc_addrs = self.recipients(rng)
+        headers = [
+            ("Return-Path", f"<{sender}>"),
+            ("Received", f"from mx.{sender.split('@')[1]} by imap.exemple.nc with ESMTPS id "
+                         f"{rng.getrandbits(48):012x}; {format_datetime(sent)}"),
+            ("Message-ID", f"<{rng.getrandbits(64):016x}.{index}@{sender.split('@')[1]}>"),
+            ("Date", format_datetime(sent)),
+            ("From", f"{self.encode_words(rng, sender_name)} <{sender}>"),
+            ("To", ", ".join(to_addrs)),
+        ]
+        if cc_addrs:
+            headers.append(("Cc", ", ".join(cc_addrs)))
+        headers.append(("Subject", self.encode_words(rng, subject)))
+        headers.append(("MIME-Version", "1.0"))
+
+        body_text = "\n\n".join(rng.sample(PARAGRAPHS, rng.randint(1, 4)))
+        if "Velten" in subject or rng.random() < 0.02:
+            body_text += "\n\nRéférence client : Velten."
+
+        with_html = rng.random() < self.html_ratio
+        with_attachment = rng.random() < self.attachment_ratio
+        body_headers, body = self.body(rng, body_text, with_html, with_attachment)
+
+        raw = "".join(f"{name}: {value}\r\n" for name, value in headers + body_headers)
+        raw = raw.encode("ascii") + b"\r\n" + body
+
+        flags = []
+        if rng.random() < 0.6:
+            flags.append("\\Seen")
+        if rng.random() < 0.05:
+            flags.append("\\Flagged")
+        return raw, flags, sent
+
+    def recipients(self, rng):
+        """Destinataires: direct, en copie seulement, ou les deux (cas CC)"""
+        pattern = rng.random()
+        others = rng.sample(COLLEAGUES, rng.randint(1, 3))
+        if pattern < 0.55:
+            return [self.user_email] + others[:1], others[1:]
+        if pattern < 0.80:
+            # En copie uniquement: candidat au dossier CC
+            return others[:1], [self.user_email] + others[1:]
+        if pattern < 0.90:
+            # Destinataire principal ET en copie: ne doit pas être déplacé
+            return [self.user_email], [self.user_email.upper()] + others
+        return others, []
+
+    def encode_words(self, rng, text):
+        """Encoder en mots RFC 2047 (B ou Q, UTF-8 ou Latin-1) si non ASCII"""
+        if text.isascii() and rng.random() < 0.7:
+            return text
+        charset = "iso-8859-1" if rng.random() < 0.2 else "utf-8"
+        try:
+            text.encode(charset)
+        except UnicodeEncodeError:
+            charset = "utf-8"
+        # maxlinelen court: les longs sujets sont découpés en plusieurs mots encodés
+        return Header(text, charset, maxlinelen=rng.choice([40, 76])).encode(linesep="\r\n")
+
+    def body(self, rng, text, with_html, with_attachment):
+        """Corps simple, multipart/alternative et/ou multipart/mixed"""
+        text_part = self.text_part(rng, text)
+        if with_html:
+            html = "<html><body>" + "".join(
+                f"<p>{paragraph.replace(chr(10), '<br>')}</p>" for paragraph in text.split("\n\n")
+            ) + "</body></html>"
+            html_part = ([("Content-Type", 'text/html; charset="utf-8"'),
+                          ("Content-Transfer-Encoding", "quoted-printable")],
+                         quopri.encodestring(html.encode("utf-8")))
+            content = self.multipart(rng, "alternative", [text_part, html_part])
+        else:
+            content = text_part
+
+        if with_attachment:
+            size = rng.choice([8_000, 30_000, 120_000])
+            data = base64.encodebytes(rng.randbytes(size)).replace(b"\n", b"\r\n")
+            attachment = ([("Content-Type", 'application/pdf; name="document.pdf"'),
+                           ("Content-Disposition", 'attachment; filename="document.pdf"'),
+                           ("Content-Transfer-Encoding", "base64")], data)
+            content = self.multipart(rng, "mixed", [content, attachment])
+        return content
+
+    def text_part(self, rng, text):
+        """Partie text/plain en quoted-printable (UTF-8) ou 8bit (Latin-1)"""
+        if rng.random() < 0.8:
+            return ([("Content-Type", 'text/plain; charset="utf-8"'),
+                     ("Content-Transfer-Encoding", "quoted-printable")],
+                    quopri.encodestring(text.encode("utf-8")).replace(b"\n", b"\r\n"))
+        return ([("Content-Type", 'text/plain; charset="iso-8859-1"'),
+                 ("Content-Transfer-Encoding", "8bit")],
+                text.encode("iso-8859-1", errors="replace").replace(b"\n", b"\r\n"))
+
+    def multipart(self, rng, subtype, parts):
+        """Assembler des parties (en-têtes, corps) dans un multipart"""
+        boundary = f"=_{rng.getrandbits(64):016x}"
+        chunks = []
+        for part_headers, part_body in parts:
+            header_text = "".join(f"{name}: {value}\r\n" for name, value in part_headers)
+            chunks.append(b"--" + boundary.encode() + b"\r\n" + header_text.encode("ascii") +
+                          b"\r\n" + part_body + b"\r\n")
+        body = b"".join(chunks) + b"--" + boundary.encode() + b"--\r\n"
+        return [("Content-Type", f'multipart/{subtype}; boundary="{boundary}"')], body
+
+
+def populate_store(store, count, seed=42, folder="INBOX", user_email=USER_EMAIL, **options):
+    """Remplir un MailStore du serveur local avec count messages générés"""
+    generator = CorpusGenerator(seed=seed, user_email=user_email, **options)
+    total_bytes = 0
+    for raw, flags, internaldate in generator.generate(count):
+        store.add_message(folder, raw, flags, internaldate)
+        total_bytes += len(raw)
+    return total_bytes
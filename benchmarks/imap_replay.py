@@ -0,0 +1,147 @@
+"""
+Rejeu d'une session IMAP enregistrée pour les tests de non-régression
+La session est enregistrée depuis l'application (onglet Paramètres, section
+performances: "Enregistrer la session IMAP de la prochaine analyse"), dans
+le dossier sessions/ des données. Le rejeu exécute le moteur sans interface,
+avec la configuration enregistrée, sur un transport qui renvoie les réponses
+du serveur: nombre de commandes et durée sont comparables d'un commit à
+l'autre sans toucher au serveur de production. Les corps étant masqués, les
+règles sur le corps peuvent décider autrement qu'à l'enregistrement: ces
+commandes sont signalées comme absentes de l'enregistrement.
+
+Utilisation:
+    python -m benchmarks.imap_replay session_20240601_120000.jsonl.gz
+    python -m benchmarks.imap_replay session.jsonl.gz --latency 0 --baseline replay-abc1234.json
+    python -m benchmarks.imap_replay session.jsonl.gz --network production
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.app_loader import create_manager, load_app_module
+from benchmarks.bench_throughput import RESULTS_DIR, git_commit
+from benchmarks.net_shaper import NETWORK_PROFILES, network_profile, shaped
+
+
+def replay(path, latency="recorded", speed=1.0, network=None):
+    """Rejouer une session avec le moteur sans interface, retourner le résultat"""
+    load_app_module()
+    from imap_transport import ReplayIMAP4, load_session
+
+    metadata, _, exchanges = load_session(path)
+    settings = dict(metadata.get("settings", {}))
+    rules = settings.pop("rules", [])
+    settings.pop("email", None)
+
+    connections = []
+
+    def factory():
+        if network is not None:
+            connection = shaped(ReplayIMAP4)(path, latency=latency, speed=speed, network=network)
+        else:
+            connection = ReplayIMAP4(path, latency=latency, speed=speed)
+        connections.append(connection)
+        return connection
+
+    with tempfile.TemporaryDirectory(prefix="email_manager_replay_") as data_dir:
+        manager = create_manager(data_dir, user=metadata.get("account", ""), rules=rules)
+        for name, value in settings.items():
+            variable = getattr(manager, f"{name}_var", None)
+            if variable is not None:
+                variable.set(value)
+        manager.rule_chains = metadata.get("chains", [])
+        manager.selected_folders = metadata.get("folders", [])
+        manager.journal_enabled_var.set(False)
+        manager.connection_factory = factory
+        stats = manager.run_headless()
+
+    perf = stats.get("perf", {})
+    commands = Counter()
+    for name, stage in perf.get("stages", {}).items():
+        if name.startswith("imap "):
+            commands[name[5:]] += stage["count"]
+
+    unmatched = [command for connection in connections for command in connection.unmatched]
+    return {
+        "session": str(path),
+        "recorded_at": metadata.get("recorded_at"),
+        "latency": latency,
+        "network": network.to_dict() if network is not None else None,
+        "recorded_commands": len(exchanges),
+        "commands": sum(commands.values()),
+        "commands_by_name": dict(commands),
+        "unmatched_commands": len(unmatched),
+        "unmatched_sample": unmatched[:20],
+        "elapsed_s": perf.get("elapsed_s"),
+        "processed": stats.get("processed"),
+        "errors": stats.get("errors"),
+        "actions": {key: stats.get(key) for key in ("cc_moved", "rules_applied", "chains_applied")}
+    }
+
+
+def check_regression(result, baseline_path, max_slowdown):
+    """Comparer à un résultat de référence, retourner la liste des régressions"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    problems = []
+    if result["commands"] > baseline["commands"]:
+        problems.append(f"commandes IMAP: {baseline['commands']} → {result['commands']}")
+    if baseline.get("elapsed_s") and result["elapsed_s"] > baseline["elapsed_s"] * (1 + max_slowdown / 100):
+        problems.append(f"durée: {baseline['elapsed_s']:.2f} s → {result['elapsed_s']:.2f} s "
+                        f"(tolérance {max_slowdown:.0f}%)")
+    return problems
+
+
+def main():
+    """Rejouer une session en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Rejeu d'une session IMAP enregistrée")
+    parser.add_argument("session", help="Fichier session_*.jsonl.gz")
+    parser.add_argument("--latency", default="recorded",
+                        help="'recorded' (durées enregistrées) ou délai fixe par commande en secondes")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Accélération des durées enregistrées (2 = deux fois plus vite)")
+    parser.add_argument("--network", choices=sorted(NETWORK_PROFILES),
+                        help="Conditions réseau simulées (à combiner avec --latency 0)")
+    parser.add_argument("--output", help="Fichier JSON de résultat "
+                                         "(défaut: benchmarks/results/replay-<commit>.json)")
+    parser.add_argument("--baseline", help="Résultat de référence: échec si régression")
+    parser.add_argument("--max-slowdown", type=float, default=10.0,
+                        help="Ralentissement toléré par rapport à la référence, en pourcents")
+    args = parser.parse_args()
+
+    latency = args.latency if args.latency == "recorded" else float(args.latency)
+    network = network_profile(args.network) if args.network else None
+    if network is not None:
+        print(f"📡 Réseau simulé: {network.describe()}")
+    result = replay(args.session, latency=latency, speed=args.speed, network=network)
+    result["commit"] = git_commit()
+
+    print(f"🎞️ {result['processed']} emails rejoués en {result['elapsed_s']:.2f} s - "
+          f"{result['commands']} commandes IMAP ({result['recorded_commands']} enregistrées)")
+    if result["unmatched_commands"]:
+        print(f"⚠️ {result['unmatched_commands']} commandes absentes de l'enregistrement "
+              f"(ex: {result['unmatched_sample'][0]})")
+
+    commit = result["commit"] or "local"
+    output = Path(args.output) if args.output else RESULTS_DIR / f"replay-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+    print(f"💾 Résultat: {output}")
+
+    if args.baseline:
+        problems = check_regression(result, args.baseline, args.max_slowdown)
+        for problem in problems:
+            print(f"❌ Régression - {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Pas de régression par rapport à la référence")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1242 @@
+"""
+Serveur IMAP4rev1 local pour tests et benchmarks d'Email Manager V3
+Stand-in en mémoire, sans SSL, chargeable depuis un Maildir ou un corpus généré.
+
+Commandes supportées: CAPABILITY, NOOP, LOGIN, LOGOUT, ENABLE, NAMESPACE,
+LIST/LSUB, CREATE, SUBSCRIBE, STATUS, APPEND, SELECT/EXAMINE, CLOSE, IDLE,
+SEARCH, FETCH, STORE, COPY, MOVE, EXPUNGE et leurs variantes UID
+(UIDPLUS, MOVE, CONDSTORE, BINARY, ESEARCH), COMPRESS DEFLATE.
+
+Utilisation:
+    store = MailStore()
+    store.add_message("INBOX", raw_bytes)
+    with IMAPStubServer(store, latency={"FETCH": 0.05}) as server:
+        host, port = server.address
+
+    python -m benchmarks.imap_stub_server --maildir ~/Maildir --port 1143
+"""
+
+import argparse
+import email
+import email.utils
+import mailbox
+import re
+import select
+import socketserver
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+from pathlib import Path
+
+
+DEFAULT_CAPABILITIES = ("IMAP4rev1", "LITERAL+", "UIDPLUS", "MOVE", "IDLE",
+                        "CONDSTORE", "ENABLE", "NAMESPACE", "BINARY", "ESEARCH",
+                        "COMPRESS=DEFLATE")
+
+# Content-Transfer-Encoding que BINARY sait décoder (sinon [UNKNOWN-CTE])
+KNOWN_ENCODINGS = ("", "7bit", "8bit", "binary", "base64", "quoted-printable")
+
+SYSTEM_FLAGS = ("\\Answered", "\\Flagged", "\\Deleted", "\\Seen", "\\Draft")
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class IMAPError(Exception):
+    """Erreur renvoyée au client sous forme de réponse NO ou BAD"""
+
+    def __init__(self, message, status="NO"):
+        super().__init__(message)
+        self.status = status
+
+
+# === STOCKAGE ===
+
+class StoredMessage:
+    """Message stocké: UID, flags, contenu brut et date interne"""
+
+    __slots__ = ("uid", "flags", "raw", "internaldate", "modseq", "_headers")
+
+    def __init__(self, uid, raw, flags=(), internaldate=None, modseq=1):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.internaldate = internaldate or datetime.now(timezone.utc)
+        self.modseq = modseq
+        self._headers = None
+
+    @property
+    def headers(self):
+        """En-têtes parsés à la demande (pour SEARCH et ENVELOPE)"""
+        if self._headers is None:
+            self._headers = BytesHeaderParser().parsebytes(self.raw)
+        return self._headers
+
+    @property
+    def header_block(self):
+        """Bloc d'en-têtes brut, ligne vide finale comprise"""
+        index = self.raw.find(b"\r\n\r\n")
+        if index >= 0:
+            return self.raw[:index + 4]
+        index = self.raw.find(b"\n\n")
+        return self.raw[:index + 2] if index >= 0 else self.raw
+
+    @property
+    def text_block(self):
+        """Corps brut (tout ce qui suit les en-têtes)"""
+        return self.raw[len(self.header_block):]
+
+
+class Mailbox:
+    """Dossier IMAP en mémoire"""
+
+    def __init__(self, name, uidvalidity):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages = []
+        self.subscribed = True
+
+    def append(self, raw, flags=(), internaldate=None):
+        """Ajouter un message et retourner son UID"""
+        self.highestmodseq += 1
+        message = StoredMessage(self.uidnext, raw, flags, internaldate, self.highestmodseq)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message
+
+    def bump_modseq(self, message):
+        """Nouveau MODSEQ après un changement de flags"""
+        self.highestmodseq += 1
+        message.modseq = self.highestmodseq
+
+
+class MailStore:
+    """Ensemble des dossiers d'un compte, partagé par toutes les sessions"""
+
+    def __init__(self, delimiter=".", inbox_prefix=True):
+        self.delimiter = delimiter
+        self.inbox_prefix = inbox_prefix
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.mailboxes = {}
+        self._next_uidvalidity = int(time.time())
+        self.create("INBOX")
+
+    def create(self, name):
+        """Créer un dossier (sans erreur s'il existe)"""
+        with self.lock:
+            key = self.normalize(name)
+            if key not in self.mailboxes:
+                self._next_uidvalidity += 1
+                self.mailboxes[key] = Mailbox(key, self._next_uidvalidity)
+            return self.mailboxes[key]
+
+    def get(self, name):
+        """Dossier existant ou IMAPError"""
+        mailbox_obj = self.mailboxes.get(self.normalize(name))
+        if mailbox_obj is None:
+            raise IMAPError(f"[TRYCREATE] Mailbox does not exist: {name}")
+        return mailbox_obj
+
+    def normalize(self, name):
+        """INBOX est insensible à la casse"""
+        if name.upper() == "INBOX":
+            return "INBOX"
+        if name.upper().startswith("INBOX" + self.delimiter):
+            return "INBOX" + name[5:]
+        return name
+
+    def folder_name(self, name):
+        """Nom complet d'un sous-dossier selon la convention du serveur"""
+        if self.inbox_prefix and name != "INBOX":
+            return f"INBOX{self.delimiter}{name}"
+        return name
+
+    def add_message(self, folder, raw, flags=(), internaldate=None):
+        """Ajouter un message brut (bytes) dans un dossier, créé si besoin"""
+        with self.changed:
+            message = self.create(folder).append(raw, flags, internaldate)
+            self.changed.notify_all()
+            return message.uid
+
+    def add_messages(self, folder, messages):
+        """Ajouter une série de messages bruts (corpus généré)"""
+        count = 0
+        for raw in messages:
+            self.add_message(folder, raw)
+            count += 1
+        return count
+
+    def load_maildir(self, path):
+        """Charger un Maildir (et ses sous-dossiers Maildir++ .Dossier)"""
+        root = mailbox.Maildir(path, factory=None, create=False)
+        count = self._load_maildir_folder(root, "INBOX")
+        for sub_name in root.list_folders():
+            folder = self.folder_name(sub_name.replace(".", self.delimiter))
+            count += self._load_maildir_folder(root.get_folder(sub_name), folder)
+        return count
+
+    def _load_maildir_folder(self, maildir, folder):
+        """Copier les messages d'un dossier Maildir avec leurs flags"""
+        flag_map = {"S": "\\Seen", "R": "\\Answered", "F": "\\Flagged",
+                    "T": "\\Deleted", "D": "\\Draft"}
+        self.create(folder)
+        count = 0
+        for key in maildir.iterkeys():
+            message = maildir.get_message(key)
+            flags = [flag_map[f] for f in message.get_flags() if f in flag_map]
+            internaldate = datetime.fromtimestamp(message.get_date(), timezone.utc)
+            with maildir.get_file(key) as f:
+                raw = f.read()
+            self.add_message(folder, raw, flags, internaldate)
+            count += 1
+        return count
+
+
+# === ANALYSE DES COMMANDES ===
+
+_ATOM_END = b" ()\r\n"
+_LITERAL_RE = re.compile(rb"\{(\d+)(\+?)\}\r\n")
+
+
+def tokenize(data):
+    """Découper une commande IMAP en atomes (str), chaînes (str),
+    littéraux (bytes) et listes parenthésées (list)"""
+    stack = [[]]
+    pos = 0
+    length = len(data)
+
+    while pos < length:
+        char = data[pos:pos + 1]
+        if char in (b" ", b"\r", b"\n"):
+            pos += 1
+        elif char == b"(":
+            stack.append([])
+            pos += 1
+        elif char == b")":
+            if len(stack) == 1:
+                raise IMAPError("Unbalanced parenthesis", "BAD")
+            items = stack.pop()
+            stack[-1].append(items)
+            pos += 1
+        elif char == b'"':
+            pos += 1
+            chars = bytearray()
+            while pos < length and data[pos:pos + 1] != b'"':
+                if data[pos:pos + 1] == b"\\":
+                    pos += 1
+                chars += data[pos:pos + 1]
+                pos += 1
+            pos += 1
+            stack[-1].append(chars.decode("utf-8", errors="replace"))
+        elif char == b"{":
+            match = _LITERAL_RE.match(data, pos)
+            if not match:
+                raise IMAPError("Bad literal", "BAD")
+            size = int(match.group(1))
+            stack[-1].append(bytes(data[match.end():match.end() + size]))
+            pos = match.end() + size
+        else:
+            start = pos
+            depth = 0
+            while pos < length:
+                char = data[pos:pos + 1]
+                if char == b"[":
+                    depth += 1
+                elif char == b"]":
+                    depth -= 1
+                elif depth == 0 and char in _ATOM_END:
+                    break
+                pos += 1
+            stack[-1].append(data[start:pos].decode("utf-8", errors="replace"))
+
+    if len(stack) != 1:
+        raise IMAPError("Unbalanced parenthesis", "BAD")
+    return stack[0]
+
+
+def parse_sequence_set(text, maximum):
+    """Ensemble '1:3,7,9:*' -> set d'entiers (maximum remplace '*')"""
+    result = set()
+    for part in str(text).split(","):
+        if ":" in part:
+            start, end = part.split(":", 1)
+            start = maximum if start == "*" else int(start)
+            end = maximum if end == "*" else int(end)
+            if start > end:
+                start, end = end, start
+            result.update(range(start, end + 1))
+        else:
+            result.add(maximum if part == "*" else int(part))
+    return result
+
+
+def format_sequence_set(values):
+    """Entiers croissants -> ensemble compact '1:3,7'"""
+    ranges = []
+    for value in values:
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ",".join(str(first) if first == last else f"{first}:{last}" for first, last in ranges)
+
+
+def parse_imap_date(text):
+    """Date IMAP '1-Feb-2024' -> date"""
+    return datetime.strptime(str(text), "%d-%b-%Y").date()
+
+
+def format_internaldate(value):
+    """Date interne au format IMAP '01-Feb-2024 10:00:00 +0000'"""
+    value = value.astimezone(timezone.utc)
+    return f"{value.day:02d}-{MONTHS[value.month - 1]}-{value.year} {value:%H:%M:%S} +0000"
+
+
+def quote(value):
+    """Chaîne IMAP: NIL, quoted string, ou littéral si nécessaire"""
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode("utf-8", errors="replace")
+    if b"\r" in value or b"\n" in value or any(b > 127 for b in value):
+        return b"{%d}\r\n%s" % (len(value), value)
+    return b'"' + value.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"'
+
+
+def envelope(message):
+    """Structure ENVELOPE (RFC 3501) d'un message"""
+    headers = message.headers
+
+    def raw_header(name):
+        value = headers.get(name)
+        return None if value is None else str(value)
+
+    def addresses(name):
+        values = headers.get_all(name)
+        if not values:
+            return b"NIL"
+        items = []
+        for display, addr in email.utils.getaddresses([str(v) for v in values]):
+            if not addr and not display:
+                continue
+            local, _, host = addr.partition("@")
+            items.append(b"(" + b" ".join([quote(display or None), b"NIL",
+                                            quote(local or None), quote(host or None)]) + b")")
+        return b"(" + b"".join(items) + b")" if items else b"NIL"
+
+    sender = addresses("From")
+    return b"(" + b" ".join([
+        quote(raw_header("Date")),
+        quote(raw_header("Subject")),
+        sender,
+        addresses("Sender") if headers.get("Sender") else sender,
+        addresses("Reply-To") if headers.get("Reply-To") else sender,
+        addresses("To"),
+        addresses("Cc"),
+        addresses("Bcc"),
+        quote(raw_header("In-Reply-To")),
+        quote(raw_header("Message-ID")),
+    ]) + b")"
+
+
+def body_params(part):
+    """Paramètres Content-Type d'une partie: ("CHARSET" "utf-8" ...) ou NIL"""
+    params = (part.get_params() or [])[1:]
+    if not params:
+        return b"NIL"
+    return b"(" + b" ".join(quote(name.upper()) + b" " +
+                            quote(email.utils.collapse_rfc2231_value(value))
+                            for name, value in params) + b")"
+
+
+def body_structure(part):
+    """Structure BODYSTRUCTURE (RFC 3501) d'une partie email.message, extensions comprises"""
+    if part.is_multipart():
+        return (b"(" + b"".join(body_structure(child) for child in part.get_payload()) + b" " +
+                quote(part.get_content_subtype().upper()) + b" " + body_params(part) +
+                b" NIL NIL NIL)")
+
+    raw = part.as_bytes()
+    separator = raw.find(b"\n\n")
+    body = raw[separator + 2:] if separator >= 0 else b""
+    fields = [quote(part.get_content_maintype().upper()), quote(part.get_content_subtype().upper()),
+              body_params(part), quote(part.get("Content-ID")), quote(part.get("Content-Description")),
+              quote(str(part.get("Content-Transfer-Encoding", "7BIT")).upper()),
+              str(len(body)).encode()]
+    if part.get_content_maintype() == "text":
+        fields.append(str(body.count(b"\n")).encode())
+    elif part.get_content_type() == "message/rfc822":
+        inner = part.get_payload(0)
+        fields += [envelope(StoredMessage(0, inner.as_bytes())), body_structure(inner),
+                   str(body.count(b"\n")).encode()]
+
+    disposition = b"NIL"
+    if part.get_content_disposition():
+        filename = part.get_filename()
+        disposition = (b"(" + quote(part.get_content_disposition().upper()) + b" " +
+                       (b'("FILENAME" ' + quote(filename) + b")" if filename else b"NIL") + b")")
+    fields += [b"NIL", disposition, b"NIL", b"NIL"]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def mime_message(message, path):
+    """Partie MIME désignée par '1.2' (email.message)"""
+    part = email.message_from_bytes(message.raw)
+    if not path:
+        return part
+    for index in path.split("."):
+        if part.get_content_type() == "message/rfc822":
+            part = part.get_payload(0)
+        if not part.is_multipart():
+            if index == "1":
+                continue
+            raise IMAPError(f"No such part: {path}")
+        payload = part.get_payload()
+        position = int(index) - 1
+        if position < 0 or position >= len(payload):
+            raise IMAPError(f"No such part: {path}")
+        part = payload[position]
+    return part
+
+
+def mime_part(message, path):
+    """Partie MIME désignée par '1.2' -> (en-têtes bruts, corps brut)"""
+    raw = mime_message(message, path).as_bytes()
+    separator = raw.find(b"\n\n")
+    if separator < 0:
+        return raw, b""
+    return raw[:separator + 2], raw[separator + 2:]
+
+
+# === SESSION ===
+
+class DeflateReader:
+    """Flux d'entrée décompressé (COMPRESS DEFLATE) autour de rfile"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.decompressor = zlib.decompressobj(-15)
+        self.buffer = bytearray()
+
+    def fill(self):
+        """Décompresser le prochain bloc reçu, False en fin de connexion"""
+        chunk = self.raw.read1(65536)
+        if not chunk:
+            return False
+        self.buffer += self.decompressor.decompress(chunk)
+        return True
+
+    def readline(self):
+        end = self.buffer.find(b"\n")
+        while end < 0:
+            if not self.fill():
+                end = len(self.buffer) - 1
+                break
+            end = self.buffer.find(b"\n")
+        line = bytes(self.buffer[:end + 1])
+        del self.buffer[:end + 1]
+        return line
+
+    def read(self, size):
+        while len(self.buffer) < size and self.fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    @property
+    def closed(self):
+        return self.raw.closed
+
+    def close(self):
+        self.raw.close()
+
+
+class DeflateWriter:
+    """Flux de sortie compressé (COMPRESS DEFLATE) autour de wfile, vidé à chaque flush"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.pending = False
+
+    def write(self, data):
+        self.raw.write(self.compressor.compress(data))
+        self.pending = True
+
+    def flush(self):
+        if self.pending:
+            self.raw.write(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.pending = False
+        self.raw.flush()
+
+    @property
+    def closed(self):
+        return self.raw.closed
+
+    def close(self):
+        self.raw.close()
+
+
+class IMAPSession(socketserver.StreamRequestHandler):
+    """Une connexion client: lecture des commandes et réponses"""
+
+    # Réponses regroupées et envoyées à chaque commande, sans délai de Nagle
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.stub = self.server.stub
+        self.store = self.stub.store
+        self.selected = None
+        self.readonly = False
+        self.authenticated = False
+        self.condstore = False
+        self.running = True
+
+    # --- Entrées/sorties ---
+
+    def send(self, data):
+        """Écrire une ligne de réponse (sans vider le tampon)"""
+        self.wfile.write(data if data.endswith(b"\r\n") else data + b"\r\n")
+
+    def untagged(self, text):
+        """Réponse non étiquetée '* ...'"""
+        if isinstance(text, str):
+            text = text.encode("utf-8")
+        self.send(b"* " + text)
+
+    def read_command(self):
+        """Lire une commande complète, littéraux compris"""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        data = bytearray(line)
+        while True:
+            match = re.search(rb"\{(\d+)(\+?)\}\r\n$", data)
+            if not match:
+                return bytes(data)
+            if not match.group(2):
+                self.send(b"+ Ready for literal data")
+                self.wfile.flush()
+            data += self.rfile.read(int(match.group(1)))
+            data += self.rfile.readline()
+
+    def handle(self):
+        """Boucle principale de la session"""
+        capabilities = " ".join(self.stub.capabilities)
+        self.send(f"* OK [CAPABILITY {capabilities}] Email Manager IMAP stub ready".encode())
+        self.wfile.flush()
+
+        while self.running:
+            try:
+                data = self.read_command()
+            except (ConnectionError, OSError):
+                break
+            if data is None:
+                break
+            self.stub.commands_received += 1
+            self.dispatch(data)
+            try:
+                self.wfile.flush()
+            except (ConnectionError, OSError):
+                break
+
+    def dispatch(self, data):
+        """Exécuter une commande et envoyer la réponse étiquetée"""
+        try:
+            tokens = tokenize(data)
+        except IMAPError as e:
+            self.send(b"* BAD " + str(e).encode())
+            return
+        if len(tokens) < 2:
+            self.send(b"* BAD Missing command")
+            return
+
+        tag, name, args = tokens[0], str(tokens[1]).upper(), tokens[2:]
+        uid_mode = False
+        if name == "UID" and args:
+            uid_mode = True
+            name, args = str(args[0]).upper(), args[1:]
+
+        label = f"UID {name}" if uid_mode else name
+        self.stub.apply_latency(label, name)
+
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            self.send(f"{tag} BAD Unknown command {name}".encode())
+            return
+
+        if name not in ("CAPABILITY", "NOOP", "LOGIN", "LOGOUT") and not self.authenticated:
+            self.send(f"{tag} NO Not authenticated".encode())
+            return
+
+        try:
+            if name in ("SEARCH", "FETCH", "STORE", "COPY", "MOVE", "EXPUNGE"):
+                message = handler(tag, args, uid_mode)
+            else:
+                message = handler(tag, args)
+            if message is not None:
+                self.send(f"{tag} OK {message}".encode())
+        except IMAPError as e:
+            self.send(f"{tag} {e.status} {e}".encode())
+        except (ValueError, IndexError) as e:
+            self.send(f"{tag} BAD {e}".encode())
+
+    # --- Outils ---
+
+    def require_selected(self):
+        """Dossier sélectionné ou erreur"""
+        if self.selected is None:
+            raise IMAPError("No mailbox selected", "BAD")
+        return self.selected
+
+    def resolve(self, spec, uid_mode):
+        """Ensemble de séquences ou d'UID -> liste [(numéro, message)]"""
+        messages = self.require_selected().messages
+        if not messages:
+            return []
+        if uid_mode:
+            wanted = parse_sequence_set(spec, messages[-1].uid)
+            return [(i + 1, m) for i, m in enumerate(messages) if m.uid in wanted]
+        wanted = parse_sequence_set(spec, len(messages))
+        return [(i, messages[i - 1]) for i in sorted(wanted) if 1 <= i <= len(messages)]
+
+    def flags_text(self, message):
+        """Flags d'un message au format '(\\Seen \\Flagged)'"""
+        return "(" + " ".join(sorted(message.flags)) + ")"
+
+    # --- Commandes sans état ---
+
+    def cmd_capability(self, tag, args):
+        self.untagged("CAPABILITY " + " ".join(self.stub.capabilities))
+        return "CAPABILITY completed"
+
+    def cmd_noop(self, tag, args):
+        if self.selected is not None:
+            self.untagged(f"{len(self.selected.messages)} EXISTS")
+        return "NOOP completed"
+
+    def cmd_login(self, tag, args):
+        user, password = str(args[0]), str(args[1])
+        if self.stub.users is not None and self.stub.users.get(user) != password:
+            raise IMAPError("[AUTHENTICATIONFAILED] Authentication failed")
+        self.authenticated = True
+        return "[CAPABILITY " + " ".join(self.stub.capabilities) + "] LOGIN completed"
+
+    def cmd_logout(self, tag, args):
+        self.untagged("BYE Logging out")
+        self.running = False
+        return "LOGOUT completed"
+
+    def cmd_enable(self, tag, args):
+        enabled = [str(a).upper() for a in args if str(a).upper() in self.stub.capabilities]
+        if "CONDSTORE" in enabled:
+            self.condstore = True
+        self.untagged("ENABLED " + " ".join(enabled))
+        return "ENABLE completed"
+
+    def cmd_compress(self, tag, args):
+        if "COMPRESS=DEFLATE" not in self.stub.capabilities:
+            raise IMAPError("COMPRESS not supported", "BAD")
+        if str(args[0]).upper() != "DEFLATE":
+            raise IMAPError(f"Unknown compression mechanism {args[0]}", "BAD")
+        if isinstance(self.wfile, DeflateWriter):
+            raise IMAPError("[COMPRESSIONACTIVE] DEFLATE active already")
+        # Réponse en clair, la suite du flux est compressée dans les deux sens
+        self.send(f"{tag} OK DEFLATE active".encode())
+        self.wfile.flush()
+        self.rfile = DeflateReader(self.rfile)
+        self.wfile = DeflateWriter(self.wfile)
+        return None
+
+    def cmd_namespace(self, tag, args):
+        prefix = "INBOX" + self.store.delimiter if self.store.inbox_prefix else ""
+        self.send(b"* NAMESPACE ((" + quote(prefix) + b" " + quote(self.store.delimiter) +
+                  b")) NIL NIL")
+        return "NAMESPACE completed"
+
+    # --- Dossiers ---
+
+    def _list(self, args, command):
+        reference, pattern = str(args[0]), str(args[1])
+        if not pattern and command == "LIST":
+            # LIST "" "": séparateur de hiérarchie seulement (RFC 3501 6.3.8)
+            self.send(b"* LIST (\\Noselect) " + quote(self.store.delimiter) + b' ""')
+            return "LIST completed"
+        pattern = reference + pattern
+        regex = re.escape(pattern).replace(r"\*", ".*").replace("%", f"[^{re.escape(self.store.delimiter)}]*")
+        with self.store.lock:
+            names = sorted(self.store.mailboxes)
+        for name in names:
+            if command == "LSUB" and not self.store.mailboxes[name].subscribed:
+                continue
+            if re.fullmatch(regex, name, re.IGNORECASE if name == "INBOX" else 0):
+                prefix = name + self.store.delimiter
+                has_children = any(other.startswith(prefix) for other in names)
+                attribute = "\\HasChildren" if has_children else "\\HasNoChildren"
+                self.send(f"* {command} ({attribute}) ".encode() + quote(self.store.delimiter) +
+                          b" " + quote(name))
+        return f"{command} completed"
+
+    def cmd_list(self, tag, args):
+        return self._list(args, "LIST")
+
+    def cmd_lsub(self, tag, args):
+        return self._list(args, "LSUB")
+
+    def cmd_create(self, tag, args):
+        name = str(args[0])
+        if self.store.normalize(name) in self.store.mailboxes:
+            raise IMAPError("[ALREADYEXISTS] Mailbox already exists")
+        self.store.create(name)
+        return "CREATE completed"
+
+    def cmd_subscribe(self, tag, args):
+        self.store.get(str(args[0])).subscribed = True
+        return "SUBSCRIBE completed"
+
+    def cmd_status(self, tag, args):
+        mailbox_obj = self.store.get(str(args[0]))
+        values = {
+            "MESSAGES": len(mailbox_obj.messages),
+            "RECENT": 0,
+            "UIDNEXT": mailbox_obj.uidnext,
+            "UIDVALIDITY": mailbox_obj.uidvalidity,
+            "UNSEEN": sum(1 for m in mailbox_obj.messages if "\\Seen" not in m.flags),
+            "HIGHESTMODSEQ": mailbox_obj.highestmodseq,
+        }
+        items = " ".join(f"{str(item).upper()} {values[str(item).upper()]}" for item in args[1])
+        self.send(b"* STATUS " + quote(mailbox_obj.name) + f" ({items})".encode())
+        return "STATUS completed"
+
+    def cmd_append(self, tag, args):
+        mailbox_obj = self.store.get(str(args[0]))
+        flags, internaldate = (), None
+        rest = list(args[1:])
+        if rest and isinstance(rest[0], list):
+            flags = [str(f) for f in rest.pop(0)]
+        if len(rest) > 1 and isinstance(rest[0], str):
+            internaldate = email.utils.parsedate_to_datetime(
+                re.sub(r"^(\d+)-(\w+)-(\d+)", r"\1 \2 \3", rest.pop(0)))
+        raw = rest[0] if isinstance(rest[0], bytes) else str(rest[0]).encode()
+        with self.store.changed:
+            message = mailbox_obj.append(raw, flags, internaldate)
+            self.store.changed.notify_all()
+        return f"[APPENDUID {mailbox_obj.uidvalidity} {message.uid}] APPEND completed"
+
+    # --- Sélection ---
+
+    def _select(self, args, readonly):
+        mailbox_obj = self.store.get(str(args[0]))
+        if len(args) > 1 and isinstance(args[1], list):
+            if any(str(a).upper() == "CONDSTORE" for a in args[1]):
+                self.condstore = True
+        self.selected = mailbox_obj
+        self.readonly = readonly
+
+        self.untagged("FLAGS (" + " ".join(SYSTEM_FLAGS) + ")")
+        self.untagged(f"{len(mailbox_obj.messages)} EXISTS")
+        self.untagged("0 RECENT")
+        self.untagged(f"OK [UIDVALIDITY {mailbox_obj.uidvalidity}] UIDs valid")
+        self.untagged(f"OK [UIDNEXT {mailbox_obj.uidnext}] Predicted next UID")
+        if "CONDSTORE" in self.stub.capabilities:
+            self.untagged(f"OK [HIGHESTMODSEQ {mailbox_obj.highestmodseq}] Highest")
+        mode = "READ-ONLY" if readonly else "READ-WRITE"
+        return f"[{mode}] {'EXAMINE' if readonly else 'SELECT'} completed"
+
+    def cmd_select(self, tag, args):
+        return self._select(args, False)
+
+    def cmd_examine(self, tag, args):
+        return self._select(args, True)
+
+    def cmd_close(self, tag, args):
+        mailbox_obj = self.require_selected()
+        if not self.readonly:
+            with self.store.lock:
+                mailbox_obj.messages = [m for m in mailbox_obj.messages if "\\Deleted" not in m.flags]
+        self.selected = None
+        return "CLOSE completed"
+
+    def cmd_idle(self, tag, args):
+        mailbox_obj = self.selected
+        known = len(mailbox_obj.messages) if mailbox_obj else 0
+        self.send(b"+ idling")
+        self.wfile.flush()
+
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], 0.05)
+            if readable:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b"DONE":
+                    break
+            if mailbox_obj is not None and len(mailbox_obj.messages) != known:
+                known = len(mailbox_obj.messages)
+                self.untagged(f"{known} EXISTS")
+                self.wfile.flush()
+        return "IDLE terminated"
+
+    # --- Recherche ---
+
+    def cmd_search(self, tag, args, uid_mode):
+        mailbox_obj = self.require_selected()
+        args = list(args)
+        returns = None
+        if args and str(args[0]).upper() == "RETURN" and "ESEARCH" in self.stub.capabilities:
+            # ESEARCH (RFC 4731): RETURN () équivaut à RETURN (ALL)
+            returns = [str(option).upper() for option in args[1]] or ["ALL"]
+            args = args[2:]
+        if args and str(args[0]).upper() == "CHARSET":
+            args = args[2:]
+        with self.store.lock:
+            messages = list(enumerate(mailbox_obj.messages, 1))
+            criteria = args or ["ALL"]
+            matches = [(seq, m) for seq, m in messages
+                       if self._match_all(list(criteria), seq, m, mailbox_obj)]
+        if returns is not None:
+            numbers = [m.uid if uid_mode else seq for seq, m in matches]
+            text = f'ESEARCH (TAG "{tag}")' + (" UID" if uid_mode else "")
+            if numbers:
+                if "MIN" in returns:
+                    text += f" MIN {numbers[0]}"
+                if "MAX" in returns:
+                    text += f" MAX {numbers[-1]}"
+                if "ALL" in returns:
+                    text += f" ALL {format_sequence_set(numbers)}"
+            if "COUNT" in returns:
+                text += f" COUNT {len(numbers)}"
+            self.untagged(text)
+            return "SEARCH completed"
+        values = [str(m.uid if uid_mode else seq) for seq, m in matches]
+        text = "SEARCH" + ("" if not values else " " + " ".join(values))
+        if self.condstore and any(str(a).upper() == "MODSEQ" for a in args) and matches:
+            text += f" (MODSEQ {max(m.modseq for _, m in matches)})"
+        self.untagged(text)
+        return "SEARCH completed"
+
+    def _match_all(self, criteria, seq, message, mailbox_obj):
+        while criteria:
+            if not self._match_one(criteria, seq, message, mailbox_obj):
+                return False
+        return True
+
+    def _match_one(self, criteria, seq, message, mailbox_obj):
+        """Évaluer le premier critère de la liste (consommé au passage)"""
+        item = criteria.pop(0)
+        if isinstance(item, list):
+            return self._match_all(list(item), seq, message, mailbox_obj)
+
+        key = str(item).upper()
+        flag_keys = {"SEEN": "\\Seen", "FLAGGED": "\\Flagged", "DELETED": "\\Deleted",
+                     "ANSWERED": "\\Answered", "DRAFT": "\\Draft"}
+        if key == "ALL":
+            return True
+        if key in flag_keys:
+            return flag_keys[key] in message.flags
+        if key.startswith("UN") and key[2:] in flag_keys:
+            return flag_keys[key[2:]] not in message.flags
+        if key in ("NEW", "RECENT"):
+            return False
+        if key == "OLD":
+            return True
+        if key == "NOT":
+            return not self._match_one(criteria, seq, message, mailbox_obj)
+        if key == "OR":
+            left = self._match_one(criteria, seq, message, mailbox_obj)
+            right = self._match_one(criteria, seq, message, mailbox_obj)
+            return left or right
+        if key in ("SINCE", "BEFORE", "ON"):
+            day = parse_imap_date(criteria.pop(0))
+            received = message.internaldate.date()
+            return {"SINCE": received >= day, "BEFORE": received < day, "ON": received == day}[key]
+        if key in ("SENTSINCE", "SENTBEFORE", "SENTON"):
+            day = parse_imap_date(criteria.pop(0))
+            try:
+                sent = email.utils.parsedate_to_datetime(message.headers.get("Date", "")).date()
+            except (TypeError, ValueError):
+                return False
+            return {"SENTSINCE": sent >= day, "SENTBEFORE": sent < day, "SENTON": sent == day}[key]
+        if key == "LARGER":
+            return len(message.raw) > int(criteria.pop(0))
+        if key == "SMALLER":
+            return len(message.raw) < int(criteria.pop(0))
+        if key == "UID":
+            return message.uid in parse_sequence_set(criteria.pop(0), mailbox_obj.messages[-1].uid)
+        if key == "MODSEQ":
+            return message.modseq > int(criteria.pop(0))
+        if key == "KEYWORD":
+            return str(criteria.pop(0)) in message.flags
+        if key == "UNKEYWORD":
+            return str(criteria.pop(0)) not in message.flags
+        if key in ("SUBJECT", "FROM", "TO", "CC", "BCC"):
+            value = str(criteria.pop(0)).lower()
+            return value in str(message.headers.get(key.title(), "")).lower()
+        if key == "HEADER":
+            name, value = str(criteria.pop(0)), str(criteria.pop(0)).lower()
+            return value in str(message.headers.get(name, "")).lower()
+        if key in ("BODY", "TEXT"):
+            value = str(criteria.pop(0)).lower().encode()
+            haystack = message.raw if key == "TEXT" else message.text_block
+            return value in haystack.lower()
+        if re.fullmatch(r"[\d:*,]+", key):
+            return seq in parse_sequence_set(key, len(mailbox_obj.messages))
+        raise IMAPError(f"Unsupported search key {key}", "BAD")
+
+    # --- Lecture ---
+
+    def cmd_fetch(self, tag, args, uid_mode):
+        mailbox_obj = self.require_selected()
+        spec, items = args[0], args[1]
+        items = items if isinstance(items, list) else [items]
+        items = self._expand_macros(items)
+        if uid_mode and not any(str(i).upper() == "UID" for i in items):
+            items = ["UID"] + items
+
+        changed_since = None
+        if len(args) > 2 and isinstance(args[2], list):
+            modifiers = [str(m).upper() for m in args[2]]
+            if "CHANGEDSINCE" in modifiers:
+                changed_since = int(modifiers[modifiers.index("CHANGEDSINCE") + 1])
+                self.condstore = True
+                if not any(str(i).upper() == "MODSEQ" for i in items):
+                    items.append("MODSEQ")
+
+        with self.store.lock:
+            targets = self.resolve(spec, uid_mode)
+            for seq, message in targets:
+                if changed_since is not None and message.modseq <= changed_since:
+                    continue
+                self.send(f"* {seq} FETCH (".encode() +
+                          self._fetch_items(message, items, mailbox_obj) + b")")
+        return "FETCH completed"
+
+    def _expand_macros(self, items):
+        macros = {
+            "ALL": ["FLAGS", "INTERNALDATE", "RFC822.SIZE", "ENVELOPE"],
+            "FAST": ["FLAGS", "INTERNALDATE", "RFC822.SIZE"],
+            "FULL": ["FLAGS", "INTERNALDATE", "RFC822.SIZE", "ENVELOPE"],
+        }
+        if len(items) == 1 and str(items[0]).upper() in macros:
+            return list(macros[str(items[0]).upper()])
+        return list(items)
+
+    def _fetch_items(self, message, items, mailbox_obj):
+        """Construire la liste 'NOM valeur' d'une réponse FETCH.
+
+        Les éléments simples (UID, FLAGS...) précèdent les littéraux, comme
+        sur la plupart des serveurs réels.
+        """
+        simple = []
+        literals = []
+        mark_seen = False
+
+        for item in items:
+            name = str(item).upper()
+            if name == "UID":
+                simple.append(f"UID {message.uid}".encode())
+            elif name == "FLAGS":
+                continue
+            elif name == "INTERNALDATE":
+                simple.append(b'INTERNALDATE "' + format_internaldate(message.internaldate).encode() + b'"')
+            elif name == "RFC822.SIZE":
+                simple.append(f"RFC822.SIZE {len(message.raw)}".encode())
+            elif name == "ENVELOPE":
+                simple.append(b"ENVELOPE " + envelope(message))
+            elif name == "BODYSTRUCTURE":
+                simple.append(b"BODYSTRUCTURE " + body_structure(email.message_from_bytes(message.raw)))
+            elif name == "MODSEQ":
+                simple.append(f"MODSEQ ({message.modseq})".encode())
+            elif name in ("RFC822", "RFC822.HEADER", "RFC822.TEXT"):
+                data = {"RFC822": message.raw, "RFC822.HEADER": message.header_block,
+                        "RFC822.TEXT": message.text_block}[name]
+                literals.append((name.encode(), data))
+                mark_seen = mark_seen or name != "RFC822.HEADER"
+            elif name.startswith(("BODY[", "BODY.PEEK[")):
+                response_name, data = self._fetch_section(message, str(item))
+                literals.append((response_name, data))
+                mark_seen = mark_seen or not name.startswith("BODY.PEEK")
+            elif name.startswith(("BINARY[", "BINARY.PEEK[")):
+                response_name, data = self._fetch_binary(message, str(item))
+                literals.append((response_name, data))
+                mark_seen = mark_seen or not name.startswith("BINARY.PEEK")
+            else:
+                raise IMAPError(f"Unsupported fetch item {name}", "BAD")
+
+        if mark_seen and not self.readonly and "\\Seen" not in message.flags:
+            message.flags.add("\\Seen")
+            mailbox_obj.bump_modseq(message)
+
+        if any(str(item).upper() == "FLAGS" for item in items) or mark_seen:
+            simple.insert(1 if simple and simple[0].startswith(b"UID") else 0,
+                          f"FLAGS {self.flags_text(message)}".encode())
+
+        parts = list(simple)
+        for response_name, data in literals:
+            # literal8 (RFC 3516) si le contenu décodé contient des octets nuls
+            marker = b" ~{%d}\r\n" if b"\0" in data else b" {%d}\r\n"
+            parts.append(response_name + marker % len(data) + data)
+        return b" ".join(parts)
+
+    def _fetch_section(self, message, item):
+        """BODY[section]<origine.taille> -> (nom de réponse, données)"""
+        match = re.fullmatch(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)(?:\.(\d+))?>)?", item,
+                             re.IGNORECASE)
+        if not match:
+            raise IMAPError(f"Bad section {item}", "BAD")
+        section, origin, size = match.group(1), match.group(2), match.group(3)
+        upper = section.upper()
+
+        if upper == "":
+            data = message.raw
+        elif upper == "HEADER":
+            data = message.header_block
+        elif upper == "TEXT":
+            data = message.text_block
+        elif upper.startswith(("HEADER.FIELDS", "HEADER.FIELDS.NOT")):
+            names = {n.lower() for n in re.findall(r"[^\s()]+", section[section.index("(") + 1:])}
+            exclude = upper.startswith("HEADER.FIELDS.NOT")
+            lines = []
+            for name, value in message.headers.raw_items():
+                if (name.lower() in names) != exclude:
+                    lines.append(f"{name}: {value}\r\n".encode("utf-8", errors="replace"))
+            data = b"".join(lines) + b"\r\n"
+        else:
+            path, _, suffix = section.partition(".MIME") if section.upper().endswith(".MIME") else (section, "", "")
+            headers, body = mime_part(message, path)
+            data = headers if section.upper().endswith(".MIME") else body
+
+        response_name = f"BODY[{section}]".encode()
+        if origin is not None:
+            start = int(origin)
+            data = data[start:start + int(size)] if size is not None else data[start:]
+            response_name += f"<{start}>".encode()
+        return response_name, data
+
+    def _fetch_binary(self, message, item):
+        """BINARY[section]<origine.taille> -> (nom de réponse, contenu décodé)"""
+        match = re.fullmatch(r"BINARY(?:\.PEEK)?\[([\d.]*)\](?:<(\d+)(?:\.(\d+))?>)?", item,
+                             re.IGNORECASE)
+        if not match:
+            raise IMAPError(f"Bad section {item}", "BAD")
+        section, origin, size = match.group(1), match.group(2), match.group(3)
+        part = mime_message(message, section)
+        if part.is_multipart():
+            data = mime_part(message, section)[1]
+        else:
+            encoding = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+            if encoding not in KNOWN_ENCODINGS:
+                raise IMAPError(f"[UNKNOWN-CTE] Cannot decode {encoding}")
+            data = part.get_payload(decode=True) or b""
+
+        response_name = f"BINARY[{section}]".encode()
+        if origin is not None:
+            start = int(origin)
+            data = data[start:start + int(size)] if size is not None else data[start:]
+            response_name += f"<{start}>".encode()
+        return response_name, data
+
+    # --- Modifications ---
+
+    def cmd_store(self, tag, args, uid_mode):
+        mailbox_obj = self.require_selected()
+        if self.readonly:
+            raise IMAPError("Mailbox is read-only")
+        spec = args[0]
+        rest = list(args[1:])
+
+        unchanged_since = None
+        if isinstance(rest[0], list):
+            modifiers = [str(m).upper() for m in rest.pop(0)]
+            if "UNCHANGEDSINCE" in modifiers:
+                unchanged_since = int(modifiers[modifiers.index("UNCHANGEDSINCE") + 1])
+                self.condstore = True
+
+        operation = str(rest[0]).upper()
+        flags = rest[1] if isinstance(rest[1], list) else rest[1:]
+        flags = {str(f) for f in flags}
+        silent = operation.endswith(".SILENT")
+        operation = operation.replace(".SILENT", "")
+
+        modified = []
+        with self.store.changed:
+            for seq, message in self.resolve(spec, uid_mode):
+                if unchanged_since is not None and message.modseq > unchanged_since:
+                    modified.append(str(message.uid if uid_mode else seq))
+                    continue
+                before = set(message.flags)
+                if operation == "+FLAGS":
+                    message.flags |= flags
+                elif operation == "-FLAGS":
+                    message.flags -= flags
+                elif operation == "FLAGS":
+                    message.flags = set(flags)
+                else:
+                    raise IMAPError(f"Bad store operation {operation}", "BAD")
+                if message.flags != before:
+                    mailbox_obj.bump_modseq(message)
+                if not silent or self.condstore:
+                    extra = f" UID {message.uid}" if uid_mode else ""
+                    modseq = f" MODSEQ ({message.modseq})" if self.condstore else ""
+                    flags_part = "" if silent else f" FLAGS {self.flags_text(message)}"
+                    self.untagged(f"{seq} FETCH ({(flags_part + extra + modseq).strip()})")
+            self.store.changed.notify_all()
+
+        if modified:
+            return f"[MODIFIED {','.join(modified)}] Conditional STORE failed"
+        return "STORE completed"
+
+    def _copy(self, args, uid_mode):
+        """Copier les messages désignés et retourner (sources, copies, dossier cible)"""
+        source = self.require_selected()
+        target = self.store.get(str(args[1]))
+        pairs = []
+        with self.store.changed:
+            for seq, message in self.resolve(args[0], uid_mode):
+                flags = message.flags - {"\\Deleted"}
+                copy = target.append(message.raw, flags, message.internaldate)
+                pairs.append((seq, message, copy))
+            self.store.changed.notify_all()
+        return source, target, pairs
+
+    def _copyuid(self, target, pairs):
+        if not pairs:
+            return ""
+        source_uids = ",".join(str(m.uid) for _, m, _ in pairs)
+        target_uids = ",".join(str(c.uid) for _, _, c in pairs)
+        return f"[COPYUID {target.uidvalidity} {source_uids} {target_uids}] "
+
+    def cmd_copy(self, tag, args, uid_mode):
+        _, target, pairs = self._copy(args, uid_mode)
+        return self._copyuid(target, pairs) + "COPY completed"
+
+    def cmd_move(self, tag, args, uid_mode):
+        if "MOVE" not in self.stub.capabilities:
+            raise IMAPError("MOVE not supported", "BAD")
+        source, target, pairs = self._copy(args, uid_mode)
+        if pairs:
+            self.untagged("OK " + self._copyuid(target, pairs) + "Moved")
+        moved = {id(message) for _, message, _ in pairs}
+        self._expunge(source, lambda m: id(m) in moved)
+        return "MOVE completed"
+
+    def cmd_expunge(self, tag, args, uid_mode):
+        mailbox_obj = self.require_selected()
+        if self.readonly:
+            raise IMAPError("Mailbox is read-only")
+        uids = None
+        if uid_mode:
+            if not mailbox_obj.messages:
+                return "EXPUNGE completed"
+            uids = parse_sequence_set(args[0], mailbox_obj.messages[-1].uid)
+        self._expunge(mailbox_obj, lambda m: "\\Deleted" in m.flags and (uids is None or m.uid in uids))
+        return "EXPUNGE completed"
+
+    def _expunge(self, mailbox_obj, predicate):
+        """Supprimer les messages qui satisfont predicate et annoncer leurs numéros"""
+        with self.store.changed:
+            kept = []
+            removed = 0
+            for seq, message in enumerate(mailbox_obj.messages, 1):
+                if predicate(message):
+                    self.untagged(f"{seq - removed} EXPUNGE")
+                    removed += 1
+                else:
+                    kept.append(message)
+            mailbox_obj.messages = kept
+            if removed:
+                mailbox_obj.highestmodseq += 1
+            self.store.changed.notify_all()
+
+
+# === SERVEUR ===
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class IMAPStubServer:
+    """Serveur IMAP local dans un thread, avec latence configurable par commande"""
+
+    def __init__(self, store=None, host="127.0.0.1", port=0, latency=None,
+                 capabilities=DEFAULT_CAPABILITIES, users=None):
+        self.store = store or MailStore()
+        self.host = host
+        self.port = port
+        self.capabilities = tuple(capabilities)
+        self.users = users
+        self.commands_received = 0
+        # Latence en secondes: {"FETCH": 0.05, "UID FETCH": 0.08, "*": 0.01} ou un nombre
+        self.latency = latency if isinstance(latency, dict) else {"*": latency or 0}
+        self.server = None
+        self.thread = None
+
+    @property
+    def address(self):
+        """(hôte, port) réellement utilisés"""
+        return self.server.server_address[:2]
+
+    def apply_latency(self, label, name):
+        """Attendre la latence configurée pour cette commande"""
+        delay = self.latency.get(label, self.latency.get(name, self.latency.get("*", 0)))
+        if delay:
+            time.sleep(delay)
+
+    def start(self):
+        """Démarrer le serveur en arrière-plan"""
+        self.server = _ThreadingServer((self.host, self.port), IMAPSession)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True,
+                                       name="imap-stub")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Arrêter le serveur"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main():
+    """Lancer le serveur local en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Serveur IMAP local pour Email Manager")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1143)
+    parser.add_argument("--maildir", help="Maildir à charger dans INBOX (et sous-dossiers)")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Latence ajoutée à chaque commande, en secondes")
+    args = parser.parse_args()
+
+    store = MailStore()
+    if args.maildir:
+        count = store.load_maildir(Path(args.maildir).expanduser())
+        print(f"📬 {count} messages chargés depuis {args.maildir}")
+
+    server = IMAPStubServer(store, args.host, args.port, latency=args.latency).start()
+    host, port = server.address
+    print(f"🔌 Serveur IMAP local sur {host}:{port} (sans SSL) - Ctrl+C pour arrêter")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
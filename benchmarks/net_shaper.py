@@ -0,0 +1,170 @@
+"""
+Simulation de conditions réseau pour le transport IMAP
+Enveloppe une classe de connexion imaplib (InstrumentedIMAP4 vers le serveur
+local, ReplayIMAP4 pour le rejeu) et ajoute un aller-retour réseau (RTT) et
+sa gigue, un débit limité dans chaque sens, des blocages occasionnels et des
+coupures de connexion. Les réponses à des commandes envoyées à la suite
+arrivent un RTT après leur envoi: le pipelining et le traitement par lots
+sont donc mesurés comme sur un vrai lien distant. Le débit s'applique aux
+octets transmis (bytes_in/bytes_out): un flux COMPRESS DEFLATE occupe le
+lien moins longtemps que les données qu'il transporte.
+
+Utilisation:
+    from benchmarks.net_shaper import NETWORK_PROFILES, shaped
+    ShapedIMAP4 = shaped(InstrumentedIMAP4)
+    connection = ShapedIMAP4(host, port, network=NETWORK_PROFILES["production"])
+"""
+
+import imaplib
+import random
+import time
+from collections import deque
+
+
+class NetworkProfile:
+    """Caractéristiques d'un lien réseau simulé
+
+    rtt et jitter en secondes, bandwidth et upload_bandwidth en octets/s
+    (None: illimité), stall_probability et disconnect_probability par
+    commande envoyée.
+    """
+
+    def __init__(self, rtt=0.0, jitter=0.0, bandwidth=None, upload_bandwidth=None,
+                 stall_probability=0.0, stall_duration=2.0, disconnect_probability=0.0, seed=None):
+        self.rtt = rtt
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.upload_bandwidth = upload_bandwidth
+        self.stall_probability = stall_probability
+        self.stall_duration = stall_duration
+        self.disconnect_probability = disconnect_probability
+        self.seed = seed
+
+    def describe(self):
+        """Résumé lisible du profil"""
+        parts = [f"RTT {self.rtt * 1000:.0f} ms ± {self.jitter * 1000:.0f} ms"]
+        if self.bandwidth:
+            parts.append(f"↓ {self.bandwidth * 8 / 1e6:.1f} Mbit/s")
+        if self.upload_bandwidth:
+            parts.append(f"↑ {self.upload_bandwidth * 8 / 1e6:.1f} Mbit/s")
+        if self.stall_probability:
+            parts.append(f"blocages {self.stall_probability:.1%} × {self.stall_duration:.1f} s")
+        if self.disconnect_probability:
+            parts.append(f"coupures {self.disconnect_probability:.2%}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        """Paramètres sérialisables (fichiers de résultats)"""
+        return dict(vars(self))
+
+
+NETWORK_PROFILES = {
+    "loopback": NetworkProfile(),
+    "lan": NetworkProfile(rtt=0.002, jitter=0.0005, bandwidth=12_500_000),
+    "adsl": NetworkProfile(rtt=0.040, jitter=0.005, bandwidth=1_000_000,
+                           upload_bandwidth=100_000),
+    # Serveur de production: ~150 ms d'aller-retour depuis Nouméa
+    "production": NetworkProfile(rtt=0.150, jitter=0.015, bandwidth=2_500_000,
+                                 upload_bandwidth=500_000, stall_probability=0.001),
+    "mobile": NetworkProfile(rtt=0.250, jitter=0.080, bandwidth=400_000,
+                             upload_bandwidth=100_000, stall_probability=0.005,
+                             stall_duration=3.0, disconnect_probability=0.0005),
+}
+
+
+class ShapingMixin:
+    """Délais réseau simulés autour de read/readline/send d'imaplib"""
+
+    def __init__(self, *args, network=None, **kwargs):
+        self.network = network or NetworkProfile()
+        self.random = random.Random(self.network.seed)
+        # Heure d'arrivée prévue des réponses aux commandes en vol
+        self.in_flight = deque()
+        self.after_literal = False
+        self.link_free_at = {"down": 0.0, "up": 0.0}
+        self.stalls = 0
+        self.disconnects = 0
+        # Établissement TCP + accueil du serveur: un aller-retour
+        self.wait_until(time.perf_counter() + self.one_rtt())
+        super().__init__(*args, **kwargs)
+
+    def one_rtt(self):
+        """Un aller-retour, gigue comprise"""
+        network = self.network
+        if not network.jitter:
+            return network.rtt
+        return max(0.0, self.random.gauss(network.rtt, network.jitter))
+
+    @staticmethod
+    def wait_until(deadline):
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def transfer(self, size, bandwidth, direction="down"):
+        """Occuper le lien (dans un sens) le temps de transférer size octets"""
+        if not bandwidth:
+            return
+        free_at = max(self.link_free_at[direction], time.perf_counter()) + size / bandwidth
+        self.link_free_at[direction] = free_at
+        self.wait_until(free_at)
+
+    def send(self, data):
+        network = self.network
+        if network.disconnect_probability and self.random.random() < network.disconnect_probability:
+            self.disconnects += 1
+            self.shutdown()
+            raise imaplib.IMAP4.abort("connexion coupée (simulation réseau)")
+
+        sent = self.bytes_out
+        super().send(data)
+        self.transfer(self.bytes_out - sent, network.upload_bandwidth, "up")
+        arrival = time.perf_counter() + self.one_rtt()
+        if network.stall_probability and self.random.random() < network.stall_probability:
+            self.stalls += 1
+            arrival += network.stall_duration
+        self.in_flight.append(arrival)
+
+    def await_response(self):
+        # La réponse à la plus ancienne commande en vol arrive un RTT après son envoi
+        if self.in_flight:
+            self.wait_until(self.in_flight[0])
+
+    def readline(self):
+        self.await_response()
+        received = self.bytes_in
+        line = super().readline()
+        self.transfer(self.bytes_in - received, self.network.bandwidth)
+        # Ligne qui suit un littéral {N}: suite de la même réponse
+        continuation = self.after_literal
+        self.after_literal = line.endswith(b"}\r\n")
+        if self.in_flight and not continuation and not line.startswith(b"* "):
+            # Ligne taguée ou demande de suite "+": la commande n'est plus en vol
+            self.in_flight.popleft()
+        return line
+
+    def read(self, size):
+        self.await_response()
+        received = self.bytes_in
+        data = super().read(size)
+        self.transfer(self.bytes_in - received, self.network.bandwidth)
+        return data
+
+
+_shaped_classes = {}
+
+
+def shaped(connection_class):
+    """Sous-classe de connection_class qui accepte network=NetworkProfile(...)"""
+    shaped_class = _shaped_classes.get(connection_class)
+    if shaped_class is None:
+        shaped_class = type(f"Shaped{connection_class.__name__}", (ShapingMixin, connection_class), {})
+        _shaped_classes[connection_class] = shaped_class
+    return shaped_class
+
+
+def network_profile(name=None, **overrides):
+    """Profil prédéfini (ou loopback) dont certains paramètres sont remplacés"""
+    base = NETWORK_PROFILES[name or "loopback"].to_dict()
+    base.update({key: value for key, value in overrides.items() if value is not None})
+    return NetworkProfile(**base)
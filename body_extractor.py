@@ -0,0 +1,200 @@
+"""
+Extraction du début du corps des emails pour Email Manager V3
+Le contenu brut est parcouru sans construire l'arbre MIME: les parties d'un
+multipart sont délimitées par leur boundary et seuls leurs en-têtes sont
+analysés. La première partie texte (hors pièces jointes) est décodée par
+morceaux (base64, quoted-printable, jeu de caractères déclaré) jusqu'au
+nombre de caractères demandé, puis le parcours s'arrête; sans partie
+text/plain, la première partie HTML est convertie en texte au fil de l'eau.
+Un email tronqué (lecture partielle d'un gros email) reste lisible.
+"""
+
+import binascii
+import codecs
+import re
+from email.parser import BytesHeaderParser
+from html.parser import HTMLParser
+
+from header_decoder import header_block
+
+# Octets de contenu encodé lus à chaque étape du décodage
+CHUNK_SIZE = 8192
+# Profondeur maximale des multipart imbriqués (et emails joints)
+MAX_DEPTH = 8
+
+_SPACES_RE = re.compile(r"\s+")
+_BLANK_RE = re.compile(rb"[ \t\r\n]+")
+
+_header_parser = BytesHeaderParser()
+
+
+def split_part(view):
+    """(en-têtes, contenu) d'une partie MIME ou d'un email, en memoryview"""
+    # Partie sans en-têtes: le contenu commence après la ligne vide
+    if view[:1] == b"\n":
+        return view[:0], view[1:]
+    if view[:2] == b"\r\n":
+        return view[:0], view[2:]
+    headers = header_block(view)
+    return headers, view[len(headers):]
+
+
+def encoded_chunks(content, encoding):
+    """Itérer sur le contenu décodé (Content-Transfer-Encoding) par morceaux de lignes entières"""
+    position = 0
+    pending = b""
+    while position < len(content):
+        end = position + CHUNK_SIZE
+        if end < len(content):
+            # Couper en fin de ligne: pas de séquence =XX ni de quadruplet base64 coupé
+            newline = bytes(content[end:end + 1024]).find(b"\n")
+            if newline >= 0:
+                end += newline + 1
+        chunk = bytes(content[position:end])
+        position = end
+        if encoding == "base64":
+            data = pending + _BLANK_RE.sub(b"", chunk)
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            try:
+                yield binascii.a2b_base64(data[:usable])
+            except binascii.Error:
+                return
+        elif encoding == "quoted-printable":
+            yield binascii.a2b_qp(chunk)
+        else:
+            yield chunk
+
+
+class HTMLText(HTMLParser):
+    """Texte visible d'un document HTML fourni par morceaux (scripts et styles exclus)"""
+
+    HIDDEN = {"head", "script", "style", "template", "title"}
+    BLOCKS = {"address", "article", "blockquote", "br", "div", "footer", "h1", "h2", "h3", "h4",
+              "h5", "h6", "header", "hr", "li", "p", "section", "table", "td", "th", "tr", "ul"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.length = 0
+        self.hidden = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.HIDDEN:
+            self.hidden += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.HIDDEN:
+            self.hidden = max(0, self.hidden - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.hidden:
+            data = _SPACES_RE.sub(" ", data)
+            self.parts.append(data)
+            self.length += len(data)
+
+    def text(self):
+        lines = (line.strip() for line in "".join(self.parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+
+def decode_text(content, encoding, charset, html, limit):
+    """Début (limit caractères) d'une partie texte, HTML converti en texte"""
+    try:
+        decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parser = HTMLText() if html else None
+    pieces = []
+    length = 0
+    for chunk in encoded_chunks(content, encoding):
+        text = decoder.decode(chunk)
+        if parser is not None:
+            parser.feed(text)
+            length = parser.length
+        else:
+            pieces.append(text)
+            length += len(text)
+        if length >= limit:
+            break
+    else:
+        text = decoder.decode(b"", final=True)
+        if parser is not None:
+            parser.feed(text)
+        else:
+            pieces.append(text)
+    if parser is not None:
+        parser.close()
+        return parser.text()[:limit]
+    return "".join(pieces)[:limit]
+
+
+def multipart_parts(content, boundary):
+    """Itérer sur les parties (memoryview) d'un contenu multipart, dans l'ordre"""
+    delimiter = re.compile(rb"^--" + re.escape(boundary) + rb"(--)?[ \t]*\r?$", re.M)
+    match = delimiter.search(content)
+    while match and not match.group(1):
+        start = match.end() + 1
+        match = delimiter.search(content, start)
+        end = match.start() if match else len(content)
+        # Le saut de ligne qui précède le délimiteur lui appartient
+        if match:
+            end -= 2 if content[end - 2:end] == b"\r\n" else 1
+        yield content[start:max(start, end)]
+
+
+def find_text(view, limit, depth=0):
+    """(texte brut, texte HTML) de la première partie lisible d'un email ou d'une partie
+
+    Le texte HTML n'est retourné que si aucune partie text/plain n'a été trouvée.
+    """
+    headers, content = split_part(view)
+    msg = _header_parser.parsebytes(bytes(headers))
+    content_type = msg.get_content_type()
+    # Fichier joint, sauf email transféré en pièce jointe
+    if msg.get_content_disposition() == "attachment" and content_type != "message/rfc822":
+        return None, None
+    encoding = str(msg.get("Content-Transfer-Encoding", "")).strip().lower()
+
+    if content_type == "text/html":
+        return None, (content, encoding, msg.get_content_charset())
+    if msg.get_content_maintype() == "text":
+        return decode_text(content, encoding, msg.get_content_charset(), False, limit), None
+    if depth >= MAX_DEPTH:
+        return None, None
+    if content_type == "message/rfc822":
+        return find_text(content, limit, depth + 1)
+    boundary = msg.get_param("boundary") if msg.get_content_maintype() == "multipart" else None
+    if not boundary:
+        return None, None
+
+    html = None
+    for part in multipart_parts(content, str(boundary).encode("ascii", "surrogateescape")):
+        text, part_html = find_text(part, limit, depth + 1)
+        if text:
+            return text, None
+        html = html or part_html
+    return None, html
+
+
+def extract_body(raw, limit=1000):
+    """Début du texte d'un email brut (bytes ou memoryview), limit caractères au plus
+
+    Première partie text/plain non jointe, sinon première partie HTML
+    convertie en texte; "" si l'email n'a pas de partie texte.
+    """
+    text, html = find_text(memoryview(raw), limit)
+    if text:
+        return text
+    if html is not None:
+        content, encoding, charset = html
+        return decode_text(content, encoding, charset, True, limit)
+    return ""
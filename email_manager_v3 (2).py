@@ -6,27 +6,90 @@ Compatible avec tous les serveurs IMAP (Orange, Free, Hostinger, etc.)
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
-import imaplib
-import email
-from email.header import decode_header
+from email.parser import BytesHeaderParser
 import threading
-from datetime import datetime, timedelta
+import queue
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 import json
 import os
 import re
 import copy
+import hashlib
 import platform
+import time
 from pathlib import Path
 
+from body_extractor import decode_text, extract_body
+from header_decoder import HeaderDecoder, header_block
+from imap_capabilities import ServerProfiles, probe_server
+from imap_transport import InstrumentedIMAP4, InstrumentedIMAP4_SSL, SessionRecorder
+from mail_backends import BackendError, IMAPBackend, open_local_backend
+from mail_index import MailIndex, match_expression, rules_fingerprint
+from message_dedup import ProcessedMessages, normalize_message_id
+from message_records import Action, MessageRecord
+from perf_stats import PerfStats, RunProfiler, TraceRecorder, format_bytes
+from run_journal import RunJournal
+
 class EmailManager:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.root.title("🦅 Email Manager pour Thunderbird - V3")
-        self.root.geometry("1300x850")
-        self.root.configure(bg='#2c3e50')
+    # Couleurs des tags de la console
+    LOG_COLORS = {
+        "error": "#ff6b6b",
+        "success": "#51cf66",
+        "warning": "#ffd43b",
+        "info": "#74c0fc",
+        "cc": "#a9e34b",
+        "rule": "#ff8cc3",
+        "header": "#ffffff",
+        "test": "#ffa94d"
+    }
+    
+    # Niveau de chaque tag (les en-têtes et séparateurs sont toujours affichés)
+    LOG_TAG_LEVELS = {
+        "info": 10, "cc": 10, "rule": 10, "test": 10,
+        "success": 20, "warning": 30, "error": 40
+    }
+    
+    # Champs et conditions pour lesquels l'index plein texte trouve tous les emails
+    # où la condition peut être vraie (colonnes de la table search)
+    SEARCH_FIELDS = {"Sujet": ("subject",), "Corps": ("body",), "Sujet ou Corps": ("subject", "body")}
+    BODY_FIELDS = ("Corps", "Sujet ou Corps")
+    # À incrémenter quand une décision peut changer à règles égales (décodage,
+    # extraction): les emails indexés "sans action" sont alors réanalysés
+    ENGINE_VERSION = 3
+    # Caractères du corps lus pour les règles "Corps" et l'index
+    BODY_CHARS = 1000
+    # Début lu d'un gros email analysé partiellement: en-têtes et premier texte
+    PARTIAL_FETCH_BYTES = 64 * 1024
+    SEARCH_CONDITIONS = ("contient", "commence par", "finit par", "est exactement",
+                         "contient un de (liste)")
+    
+    # Filtres proposés dans la console
+    LOG_FILTERS = {
+        "Tout": 0,
+        "Succès et alertes": 20,
+        "Alertes et erreurs": 30,
+        "Erreurs uniquement": 40
+    }
+    
+    # Nombre max de lignes insérées à chaque rafraîchissement de la console
+    LOG_DRAIN_BATCH = 500
+    
+    def __init__(self, headless=False, data_dir=None):
+        """headless=True: moteur seul, sans fenêtre (tests, benchmarks, serveur local)"""
+        self.headless = headless
+        
+        if headless:
+            # Interpréteur Tcl sans Tk: les variables fonctionnent sans affichage
+            self.root = tk.Tcl()
+        else:
+            self.root = tk.Tk()
+            self.root.title("🦅 Email Manager pour Thunderbird - V3")
+            self.root.geometry("1300x850")
+            self.root.configure(bg='#2c3e50')
         
         # Créer le dossier de données
-        self.setup_data_directory()
+        self.setup_data_directory(data_dir)
         
         # Variables
         self.connection = None
@@ -36,7 +99,39 @@ class EmailManager:
         self.folder_separator = "."
         self.use_inbox_prefix = True
         self.processed_emails = set()
+        self.handled_emails = None
         self.existing_folders = []
+        self.journal = None
+        self.index = None
+        self.rules_version = None
+        self.condition_cache = {}
+        self.header_parser = BytesHeaderParser()
+        self.envelope_only = False
+        self.text_fetch = False
+        self.perf = PerfStats()
+        # En-têtes décodés, gardés d'une analyse à l'autre (correspondants récurrents)
+        self.header_decoder = HeaderDecoder()
+        self.header_counts = (0, 0)
+        self.selected_folders = []
+        self.last_stats = None
+        # Fabrique de connexion de remplacement (rejeu d'une session enregistrée)
+        self.connection_factory = None
+        # Capacités et espace de noms du serveur connecté (None pour une source locale)
+        self.server_profile = None
+        self.server_profiles = None
+        
+        # File des logs: alimentée par n'importe quel thread, vidée par le thread Tk
+        self.log_queue = queue.Queue()
+        self.log_min_level = 0
+        self.console_max_lines = 2000
+        
+        # Variables de configuration
+        self.setup_variables()
+        
+        if headless:
+            # Sans console: seuls les alertes et erreurs sont affichées sur la sortie standard
+            self.log_min_level = self.LOG_FILTERS["Alertes et erreurs"]
+            return
         
         # Interface
         self.setup_ui()
@@ -46,11 +141,16 @@ class EmailManager:
         
         # Fermeture
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        
+        # Vidage périodique de la file des logs
+        self._log_after_id = self.root.after(100, self.drain_log_queue)
     
-    def setup_data_directory(self):
+    def setup_data_directory(self, base_path=None):
         """Créer le dossier de données au premier lancement"""
         # Déterminer le chemin selon l'OS
-        if platform.system() == 'Windows':
+        if base_path is not None:
+            base_path = Path(base_path)
+        elif platform.system() == 'Windows':
             # Sur Windows, utiliser le disque C:\Users\[username]\
             base_path = Path.home() / "support_data_email_sort"
         else:
@@ -59,16 +159,101 @@ class EmailManager:
         
         # Créer le dossier s'il n'existe pas
         base_path.mkdir(parents=True, exist_ok=True)
+        self.data_dir = base_path
         
         # Définir le chemin du fichier de configuration
         self.config_file = base_path / "email_manager_settings.json"
         self.rules_backup_file = base_path / "rules_backup.json"
         self.chains_file = base_path / "rule_chains.json"
+        self.journal_dir = base_path / "journal"
+        self.run_stats_file = base_path / "last_run_stats.json"
+        self.traces_dir = base_path / "traces"
+        self.sessions_dir = base_path / "sessions"
+        self.index_file = base_path / "mail_index.sqlite3"
+        self.local_state_dir = base_path / "local_state"
+        self.processed_dir = base_path / "processed"
+        self.server_profiles_file = base_path / "server_profiles.json"
         
         # Log du chemin
         print(f"📁 Dossier de données: {base_path}")
         print(f"📄 Fichier de configuration: {self.config_file}")
     
+    def setup_variables(self):
+        """Créer les variables de configuration (partagées par l'interface et le moteur)"""
+        # Barre de statut
+        self.status_var = tk.StringVar(self.root, value="✅ Prêt - Email Manager V3")
+        
+        # Connexion
+        self.source_type_var = tk.StringVar(self.root, value="imap")
+        self.source_path_var = tk.StringVar(self.root)
+        self.server_var = tk.StringVar(self.root, value="")
+        self.port_var = tk.StringVar(self.root, value="993")
+        self.use_ssl_var = tk.BooleanVar(self.root, value=True)
+        self.email_var = tk.StringVar(self.root)
+        self.password_var = tk.StringVar(self.root)
+        self.preserve_unread_var = tk.BooleanVar(self.root, value=True)
+        
+        # Gestion CC
+        self.cc_enabled_var = tk.BooleanVar(self.root, value=True)
+        self.cc_folder_var = tk.StringVar(self.root, value="EN_COPIE")
+        self.cc_mark_read_after_var = tk.BooleanVar(self.root, value=False)
+        self.cc_skip_important_var = tk.BooleanVar(self.root, value=True)
+        self.cc_skip_recent_var = tk.BooleanVar(self.root, value=False)
+        
+        # Règles personnalisées
+        self.rule_name_var = tk.StringVar(self.root)
+        self.rule_priority_var = tk.StringVar(self.root, value="50")
+        self.rule_field_var = tk.StringVar(self.root, value="Sujet")
+        self.rule_condition_var = tk.StringVar(self.root, value="contient")
+        self.rule_keyword_var = tk.StringVar(self.root)
+        self.rule_and_field_var = tk.StringVar(self.root, value="")
+        self.rule_and_condition_var = tk.StringVar(self.root, value="contient")
+        self.rule_and_keyword_var = tk.StringVar(self.root)
+        self.rule_case_sensitive_var = tk.BooleanVar(self.root, value=False)
+        self.rule_continue_chain_var = tk.BooleanVar(self.root, value=False)
+        self.rule_action_var = tk.StringVar(self.root, value="Déplacer vers")
+        self.rule_folder_var = tk.StringVar(self.root)
+        self.rule_stop_processing_var = tk.BooleanVar(self.root, value=False)
+        self.rule_mark_after_move_var = tk.BooleanVar(self.root, value=False)
+        
+        # Chaînes de règles
+        self.chain_name_var = tk.StringVar(self.root)
+        self.chain_priority_var = tk.StringVar(self.root, value="50")
+        self.chain_stop_on_match_var = tk.BooleanVar(self.root, value=True)
+        self.chain_enabled_var = tk.BooleanVar(self.root, value=True)
+        
+        # Dossiers
+        self.include_inbox_var = tk.BooleanVar(self.root, value=True)
+        self.scan_subfolders_var = tk.BooleanVar(self.root, value=False)
+        self.exclude_special_var = tk.BooleanVar(self.root, value=True)
+        
+        # Options avancées
+        self.processing_mode_var = tk.StringVar(self.root, value="peek")
+        self.filter_unread_only_var = tk.BooleanVar(self.root, value=False)
+        self.filter_date_var = tk.BooleanVar(self.root, value=False)
+        self.filter_days_var = tk.StringVar(self.root, value="7")
+        self.dry_run_var = tk.BooleanVar(self.root, value=False)
+        self.backup_before_move_var = tk.BooleanVar(self.root, value=False)
+        self.confirm_actions_var = tk.BooleanVar(self.root, value=False)
+        self.journal_enabled_var = tk.BooleanVar(self.root, value=True)
+        self.batch_size_var = tk.StringVar(self.root, value="50")
+        self.parallel_processing_var = tk.BooleanVar(self.root, value=False)
+        self.index_enabled_var = tk.BooleanVar(self.root, value=True)
+        self.skip_indexed_var = tk.BooleanVar(self.root, value=True)
+        self.dedup_enabled_var = tk.BooleanVar(self.root, value=True)
+        self.envelope_fetch_var = tk.BooleanVar(self.root, value=False)
+        self.large_message_mb_var = tk.StringVar(self.root, value="10")
+        self.large_message_policy_var = tk.StringVar(self.root, value="partial")
+        self.index_bodies_var = tk.BooleanVar(self.root, value=True)
+        self.profile_next_run_var = tk.BooleanVar(self.root, value=False)
+        self.trace_export_var = tk.BooleanVar(self.root, value=False)
+        self.record_session_var = tk.BooleanVar(self.root, value=False)
+        
+        # Exécution
+        self.max_emails_var = tk.StringVar(self.root, value="100")
+        self.log_level_var = tk.StringVar(self.root, value="Tout")
+        self.console_max_lines_var = tk.StringVar(self.root, value="2000")
+    
     def setup_ui(self):
         """Créer l'interface utilisateur complète"""
         
@@ -129,7 +314,6 @@ class EmailManager:
         self.setup_execution_tab(notebook)
         
         # Barre de statut
-        self.status_var = tk.StringVar(value="✅ Prêt - Email Manager V3")
         status_bar = tk.Label(self.root, textvariable=self.status_var,
                              bd=1, relief=tk.SUNKEN, anchor='w',
                              bg='#34495e', fg='white',
@@ -150,6 +334,39 @@ class EmailManager:
         conn_content = tk.Frame(conn_frame, bg='white')
         conn_content.pack(fill='both', expand=True, padx=20, pady=20)
         
+        # Source des messages: serveur IMAP ou dossiers locaux
+        source_frame = tk.LabelFrame(conn_content, text=" Source des messages ", 
+                                    font=("Arial", 12, "bold"),
+                                    bg='white', fg='#2c3e50', relief=tk.FLAT)
+        source_frame.pack(fill='x', pady=(0, 20))
+        
+        source_types = tk.Frame(source_frame, bg='white')
+        source_types.pack(anchor='w', padx=10, pady=(10, 5))
+        
+        for value, label in (("imap", "🌐 Serveur IMAP"),
+                             ("maildir", "📂 Dossier Maildir"),
+                             ("mbox", "🗃️ Fichiers mbox (Thunderbird, archives)")):
+            tk.Radiobutton(source_types, text=label, value=value,
+                          variable=self.source_type_var,
+                          font=("Arial", 10), bg='white').pack(side='left', padx=(0, 15))
+        
+        source_path_frame = tk.Frame(source_frame, bg='white')
+        source_path_frame.pack(fill='x', padx=10, pady=(0, 10))
+        
+        tk.Label(source_path_frame, text="Chemin local:", font=("Arial", 10),
+                bg='white').pack(side='left')
+        
+        tk.Entry(source_path_frame, textvariable=self.source_path_var,
+                font=("Arial", 10), width=50).pack(side='left', padx=5)
+        
+        tk.Button(source_path_frame, text="📁 Dossier...",
+                 command=lambda: self.browse_source_path(directory=True),
+                 cursor='hand2').pack(side='left', padx=2)
+        
+        tk.Button(source_path_frame, text="📄 Fichier mbox...",
+                 command=lambda: self.browse_source_path(directory=False),
+                 cursor='hand2').pack(side='left', padx=2)
+        
         # Configuration serveur
         server_frame = tk.LabelFrame(conn_content, text=" Configuration serveur IMAP ", 
                                     font=("Arial", 12, "bold"),
@@ -179,7 +396,6 @@ class EmailManager:
         tk.Label(server_grid, text="Serveur IMAP:", font=("Arial", 11), 
                 bg='white', width=15, anchor='e').grid(row=0, column=0, padx=5, pady=5)
         
-        self.server_var = tk.StringVar(value="")
         self.server_entry = tk.Entry(server_grid, textvariable=self.server_var, 
                                     font=("Arial", 11), width=25)
         self.server_entry.grid(row=0, column=1, padx=5, pady=5)
@@ -187,11 +403,13 @@ class EmailManager:
         tk.Label(server_grid, text="Port:", font=("Arial", 11), 
                 bg='white', width=8, anchor='e').grid(row=0, column=2, padx=5, pady=5)
         
-        self.port_var = tk.StringVar(value="993")
         self.port_entry = tk.Entry(server_grid, textvariable=self.port_var, 
                                   font=("Arial", 11), width=8)
         self.port_entry.grid(row=0, column=3, padx=5, pady=5)
         
+        tk.Checkbutton(server_grid, text="SSL/TLS", variable=self.use_ssl_var,
+                      font=("Arial", 10), bg='white').grid(row=0, column=4, padx=5, pady=5)
+        
         # Identifiants
         creds_frame = tk.LabelFrame(conn_content, text=" Identifiants ", 
                                    font=("Arial", 12, "bold"),
@@ -204,7 +422,6 @@ class EmailManager:
         tk.Label(creds_grid, text="Email:", font=("Arial", 11), 
                 bg='white', width=15, anchor='e').grid(row=0, column=0, padx=5, pady=10)
         
-        self.email_var = tk.StringVar()
         self.email_entry = tk.Entry(creds_grid, textvariable=self.email_var, 
                                    font=("Arial", 11), width=35)
         self.email_entry.grid(row=0, column=1, padx=5, pady=10)
@@ -212,7 +429,6 @@ class EmailManager:
         tk.Label(creds_grid, text="Mot de passe:", font=("Arial", 11), 
                 bg='white', width=15, anchor='e').grid(row=1, column=0, padx=5, pady=10)
         
-        self.password_var = tk.StringVar()
         self.password_entry = tk.Entry(creds_grid, textvariable=self.password_var, 
                                       font=("Arial", 11), width=35, show="•")
         self.password_entry.grid(row=1, column=1, padx=5, pady=10)
@@ -221,7 +437,6 @@ class EmailManager:
         preserve_frame = tk.Frame(conn_content, bg='#fff3cd', relief=tk.RIDGE, bd=2)
         preserve_frame.pack(fill='x', pady=10)
         
-        self.preserve_unread_var = tk.BooleanVar(value=True)
         tk.Checkbutton(preserve_frame, 
                       text=" 🔒 TOUJOURS préserver le statut non-lu des emails lors du tri",
                       variable=self.preserve_unread_var,
@@ -271,7 +486,6 @@ class EmailManager:
         activation_frame = tk.Frame(cc_inner, bg='#e8f8f5', relief=tk.RIDGE, bd=2)
         activation_frame.pack(fill='x', pady=10)
         
-        self.cc_enabled_var = tk.BooleanVar(value=True)
         cc_check = tk.Checkbutton(activation_frame, 
                                  text=" ✅ Activer le tri automatique des emails où je suis en copie (CC)",
                                  variable=self.cc_enabled_var,
@@ -291,7 +505,6 @@ class EmailManager:
         tk.Label(folder_frame, text="📁 Dossier de destination pour les emails en CC:", 
                 font=("Arial", 11), bg='#ecf0f1').pack(side='left', padx=10)
         
-        self.cc_folder_var = tk.StringVar(value="EN_COPIE")
         self.cc_folder_entry = tk.Entry(folder_frame, 
                                        textvariable=self.cc_folder_var,
                                        font=("Arial", 11, "bold"), width=25,
@@ -302,19 +515,16 @@ class EmailManager:
         extra_options = tk.Frame(self.cc_options_frame, bg='#ecf0f1')
         extra_options.pack(fill='x', pady=10, padx=20)
         
-        self.cc_mark_read_after_var = tk.BooleanVar(value=False)
         tk.Checkbutton(extra_options, 
                       text=" 📖 Marquer comme lu APRÈS déplacement (optionnel)",
                       variable=self.cc_mark_read_after_var,
                       font=("Arial", 10), bg='#ecf0f1').pack(anchor='w', pady=5)
         
-        self.cc_skip_important_var = tk.BooleanVar(value=True)
         tk.Checkbutton(extra_options, 
                       text=" ⭐ Ne pas déplacer les emails marqués comme importants",
                       variable=self.cc_skip_important_var,
                       font=("Arial", 10), bg='#ecf0f1').pack(anchor='w', pady=5)
         
-        self.cc_skip_recent_var = tk.BooleanVar(value=False)
         tk.Checkbutton(extra_options, 
                       text=" 🕐 Ne pas déplacer les emails de moins de 24h",
                       variable=self.cc_skip_recent_var,
@@ -361,14 +571,12 @@ class EmailManager:
         
         tk.Label(line0, text="Nom de la règle:", font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=5)
         
-        self.rule_name_var = tk.StringVar()
         name_entry = tk.Entry(line0, textvariable=self.rule_name_var, 
                              width=30, font=("Arial", 11))
         name_entry.pack(side='left', padx=5)
         
         tk.Label(line0, text="Priorité:", font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=10)
         
-        self.rule_priority_var = tk.StringVar(value="50")
         priority_spinbox = tk.Spinbox(line0, from_=1, to=100, 
                                       textvariable=self.rule_priority_var,
                                       width=8, font=("Arial", 11))
@@ -383,14 +591,12 @@ class EmailManager:
         
         tk.Label(line1, text="Si", font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=5)
         
-        self.rule_field_var = tk.StringVar(value="Sujet")
         field_menu = ttk.Combobox(line1, textvariable=self.rule_field_var,
                                   values=["Sujet", "Expéditeur", "Corps", "Destinataire", 
                                          "Sujet ou Corps", "Domaine expéditeur"],
                                   width=18, state='readonly')
         field_menu.pack(side='left', padx=5)
         
-        self.rule_condition_var = tk.StringVar(value="contient")
         condition_menu = ttk.Combobox(line1, textvariable=self.rule_condition_var,
                                       values=["contient", "ne contient pas", "commence par", 
                                               "finit par", "est exactement", "n'est pas", 
@@ -398,7 +604,6 @@ class EmailManager:
                                       width=20, state='readonly')
         condition_menu.pack(side='left', padx=5)
         
-        self.rule_keyword_var = tk.StringVar()
         keyword_entry = tk.Entry(line1, textvariable=self.rule_keyword_var, 
                                 width=30, font=("Arial", 11))
         keyword_entry.pack(side='left', padx=5)
@@ -409,20 +614,17 @@ class EmailManager:
         
         tk.Label(line2, text="ET (optionnel):", font=("Arial", 11), bg='white').pack(side='left', padx=5)
         
-        self.rule_and_field_var = tk.StringVar(value="")
         and_field_menu = ttk.Combobox(line2, textvariable=self.rule_and_field_var,
                                       values=["", "Sujet", "Expéditeur", "Corps", "Destinataire"],
                                       width=15, state='readonly')
         and_field_menu.pack(side='left', padx=5)
         
-        self.rule_and_condition_var = tk.StringVar(value="contient")
         and_condition_menu = ttk.Combobox(line2, textvariable=self.rule_and_condition_var,
                                           values=["contient", "ne contient pas", "commence par", 
                                                   "finit par", "est exactement"],
                                           width=18, state='readonly')
         and_condition_menu.pack(side='left', padx=5)
         
-        self.rule_and_keyword_var = tk.StringVar()
         and_keyword_entry = tk.Entry(line2, textvariable=self.rule_and_keyword_var, 
                                      width=25, font=("Arial", 11))
         and_keyword_entry.pack(side='left', padx=5)
@@ -433,12 +635,10 @@ class EmailManager:
         
         tk.Label(line3, text="Options:", font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=5)
         
-        self.rule_case_sensitive_var = tk.BooleanVar(value=False)
         tk.Checkbutton(line3, text="Sensible à la casse",
                       variable=self.rule_case_sensitive_var,
                       font=("Arial", 10), bg='white').pack(side='left', padx=5)
         
-        self.rule_continue_chain_var = tk.BooleanVar(value=False)
         tk.Checkbutton(line3, text="Peut continuer vers d'autres règles",
                       variable=self.rule_continue_chain_var,
                       font=("Arial", 10), bg='white').pack(side='left', padx=10)
@@ -449,7 +649,6 @@ class EmailManager:
         
         tk.Label(line4, text="Alors", font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=5)
         
-        self.rule_action_var = tk.StringVar(value="Déplacer vers")
         action_menu = ttk.Combobox(line4, textvariable=self.rule_action_var,
                                    values=["Déplacer vers", "Copier vers", "Marquer comme lu", 
                                           "Marquer comme important", "Supprimer", "Étiqueter"],
@@ -457,7 +656,6 @@ class EmailManager:
         action_menu.pack(side='left', padx=5)
         action_menu.bind('<<ComboboxSelected>>', self.on_action_changed)
         
-        self.rule_folder_var = tk.StringVar()
         self.folder_entry = tk.Entry(line4, textvariable=self.rule_folder_var, 
                                      width=25, font=("Arial", 11))
         self.folder_entry.pack(side='left', padx=5)
@@ -472,12 +670,10 @@ class EmailManager:
         line5 = tk.Frame(rule_builder, bg='white')
         line5.pack(fill='x', pady=5)
         
-        self.rule_stop_processing_var = tk.BooleanVar(value=False)
         tk.Checkbutton(line5, text=" 🛑 Arrêter le traitement après cette règle",
                       variable=self.rule_stop_processing_var,
                       font=("Arial", 10), bg='white').pack(side='left', padx=5)
         
-        self.rule_mark_after_move_var = tk.BooleanVar(value=False)
         self.mark_checkbox = tk.Checkbutton(line5, 
                                            text=" 📖 Marquer comme lu après action",
                                            variable=self.rule_mark_after_move_var,
@@ -493,7 +689,13 @@ class EmailManager:
                                 font=("Arial", 11, "bold"),
                                 command=self.add_custom_rule,
                                 cursor='hand2')
-        add_rule_btn.pack()
+        add_rule_btn.pack(side='left', expand=True, anchor='e', padx=5)
+        
+        tk.Button(add_btn_frame, text=" 🔮 Simuler hors ligne ",
+                 bg='#8e44ad', fg='white',
+                 font=("Arial", 11, "bold"),
+                 command=self.simulate_draft_rule,
+                 cursor='hand2').pack(side='left', expand=True, anchor='w', padx=5)
         
         # Liste des règles
         rules_list_frame = tk.LabelFrame(rules_content, 
@@ -587,7 +789,6 @@ class EmailManager:
         tk.Label(name_frame, text="Nom de la chaîne:", 
                 font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=5)
         
-        self.chain_name_var = tk.StringVar()
         chain_name_entry = tk.Entry(name_frame, textvariable=self.chain_name_var,
                                     width=30, font=("Arial", 11))
         chain_name_entry.pack(side='left', padx=5)
@@ -595,7 +796,6 @@ class EmailManager:
         tk.Label(name_frame, text="Priorité globale:", 
                 font=("Arial", 11, "bold"), bg='white').pack(side='left', padx=10)
         
-        self.chain_priority_var = tk.StringVar(value="50")
         chain_priority_spinbox = tk.Spinbox(name_frame, from_=1, to=100,
                                            textvariable=self.chain_priority_var,
                                            width=8, font=("Arial", 11))
@@ -655,13 +855,11 @@ class EmailManager:
         chain_options = tk.Frame(chain_builder, bg='white')
         chain_options.pack(fill='x', pady=10)
         
-        self.chain_stop_on_match_var = tk.BooleanVar(value=True)
         tk.Checkbutton(chain_options, 
                       text=" 🛑 Arrêter la chaîne à la première règle correspondante",
                       variable=self.chain_stop_on_match_var,
                       font=("Arial", 10), bg='white').pack(anchor='w')
         
-        self.chain_enabled_var = tk.BooleanVar(value=True)
         tk.Checkbutton(chain_options, 
                       text=" ✅ Chaîne active",
                       variable=self.chain_enabled_var,
@@ -673,7 +871,13 @@ class EmailManager:
                                     font=("Arial", 11, "bold"),
                                     command=self.create_rule_chain,
                                     cursor='hand2')
-        create_chain_btn.pack(pady=10)
+        create_chain_btn.pack(pady=(10, 5))
+        
+        tk.Button(chain_builder, text=" 🔮 Simuler hors ligne ",
+                 bg='#8e44ad', fg='white',
+                 font=("Arial", 10, "bold"),
+                 command=self.simulate_draft_chain,
+                 cursor='hand2').pack(pady=(0, 10))
         
         # Liste des chaînes
         chains_list_frame = tk.LabelFrame(chains_content, 
@@ -764,21 +968,18 @@ class EmailManager:
         options_frame = tk.Frame(main_folders_frame, bg='white')
         options_frame.pack(fill='x', pady=10)
         
-        self.include_inbox_var = tk.BooleanVar(value=True)
         tk.Checkbutton(options_frame, 
                       text=" ✅ Inclure la boîte de réception (INBOX)",
                       variable=self.include_inbox_var,
                       font=("Arial", 11, "bold"),
                       bg='white', fg='#27ae60').pack(anchor='w', pady=5)
         
-        self.scan_subfolders_var = tk.BooleanVar(value=False)
         tk.Checkbutton(options_frame, 
                       text=" 📂 Analyser aussi les sous-dossiers",
                       variable=self.scan_subfolders_var,
                       font=("Arial", 10),
                       bg='white').pack(anchor='w', pady=5)
         
-        self.exclude_special_var = tk.BooleanVar(value=True)
         tk.Checkbutton(options_frame, 
                       text=" 🚫 Exclure les dossiers spéciaux (Brouillons, Envoyés, Corbeille, Spam)",
                       variable=self.exclude_special_var,
@@ -848,7 +1049,6 @@ class EmailManager:
         tk.Label(mode_frame, text="Mode de traitement:", 
                 font=("Arial", 11), bg='white').pack(side='left', padx=5)
         
-        self.processing_mode_var = tk.StringVar(value="peek")
         tk.Radiobutton(mode_frame, text="PEEK (Ne pas marquer comme lu)",
                       variable=self.processing_mode_var, value="peek",
                       font=("Arial", 10), bg='white').pack(side='left', padx=10)
@@ -864,12 +1064,10 @@ class EmailManager:
         tk.Label(filter_frame, text="Filtrer les emails:", 
                 font=("Arial", 11), bg='white').pack(anchor='w', pady=5)
         
-        self.filter_unread_only_var = tk.BooleanVar(value=False)
         tk.Checkbutton(filter_frame, text=" 📧 Traiter uniquement les emails non lus",
                       variable=self.filter_unread_only_var,
                       font=("Arial", 10), bg='white').pack(anchor='w', padx=20, pady=2)
         
-        self.filter_date_var = tk.BooleanVar(value=False)
         date_check = tk.Checkbutton(filter_frame, text=" 📅 Traiter uniquement les emails des",
                                    variable=self.filter_date_var,
                                    font=("Arial", 10), bg='white',
@@ -879,7 +1077,6 @@ class EmailManager:
         date_frame = tk.Frame(filter_frame, bg='white')
         date_frame.pack(anchor='w', padx=40, pady=2)
         
-        self.filter_days_var = tk.StringVar(value="7")
         self.days_spinbox = tk.Spinbox(date_frame, from_=1, to=365, 
                                        textvariable=self.filter_days_var,
                                        width=5, font=("Arial", 10), state='disabled')
@@ -898,27 +1095,30 @@ class EmailManager:
         safety_inner = tk.Frame(safety_frame, bg='white')
         safety_inner.pack(pady=15, padx=15)
         
-        self.dry_run_var = tk.BooleanVar(value=False)
         tk.Checkbutton(safety_inner, 
                       text=" 🧪 Mode test (simuler sans déplacer les emails)",
                       variable=self.dry_run_var,
                       font=("Arial", 11, "bold"),
                       bg='white', fg='#e74c3c').pack(anchor='w', pady=5)
         
-        self.backup_before_move_var = tk.BooleanVar(value=False)
         tk.Checkbutton(safety_inner, 
                       text=" 💾 Créer une copie de sauvegarde avant déplacement",
                       variable=self.backup_before_move_var,
                       font=("Arial", 10),
                       bg='white').pack(anchor='w', pady=5)
         
-        self.confirm_actions_var = tk.BooleanVar(value=False)
         tk.Checkbutton(safety_inner, 
                       text=" ❓ Demander confirmation pour chaque action",
                       variable=self.confirm_actions_var,
                       font=("Arial", 10),
                       bg='white').pack(anchor='w', pady=5)
         
+        tk.Checkbutton(safety_inner, 
+                      text=" 📒 Enregistrer chaque décision dans le journal (JSONL)",
+                      variable=self.journal_enabled_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
         # Performances
         perf_frame = tk.LabelFrame(adv_content, 
                                   text=" ⚡ Options de performance ", 
@@ -935,7 +1135,6 @@ class EmailManager:
         tk.Label(batch_frame, text="Traiter par lots de:", 
                 font=("Arial", 11), bg='white').pack(side='left', padx=5)
         
-        self.batch_size_var = tk.StringVar(value="50")
         tk.Spinbox(batch_frame, from_=10, to=500, increment=10,
                   textvariable=self.batch_size_var,
                   width=8, font=("Arial", 11)).pack(side='left', padx=5)
@@ -943,12 +1142,79 @@ class EmailManager:
         tk.Label(batch_frame, text="emails", 
                 font=("Arial", 11), bg='white').pack(side='left')
         
-        self.parallel_processing_var = tk.BooleanVar(value=False)
         tk.Checkbutton(perf_inner, 
                       text=" 🚀 Activer le traitement parallèle (expérimental)",
                       variable=self.parallel_processing_var,
                       font=("Arial", 10),
                       bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 🗂️ Indexer les emails analysés (base locale SQLite)",
+                      variable=self.index_enabled_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" ⏭️ Ne pas retélécharger les emails déjà analysés sans action (mêmes règles)",
+                      variable=self.skip_indexed_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" ♻️ Ignorer les emails déjà triés, même copiés dans un autre dossier (Message-ID)",
+                      variable=self.dedup_enabled_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 📨 Ne lire que l'enveloppe (ENVELOPE) si aucune règle ne porte sur le corps",
+                      variable=self.envelope_fetch_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        large_frame = tk.Frame(perf_inner, bg='white')
+        large_frame.pack(fill='x', pady=5)
+        
+        tk.Label(large_frame, text=" 🐘 Emails de plus de", 
+                font=("Arial", 10), bg='white').pack(side='left')
+        
+        tk.Spinbox(large_frame, from_=0, to=100, increment=1,
+                  textvariable=self.large_message_mb_var,
+                  width=5, font=("Arial", 10)).pack(side='left', padx=5)
+        
+        tk.Label(large_frame, text="Mo (0 = aucune limite):", 
+                font=("Arial", 10), bg='white').pack(side='left')
+        
+        tk.Radiobutton(large_frame, text="analyser le début (64 Ko)",
+                      variable=self.large_message_policy_var, value="partial",
+                      font=("Arial", 10), bg='white').pack(side='left', padx=5)
+        tk.Radiobutton(large_frame, text="ignorer",
+                      variable=self.large_message_policy_var, value="skip",
+                      font=("Arial", 10), bg='white').pack(side='left')
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 📝 Conserver le début du corps dans l'index (simulation des règles hors ligne)",
+                      variable=self.index_bodies_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 🔬 Profiler la prochaine analyse (cProfile, ou pyinstrument si installé)",
+                      variable=self.profile_next_run_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 🧵 Exporter une trace Chrome/Perfetto de chaque analyse",
+                      variable=self.trace_export_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
+        
+        tk.Checkbutton(perf_inner, 
+                      text=" 🎞️ Enregistrer la session IMAP de la prochaine analyse (rejeu, identifiants et corps masqués)",
+                      variable=self.record_session_var,
+                      font=("Arial", 10),
+                      bg='white').pack(anchor='w', pady=5)
     
     def setup_execution_tab(self, notebook):
         """Onglet d'exécution"""
@@ -971,7 +1237,6 @@ class EmailManager:
         tk.Label(options_grid, text="Nombre max d'emails à traiter:", 
                 font=("Arial", 11), bg='white').pack(side='left', padx=5)
         
-        self.max_emails_var = tk.StringVar(value="100")
         tk.Spinbox(options_grid, from_=1, to=10000, 
                   textvariable=self.max_emails_var,
                   width=10, font=("Arial", 11)).pack(side='left', padx=5)
@@ -1014,12 +1279,38 @@ class EmailManager:
                                      bg='white', fg='#2c3e50', relief=tk.FLAT)
         console_frame.pack(fill='both', expand=True)
         
+        # Filtre et taille de la console
+        console_options = tk.Frame(console_frame, bg='white')
+        console_options.pack(fill='x', padx=10, pady=(5, 0))
+        
+        tk.Label(console_options, text="Afficher:",
+                font=("Arial", 10), bg='white').pack(side='left', padx=5)
+        
+        log_level_menu = ttk.Combobox(console_options, textvariable=self.log_level_var,
+                                      values=list(self.LOG_FILTERS.keys()),
+                                      width=18, state='readonly')
+        log_level_menu.pack(side='left', padx=5)
+        log_level_menu.bind('<<ComboboxSelected>>', self.on_log_options_changed)
+        
+        tk.Label(console_options, text="Lignes max:",
+                font=("Arial", 10), bg='white').pack(side='left', padx=(20, 5))
+        
+        tk.Spinbox(console_options, from_=100, to=100000, increment=500,
+                  textvariable=self.console_max_lines_var,
+                  command=self.on_log_options_changed,
+                  width=8, font=("Arial", 10)).pack(side='left', padx=5)
+        
         self.console = scrolledtext.ScrolledText(console_frame, 
                                                  height=10,
                                                  bg='#1e1e1e', fg='#00ff00',
                                                  font=("Consolas", 10),
                                                  insertbackground='#00ff00')
         self.console.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Configurer les couleurs une seule fois
+        for tag, color in self.LOG_COLORS.items():
+            self.console.tag_config(tag, foreground=color)
+        self.console.tag_config("header", font=("Consolas", 11, "bold"))
     
     def toggle_cc_options(self):
         """Activer/désactiver les options CC"""
@@ -1058,85 +1349,33 @@ class EmailManager:
             self.rule_folder_var.set(selected)
     
     def load_existing_folders(self):
-        """Charger la liste des dossiers existants depuis le serveur"""
+        """Charger la liste des dossiers existants depuis la source"""
         try:
-            if not self.server_var.get() or not self.email_var.get() or not self.password_var.get():
-                messagebox.showwarning("Attention", "Configurez d'abord la connexion!")
+            if not self.source_ready():
                 return
             
             self.log("📁 Chargement des dossiers...", "info")
             
-            connection = imaplib.IMAP4_SSL(self.server_var.get(), int(self.port_var.get()))
-            connection.login(self.email_var.get(), self.password_var.get())
-            
-            result, folders = connection.list()
-            
-            if result == 'OK':
+            backend = self.open_backend()
+            try:
                 self.existing_folders = []
-                for folder in folders:
-                    if folder:
-                        folder_str = folder.decode('utf-8') if isinstance(folder, bytes) else str(folder)
-                        
-                        # Parser le format IMAP pour extraire le nom du dossier
-                        # Format typique: '(\\HasNoChildren) "." "INBOX.Dossier"'
-                        # ou: '(\\HasChildren) "/" "Folder Name"'
-                        
-                        # Méthode améliorée pour extraire le nom
-                        folder_name = None
-                        
-                        # Essayer d'abord avec des guillemets
-                        if '"' in folder_str:
-                            parts = folder_str.split('"')
-                            if len(parts) >= 2:
-                                # Le nom est généralement le dernier élément entre guillemets
-                                folder_name = parts[-2]
-                        
-                        # Si pas de guillemets ou échec, essayer avec des espaces
-                        if not folder_name or folder_name in ['.', '/', '|']:
-                            parts = folder_str.split()
-                            if len(parts) >= 3:
-                                # Le nom est généralement le dernier élément
-                                folder_name = parts[-1].strip('"')
-                        
-                        # Si toujours pas de nom valide, méthode simple sans regex
-                        if not folder_name or folder_name in ['.', '/', '|']:
-                            # Prendre le dernier élément après un espace
-                            parts = folder_str.rsplit(' ', 1)
-                            if len(parts) > 1:
-                                folder_name = parts[-1].strip('"\'')
-                            else:
-                                # Si pas d'espace, prendre toute la chaîne nettoyée
-                                folder_name = folder_str.strip('"\' ')
-                        
-                        # Nettoyer le nom
-                        if folder_name:
-                            folder_name = folder_name.strip().strip('"')
-                            if folder_name and folder_name not in ['.', '/', '|', '']:
-                                self.existing_folders.append(folder_name)
-                                self.log(f"  • Dossier trouvé: {folder_name}", "info")
-                
-                # Retirer les doublons tout en préservant l'ordre
-                seen = set()
-                unique_folders = []
-                for folder in self.existing_folders:
-                    if folder not in seen:
-                        seen.add(folder)
-                        unique_folders.append(folder)
-                self.existing_folders = unique_folders
-                
-                # Mettre à jour les widgets
-                self.folder_dropdown['values'] = self.existing_folders
-                self.folders_listbox.delete(0, tk.END)
-                for folder in self.existing_folders:
-                    self.folders_listbox.insert(tk.END, folder)
-                
-                # Actualiser la liste des règles disponibles pour les chaînes
-                self.refresh_available_rules()
-                
-                self.log(f"✅ {len(self.existing_folders)} dossiers chargés", "success")
-                messagebox.showinfo("Succès", f"{len(self.existing_folders)} dossiers chargés avec succès!")
+                for folder_name in backend.list_folders():
+                    self.existing_folders.append(folder_name)
+                    self.log(f"  • Dossier trouvé: {folder_name}", "info")
+            finally:
+                backend.close()
+            
+            # Mettre à jour les widgets
+            self.folder_dropdown['values'] = self.existing_folders
+            self.folders_listbox.delete(0, tk.END)
+            for folder in self.existing_folders:
+                self.folders_listbox.insert(tk.END, folder)
+            
+            # Actualiser la liste des règles disponibles pour les chaînes
+            self.refresh_available_rules()
             
-            connection.logout()
+            self.log(f"✅ {len(self.existing_folders)} dossiers chargés", "success")
+            messagebox.showinfo("Succès", f"{len(self.existing_folders)} dossiers chargés avec succès!")
             
         except Exception as e:
             self.log(f"❌ Erreur: {str(e)}", "error")
@@ -1156,6 +1395,12 @@ class EmailManager:
         self.folders_listbox.select_clear(0, tk.END)
         self.update_selected_folders_label()
     
+    def get_selected_folders(self):
+        """Dossiers sélectionnés pour le tri (liste de l'onglet, ou selected_folders sans interface)"""
+        if self.headless:
+            return list(self.selected_folders)
+        return [self.folders_listbox.get(index) for index in self.folders_listbox.curselection()]
+    
     def update_selected_folders_label(self):
         """Mettre à jour le label des dossiers sélectionnés"""
         selected_indices = self.folders_listbox.curselection()
@@ -1167,6 +1412,32 @@ class EmailManager:
     
     def add_custom_rule(self):
         """Ajouter une règle personnalisée améliorée"""
+        rule = self.build_rule_from_form()
+        if rule is None:
+            return
+        name = rule['name']
+        
+        self.rules.append(rule)
+        self.sort_rules_by_priority()
+        self.refresh_rules_tree()
+        self.refresh_available_rules()
+        
+        # Réinitialiser les champs
+        self.rule_name_var.set("")
+        self.rule_keyword_var.set("")
+        self.rule_and_keyword_var.set("")
+        self.rule_folder_var.set("")
+        self.rule_case_sensitive_var.set(False)
+        self.rule_priority_var.set("50")
+        self.rule_stop_processing_var.set(False)
+        self.rule_continue_chain_var.set(False)
+        self.rule_mark_after_move_var.set(False)
+        
+        self.log(f"✅ Règle ajoutée: {name}", "success")
+        self.save_settings()
+    
+    def build_rule_from_form(self):
+        """Règle décrite par le formulaire (None et avertissement si incomplet)"""
         name = self.rule_name_var.get().strip()
         keyword = self.rule_keyword_var.get().strip()
         action = self.rule_action_var.get()
@@ -1204,25 +1475,7 @@ class EmailManager:
             "continue_chain": self.rule_continue_chain_var.get(),
             "mark_after_action": self.rule_mark_after_move_var.get()
         }
-        
-        self.rules.append(rule)
-        self.sort_rules_by_priority()
-        self.refresh_rules_tree()
-        self.refresh_available_rules()
-        
-        # Réinitialiser les champs
-        self.rule_name_var.set("")
-        self.rule_keyword_var.set("")
-        self.rule_and_keyword_var.set("")
-        self.rule_folder_var.set("")
-        self.rule_case_sensitive_var.set(False)
-        self.rule_priority_var.set("50")
-        self.rule_stop_processing_var.set(False)
-        self.rule_continue_chain_var.set(False)
-        self.rule_mark_after_move_var.set(False)
-        
-        self.log(f"✅ Règle ajoutée: {name}", "success")
-        self.save_settings()
+        return rule
     
     def sort_rules_by_priority(self):
         """Trier les règles par priorité (nombre croissant = priorité décroissante)"""
@@ -1419,6 +1672,23 @@ class EmailManager:
     
     def create_rule_chain(self):
         """Créer une chaîne de règles"""
+        chain = self.build_chain_from_form()
+        if chain is None:
+            return
+        
+        self.rule_chains.append(chain)
+        self.refresh_chains_tree()
+        self.save_chains()
+        
+        # Réinitialiser
+        self.chain_name_var.set("")
+        self.chain_priority_var.set("50")
+        self.chain_rules_listbox.delete(0, tk.END)
+        
+        self.log(f"⛓️ Chaîne créée: {chain['name']} avec {len(chain['rules'])} règles", "success")
+    
+    def build_chain_from_form(self):
+        """Chaîne décrite par le formulaire (None et avertissement si incomplète)"""
         name = self.chain_name_var.get().strip()
         if not name:
             messagebox.showwarning("Attention", "Donnez un nom à la chaîne!")
@@ -1452,17 +1722,7 @@ class EmailManager:
             "stop_on_match": self.chain_stop_on_match_var.get(),
             "enabled": self.chain_enabled_var.get()
         }
-        
-        self.rule_chains.append(chain)
-        self.refresh_chains_tree()
-        self.save_chains()
-        
-        # Réinitialiser
-        self.chain_name_var.set("")
-        self.chain_priority_var.set("50")
-        self.chain_rules_listbox.delete(0, tk.END)
-        
-        self.log(f"⛓️ Chaîne créée: {name} avec {len(chain_rules)} règles", "success")
+        return chain
     
     def refresh_chains_tree(self):
         """Actualiser l'affichage des chaînes"""
@@ -1540,50 +1800,269 @@ class EmailManager:
         except Exception as e:
             self.log(f"⚠️ Impossible de charger les chaînes: {str(e)}", "warning")
     
+    def simulate_draft_rule(self):
+        """Simuler la règle du formulaire sur l'index local"""
+        rule = self.build_rule_from_form()
+        if rule is not None:
+            self.start_simulation(f"règle '{rule['name']}'", draft_rules=[rule])
+    
+    def simulate_draft_chain(self):
+        """Simuler la chaîne du formulaire sur l'index local"""
+        chain = self.build_chain_from_form()
+        if chain is not None:
+            chain['enabled'] = True
+            self.start_simulation(f"chaîne '{chain['name']}'", draft_chains=[chain])
+    
+    def start_simulation(self, label, draft_rules=(), draft_chains=()):
+        """Lancer une simulation en arrière-plan et afficher le rapport dans la console"""
+        if not self.index_file.exists():
+            messagebox.showinfo("Simulation", "L'index local est vide: lancez d'abord une analyse "
+                                              "avec l'option d'indexation activée.")
+            return
+        
+        def worker():
+            try:
+                report = self.simulate_rules(draft_rules, draft_chains)
+                self.log_simulation_report(label, report)
+            except Exception as e:
+                self.log(f"❌ Erreur de simulation: {str(e)}", "error")
+        
+        threading.Thread(target=worker, daemon=True, name="simulation").start()
+    
+    def simulate_rules(self, draft_rules=(), draft_chains=(), folders=None):
+        """Évaluer des règles ou chaînes brouillon sur l'index local, sans connexion IMAP
+        
+        Chaque email en cache est classé avec la configuration actuelle puis
+        avec les brouillons ajoutés, par le même moteur qu'analyze_email_v3.
+        Seuls les emails où un brouillon peut s'appliquer changent de décision:
+        l'index plein texte les sélectionne quand les conditions le permettent.
+        """
+        started = time.perf_counter()
+        match = self.draft_search_query(draft_rules, draft_chains)
+        index = MailIndex(self.index_file)
+        if not index.fulltext:
+            match = None
+        try:
+            total = index.count_cached(self.account_name())
+            rows = index.cached_messages(self.account_name(), folders, match)
+        finally:
+            index.close()
+        
+        rules = sorted(self.rules + list(draft_rules), key=lambda x: x.get('priority', 50))
+        chains = self.rule_chains + list(draft_chains)
+        draft_names = {rule.get('name') for rule in draft_rules}
+        draft_names.update(rule.get('name') for chain in draft_chains for rule in chain.get('rules', []))
+        
+        report = {
+            'messages': total,
+            'evaluated': len(rows),
+            'indexed_search': match is not None,
+            'without_body': 0,
+            'changed': 0,
+            'targets': {},
+            'shadows': {},
+            'shadowed_by': {}
+        }
+        stats = {'cc_moved': 0, 'rules_applied': 0, 'chains_applied': 0}
+        # Mesures à part: une analyse peut tourner en même temps (self.perf)
+        perf = PerfStats()
+        
+        def describe(action):
+            if not action:
+                return None
+            return action.chain or action.rule, action.kind, action.folder
+        
+        for folder, uid, subject, from_addr, to_addr, cc_addr, date, flags, body in rows:
+            if body is None:
+                report['without_body'] += 1
+            record = MessageRecord(
+                uid, None, subject or "", from_addr or "", to_addr or "", cc_addr or "",
+                format_datetime(datetime.fromtimestamp(date, timezone.utc)) if date else "",
+                f"FLAGS ({flags or ''})".encode(), body=body)
+            
+            before = describe(self.analyze_email_v3(record, stats, verbose=False, perf=perf))
+            after = describe(self.analyze_email_v3(record, stats, rules=rules, chains=chains,
+                                                   verbose=False, perf=perf))
+            
+            if after != before:
+                report['changed'] += 1
+                target = f"{after[1]} {after[2]}".strip() if after else "Aucune action"
+                report['targets'][target] = report['targets'].get(target, 0) + 1
+                previous = before[0] if before else None
+                if previous:
+                    report['shadows'][previous] = report['shadows'].get(previous, 0) + 1
+            elif draft_rules and before:
+                # La règle brouillon correspond mais une règle existante passe avant
+                for rule in draft_rules:
+                    if self.check_rule_v3(record, rule):
+                        report['shadowed_by'][before[0]] = report['shadowed_by'].get(before[0], 0) + 1
+                        break
+        
+        report['elapsed_s'] = round(time.perf_counter() - started, 3)
+        return report
+    
+    def draft_search_query(self, draft_rules, draft_chains):
+        """Requête plein texte couvrant tous les emails où un brouillon peut s'appliquer
+        
+        None si une condition ne s'y prête pas (autre champ, condition négative
+        ou regex, mot-clé de moins de 3 caractères): la simulation parcourt alors
+        tout le cache.
+        """
+        rules = list(draft_rules) + [rule for chain in draft_chains for rule in chain.get('rules', [])]
+        clauses = []
+        for rule in rules:
+            # La condition ET ne fait que restreindre: la première suffit
+            columns = self.SEARCH_FIELDS.get(rule.get('field'))
+            condition = rule.get('condition')
+            keyword = rule.get('keyword') or ""
+            if columns is None or condition not in self.SEARCH_CONDITIONS:
+                return None
+            if condition == "contient un de (liste)":
+                terms = [k.strip() for k in keyword.split(',')]
+            else:
+                terms = [keyword]
+            # "Sujet ou Corps" joint les deux textes par une espace
+            if any(len(term) < 3 or (len(columns) > 1 and any(c.isspace() for c in term))
+                   for term in terms):
+                return None
+            clauses.append(f"({match_expression(terms, columns)})")
+        return " OR ".join(clauses) or None
+    
+    def log_simulation_report(self, label, report):
+        """Afficher le rapport d'une simulation"""
+        self.log("\n" + "="*60, "separator")
+        self.log(f"🔮 SIMULATION HORS LIGNE - {label}", "header")
+        self.log("="*60, "separator")
+        self.log(f"📦 {report['messages']} emails en cache, {report['evaluated']} évalués en "
+                 f"{report['elapsed_s']:.2f} s (aucune connexion IMAP"
+                 + (", présélection par l'index plein texte)" if report['indexed_search'] else ")"),
+                 "info")
+        if report['without_body']:
+            self.log(f"⚠️ {report['without_body']} emails sans corps en cache: "
+                     f"les conditions sur le corps y sont évaluées sur un texte vide", "warning")
+        
+        if not report['changed']:
+            self.log("ℹ️ Aucun email ne changerait de destination", "info")
+        for target, count in sorted(report['targets'].items(), key=lambda item: -item[1]):
+            self.log(f"➡️ {count} emails: {target}", "success")
+        for name, count in sorted(report['shadows'].items(), key=lambda item: -item[1]):
+            self.log(f"⚠️ Prendrait le pas sur '{name}' pour {count} emails", "warning")
+        for name, count in sorted(report['shadowed_by'].items(), key=lambda item: -item[1]):
+            self.log(f"🙈 Masquée par '{name}' pour {count} emails (elle ne s'appliquerait pas)", "warning")
+    
+    def open_connection(self, recorder=None):
+        """Ouvrir une connexion IMAP authentifiée et instrumentée"""
+        if self.connection_factory is not None:
+            connection = self.connection_factory()
+        elif self.use_ssl_var.get():
+            connection = InstrumentedIMAP4_SSL(self.server_var.get(), int(self.port_var.get()),
+                                               recorder=recorder)
+        else:
+            # Serveur local ou de test (port 143)
+            connection = InstrumentedIMAP4(self.server_var.get(), int(self.port_var.get()),
+                                           recorder=recorder)
+        connection.perf = self.perf
+        connection.trace_lane = f"IMAP {self.server_var.get()}"
+        connection.login(self.email_var.get(), self.password_var.get())
+        self.server_profile = self.probe_server_profile(connection)
+        # Flux compressé si le serveur le permet (en-têtes et corps: texte très compressible)
+        if self.server_profile.compress and hasattr(connection, 'compress'):
+            connection.compress()
+        return connection
+    
+    def probe_server_profile(self, connection):
+        """Capacités d'après authentification et espace de noms du serveur (profil en cache si inchangé)"""
+        if self.server_profiles is None:
+            self.server_profiles = ServerProfiles(self.server_profiles_file)
+        server = f"{self.server_var.get()}:{self.port_var.get()}"
+        profile = probe_server(connection, server, self.server_profiles.get(server))
+        self.server_profiles.save(profile)
+        return profile
+    
+    def open_backend(self, recorder=None):
+        """Ouvrir la source de messages choisie (serveur IMAP ou dossiers locaux)"""
+        if self.source_type_var.get() == "imap":
+            return IMAPBackend(self.open_connection(recorder), label=self.server_var.get())
+        self.server_profile = None
+        return open_local_backend(self.source_type_var.get(), self.source_path_var.get(),
+                                  state_dir=self.local_state_dir)
+    
+    def source_ready(self):
+        """Vérifier que la source est configurée (avertissement sinon)"""
+        if self.source_type_var.get() == "imap":
+            if not self.server_var.get() or not self.email_var.get() or not self.password_var.get():
+                messagebox.showwarning("Attention", "Configurez d'abord la connexion!")
+                return False
+        elif not self.source_path_var.get() or not Path(self.source_path_var.get()).expanduser().exists():
+            messagebox.showwarning("Attention", "Choisissez d'abord un dossier Maildir ou un fichier mbox!")
+            return False
+        return True
+    
+    def source_label(self):
+        """Serveur ou chemin local, pour la console et le journal"""
+        if self.source_type_var.get() == "imap":
+            return self.server_var.get()
+        return self.source_path_var.get()
+    
+    def account_name(self):
+        """Compte sous lequel l'index local range les messages de la source"""
+        if self.source_type_var.get() == "imap":
+            return self.email_var.get()
+        path = Path(self.source_path_var.get()).expanduser().resolve()
+        return f"{self.source_type_var.get()}:{path}"
+    
+    def browse_source_path(self, directory):
+        """Choisir un dossier (Maildir, profil Thunderbird) ou un fichier mbox"""
+        if directory:
+            path = filedialog.askdirectory(title="Dossier Maildir ou dossier de courrier Thunderbird")
+        else:
+            path = filedialog.askopenfilename(title="Fichier mbox")
+            if path:
+                self.source_type_var.set("mbox")
+        if path:
+            self.source_path_var.set(path)
+    
     def test_connection(self):
-        """Tester la connexion au serveur avec mode PEEK"""
+        """Tester la connexion au serveur (ou la lecture de la source locale) avec mode PEEK"""
         self.log("\n" + "="*50, "separator")
         self.log("🔌 TEST DE CONNEXION", "header")
         self.log("="*50, "separator")
         
         try:
-            server = self.server_var.get()
-            if not server:
-                messagebox.showerror("Erreur", "Veuillez entrer un serveur IMAP!")
+            if not self.source_ready():
                 return
-                
-            self.log(f"Connexion à {server}:{self.port_var.get()}...", "info")
             
-            connection = imaplib.IMAP4_SSL(server, int(self.port_var.get()))
-            connection.login(self.email_var.get(), self.password_var.get())
-            
-            # Obtenir info
-            result, folders = connection.list()
-            
-            self.log("✅ Connexion réussie!", "success")
-            self.log(f"📁 {len(folders)} dossiers trouvés", "info")
+            source = self.source_label()
+            if self.source_type_var.get() == "imap":
+                self.log(f"Connexion à {source}:{self.port_var.get()}...", "info")
+            else:
+                self.log(f"Ouverture de {source}...", "info")
             
-            # Test du mode PEEK
-            connection.select('INBOX', readonly=True)
-            result, data = connection.search(None, 'ALL')
-            if result == 'OK':
-                email_count = len(data[0].split())
-                self.log(f"📧 {email_count} emails dans la boîte de réception", "info")
+            backend = self.open_backend()
+            try:
+                # Obtenir info
+                folders = backend.list_folders()
+                
+                self.log("✅ Connexion réussie!", "success")
+                self.log(f"📁 {len(folders)} dossiers trouvés", "info")
+                
+                # Test du mode PEEK
+                backend.select('INBOX', readonly=True)
+                uids = backend.search('ALL')
+                self.log(f"📧 {len(uids)} emails dans la boîte de réception", "info")
                 
                 # Tester PEEK sur le premier email
-                if email_count > 0:
-                    first_id = data[0].split()[0]
-                    result, msg_data = connection.fetch(first_id, '(BODY.PEEK[HEADER])')
-                    if result == 'OK':
+                if uids:
+                    if next(backend.fetch(uids[:1], headers_only=True), None):
                         self.log("✅ Mode PEEK supporté - Les emails ne seront PAS marqués comme lus", "success")
                     else:
                         self.log("⚠️ Mode PEEK peut ne pas être supporté complètement", "warning")
-            
-            connection.logout()
+            finally:
+                backend.close()
             
             messagebox.showinfo("Succès", 
                               f"✅ Connexion réussie!\n\n"
-                              f"Serveur: {server}\n"
+                              f"Source: {source}\n"
                               f"Email: {self.email_var.get()}\n"
                               f"{len(folders)} dossiers disponibles\n"
                               f"Mode PEEK supporté ✓")
@@ -1599,10 +2078,18 @@ class EmailManager:
     
     def get_full_folder_name(self, folder_name):
         """Obtenir le nom complet du dossier - ne pas modifier si déjà complet"""
+        # Les sources locales n'ont pas de préfixe INBOX
+        if self.source_type_var.get() != "imap":
+            return folder_name
+        
         # Si le dossier existe déjà dans la liste, le retourner tel quel
         if folder_name in self.existing_folders:
             return folder_name
         
+        # Espace de noms annoncé par le serveur (NAMESPACE): préfixe exact
+        if self.namespace_known():
+            return self.server_profile.folder_name(folder_name)
+        
         # Si c'est déjà un chemin complet (contient INBOX ou commence par un séparateur)
         if "INBOX" in folder_name or folder_name.startswith(("/", ".", "\\")):
             return folder_name
@@ -1622,8 +2109,18 @@ class EmailManager:
         # Par défaut, retourner tel quel
         return folder_name
     
-    def create_folder_if_needed(self, connection, folder_name):
-        """Créer un dossier IMAP s'il n'existe pas"""
+    def alternative_folder(self, folder_name):
+        """Nom à réessayer après l'échec d'un déplacement (préfixe deviné, pas annoncé), ou None"""
+        if "INBOX." in folder_name or folder_name == "INBOX" or self.namespace_known():
+            return None
+        return f"INBOX.{folder_name}"
+    
+    def namespace_known(self):
+        """Vrai si le préfixe des dossiers du serveur connecté est connu (NAMESPACE)"""
+        return self.server_profile is not None and self.server_profile.prefix is not None
+    
+    def create_folder_if_needed(self, backend, folder_name):
+        """Créer un dossier s'il n'existe pas"""
         if not folder_name:
             return True
             
@@ -1636,45 +2133,34 @@ class EmailManager:
             # Pour un nouveau dossier, essayer de le créer
             full_folder_name = self.get_full_folder_name(folder_name)
             
-            # Lister tous les dossiers existants
-            result, folders = connection.list()
-            
             # Vérifier si le dossier existe sous différentes formes
             folder_exists = False
-            if result == 'OK':
-                for folder in folders:
-                    if folder:
-                        folder_str = folder.decode('utf-8') if isinstance(folder, bytes) else str(folder)
-                        # Vérifier si le nom apparaît dans la chaîne
-                        if folder_name.lower() in folder_str.lower() or full_folder_name.lower() in folder_str.lower():
-                            folder_exists = True
-                            self.log(f"📁 Dossier '{folder_name}' trouvé", "info")
-                            break
+            for folder_str in backend.list_folders():
+                if folder_name.lower() in folder_str.lower() or full_folder_name.lower() in folder_str.lower():
+                    folder_exists = True
+                    self.log(f"📁 Dossier '{folder_name}' trouvé", "info")
+                    break
             
             if not folder_exists:
                 # Essayer de créer le dossier
                 self.log(f"📁 Création du dossier '{full_folder_name}'...", "info")
-                result = connection.create(full_folder_name)
-                if result[0] == 'OK':
+                if backend.create_folder(full_folder_name):
                     self.log(f"✅ Dossier '{full_folder_name}' créé avec succès", "success")
-                    connection.subscribe(full_folder_name)
                     # Ajouter à la liste des dossiers existants
                     if full_folder_name not in self.existing_folders:
                         self.existing_folders.append(full_folder_name)
                     return True
                 else:
-                    # Si échec avec INBOX., essayer sans
-                    if "INBOX." in full_folder_name:
+                    # Si échec avec INBOX., essayer sans (préfixe deviné, pas annoncé)
+                    if "INBOX." in full_folder_name and not self.namespace_known():
                         simple_name = folder_name
-                        result = connection.create(simple_name)
-                        if result[0] == 'OK':
+                        if backend.create_folder(simple_name):
                             self.log(f"✅ Dossier '{simple_name}' créé avec succès", "success")
-                            connection.subscribe(simple_name)
                             if simple_name not in self.existing_folders:
                                 self.existing_folders.append(simple_name)
                             return True
                     
-                    self.log(f"❌ Impossible de créer '{full_folder_name}': {result}", "error")
+                    self.log(f"❌ Impossible de créer '{full_folder_name}'", "error")
                     return False
             return True
                     
@@ -1684,12 +2170,15 @@ class EmailManager:
     
     def start_analysis(self):
         """Démarrer l'analyse des emails"""
-        if not self.email_var.get() or not self.password_var.get():
-            messagebox.showerror("Erreur", "Configurez d'abord vos identifiants dans l'onglet Connexion!")
-            return
-        
-        if not self.server_var.get():
-            messagebox.showerror("Erreur", "Le serveur IMAP n'est pas configuré!")
+        if self.source_type_var.get() == "imap":
+            if not self.email_var.get() or not self.password_var.get():
+                messagebox.showerror("Erreur", "Configurez d'abord vos identifiants dans l'onglet Connexion!")
+                return
+            
+            if not self.server_var.get():
+                messagebox.showerror("Erreur", "Le serveur IMAP n'est pas configuré!")
+                return
+        elif not self.source_ready():
             return
         
         if self.is_running:
@@ -1711,11 +2200,14 @@ class EmailManager:
         # Réinitialiser les emails traités
         self.processed_emails.clear()
         
+        # Prendre en compte les options de la console
+        self.on_log_options_changed()
+        
         # Sauvegarder avant l'analyse
         self.save_settings()
         
         # Thread pour ne pas bloquer l'interface
-        thread = threading.Thread(target=self.analysis_worker, daemon=True)
+        thread = threading.Thread(target=self.analysis_worker, daemon=True, name="analyse")
         thread.start()
     
     def analysis_worker(self):
@@ -1726,9 +2218,54 @@ class EmailManager:
             'cc_moved': 0,
             'rules_applied': 0,
             'chains_applied': 0,
+            'skipped': 0,
+            'duplicates': 0,
+            'large': 0,
             'errors': 0
         }
         
+        # Chronomètres du run, trace Chrome et profilage éventuels
+        self.perf = PerfStats(tracer=TraceRecorder() if self.trace_export_var.get() else None)
+        self.header_counts = self.header_decoder.counts()
+        profiler = None
+        if self.profile_next_run_var.get():
+            profiler = RunProfiler()
+            profiler.start()
+        
+        # Journal des décisions, écrit par un thread dédié
+        self.journal = None
+        if self.journal_enabled_var.get():
+            self.journal = RunJournal(self.journal_dir)
+            self.journal.start(account=self.email_var.get(),
+                               server=self.source_label(),
+                               dry_run=self.dry_run_var.get())
+        
+        # Index local des enveloppes, écrit par lots
+        self.index = None
+        if self.index_enabled_var.get():
+            try:
+                self.index = MailIndex(self.index_file)
+                self.rules_version = self.compute_rules_version()
+            except Exception as e:
+                self.log(f"⚠️ Index local indisponible: {str(e)}", "warning")
+        
+        # Message-ID déjà triés (filtre de Bloom persistant, confirmé par l'index:
+        # sans lui, seuls les doublons de cette analyse sont écartés)
+        self.handled_emails = None
+        if self.dedup_enabled_var.get() and self.index:
+            self.handled_emails = self.open_handled_emails()
+        
+        # Enregistrement de la session IMAP pour le rejeu
+        recorder = None
+        if self.record_session_var.get() and self.source_type_var.get() == "imap":
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            try:
+                self.sessions_dir.mkdir(parents=True, exist_ok=True)
+                recorder = SessionRecorder(self.sessions_dir / f"session_{stamp}.jsonl.gz",
+                                           metadata=self.session_metadata())
+            except OSError as e:
+                self.log(f"⚠️ Enregistrement de la session impossible: {str(e)}", "warning")
+        
         try:
             # Connexion
             self.log("\n" + "="*60, "separator")
@@ -1741,12 +2278,35 @@ class EmailManager:
             if self.preserve_unread_var.get():
                 self.log("🔒 Préservation du statut non-lu activée", "success")
             
-            self.log(f"🔌 Connexion à {self.server_var.get()}...", "info")
+            # Mode enveloppe: aucun message téléchargé si les règles se contentent des en-têtes
+            self.envelope_only = False
+            if self.envelope_fetch_var.get():
+                if self.rules_read_body():
+                    self.log("📨 Mode enveloppe ignoré: une règle porte sur le corps", "warning")
+                else:
+                    self.envelope_only = True
+                    self.log("📨 Mode enveloppe: seuls les en-têtes des emails sont récupérés", "info")
+            
+            self.log(f"🔌 Connexion à {self.source_label()}...", "info")
             
-            connection = imaplib.IMAP4_SSL(self.server_var.get(), int(self.port_var.get()))
-            connection.login(self.email_var.get(), self.password_var.get())
+            backend = self.open_backend(recorder)
             
             self.log(f"✅ Connecté avec succès!", "success")
+            if self.server_profile is not None:
+                profile = self.server_profile
+                namespace = (f"préfixe '{profile.prefix}'" if profile.prefix
+                             else "sans préfixe" if profile.prefix is not None else "préfixe inconnu")
+                self.log(f"🧭 Capacités du serveur{' (profil en cache)' if profile.cached else ''}: "
+                         f"{', '.join(profile.strategies()) or 'aucune extension utile'} - "
+                         f"dossiers {namespace}, séparateur '{profile.delimiter or '?'}'", "info")
+            if backend.compressed:
+                self.log("🗜️ COMPRESS=DEFLATE: échanges IMAP compressés", "info")
+            
+            # Serveur BINARY: seule la partie texte est téléchargée, déjà décodée
+            self.text_fetch = (not self.envelope_only and backend.binary
+                               and (self.rules_read_body() or self.index_bodies_var.get()))
+            if self.text_fetch:
+                self.log("🧾 BINARY: seule la partie texte des emails est récupérée, décodée par le serveur", "info")
             
             # Créer les dossiers nécessaires
             folders_to_create = set()
@@ -1759,7 +2319,7 @@ class EmailManager:
                     folders_to_create.add(rule['folder'])
             
             for folder in folders_to_create:
-                self.create_folder_if_needed(connection, folder)
+                self.create_folder_if_needed(backend, folder)
             
             # Déterminer les dossiers à analyser
             folders_to_process = []
@@ -1769,9 +2329,7 @@ class EmailManager:
                 folders_to_process.append('INBOX')
             
             # Ajouter les dossiers sélectionnés
-            selected_indices = self.folders_listbox.curselection()
-            for index in selected_indices:
-                folder = self.folders_listbox.get(index)
+            for folder in self.get_selected_folders():
                 if folder not in folders_to_process:
                     folders_to_process.append(folder)
             
@@ -1783,11 +2341,14 @@ class EmailManager:
             # Traiter chaque dossier
             for folder in folders_to_process:
                 self.log(f"\n📂 Analyse du dossier: {folder}", "header")
-                self.process_folder(connection, folder, stats)
+                with self.perf.stage('folder', trace_name=f"dossier {folder}", args={'folder': folder}):
+                    self.process_folder(backend, folder, stats)
+            
+            # Déconnexion (les sources locales écrivent leurs modifications)
+            backend.close()
             
-            # Déconnexion
-            connection.close()
-            connection.logout()
+            # Statistiques de performance
+            self.finish_perf_stats(backend, stats)
             
             # Résumé final
             self.display_summary(stats)
@@ -1800,47 +2361,240 @@ class EmailManager:
             if "authentication" in error_msg.lower():
                 error_msg += "\n\n💡 Vérifiez:\n• Le serveur IMAP\n• L'email et le mot de passe"
             
-            messagebox.showerror("Erreur", f"Erreur lors de l'analyse:\n\n{error_msg}")
+            if not self.headless:
+                messagebox.showerror("Erreur", f"Erreur lors de l'analyse:\n\n{error_msg}")
         
         finally:
             self.is_running = False
-            self.root.after(0, lambda: self.analyze_btn.config(
-                state='normal',
-                text="🚀 ANALYSER ET TRIER LES EMAILS"
-            ))
+            self.last_stats = stats
+            
+            if self.perf.tracer is not None:
+                stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                try:
+                    path = self.perf.tracer.export(self.traces_dir / f"trace_{stamp}.json")
+                    self.log(f"🧵 Trace enregistrée (chrome://tracing ou ui.perfetto.dev): {path}", "info")
+                except OSError as e:
+                    self.log(f"⚠️ Erreur lors de l'écriture de la trace: {str(e)}", "warning")
+            
+            if profiler:
+                try:
+                    path = profiler.stop(self.data_dir)
+                    self.log(f"🔬 Profil {profiler.kind} enregistré: {path}", "info")
+                except OSError as e:
+                    self.log(f"⚠️ Erreur lors de l'écriture du profil: {str(e)}", "warning")
+                self.root.after(0, lambda: self.profile_next_run_var.set(False))
+            
+            if recorder:
+                try:
+                    recorder.close()
+                    self.log(f"🎞️ Session IMAP enregistrée ({recorder.exchanges} commandes): {recorder.path}", "info")
+                except OSError as e:
+                    self.log(f"⚠️ Erreur lors de l'écriture de la session IMAP: {str(e)}", "warning")
+                self.root.after(0, lambda: self.record_session_var.set(False))
             
-            # Mettre à jour les statistiques
-            self.update_stats(stats)
+            if self.journal:
+                self.journal.close(**stats)
+                self.journal = None
+            
+            if self.handled_emails is not None:
+                try:
+                    self.handled_emails.save()
+                except OSError as e:
+                    self.log(f"⚠️ Erreur lors de l'écriture des Message-ID traités: {str(e)}", "warning")
+                self.handled_emails = None
+            
+            if self.index:
+                try:
+                    self.index.close()
+                except Exception as e:
+                    self.log(f"⚠️ Erreur lors de l'écriture de l'index: {str(e)}", "warning")
+                self.index = None
+            
+            if not self.headless:
+                self.root.after(0, lambda: self.analyze_btn.config(
+                    state='normal',
+                    text="🚀 ANALYSER ET TRIER LES EMAILS"
+                ))
+                
+                # Mettre à jour les statistiques
+                self.update_stats(stats)
+    
+    def open_handled_emails(self):
+        """Message-ID des emails déjà triés sur ce compte (fichier par compte)"""
+        account = self.account_name()
+        digest = hashlib.sha1(account.encode("utf-8")).hexdigest()[:16]
+        index, rules_version = self.index, self.rules_version
+        confirm = lambda message_id, folder_id=None, uid=None: index.handled(
+            account, message_id, folder_id, uid, rules_version)
+        return ProcessedMessages(self.processed_dir / f"{digest}.bloom", confirm=confirm)
+    
+    def already_processed(self, message_id, folder_id=None, uid=None):
+        """Vrai si ce Message-ID a déjà été traité (pendant cette analyse ou trié avant)"""
+        if not message_id:
+            return False
+        return message_id in self.processed_emails or (
+            self.handled_emails is not None
+            and self.handled_emails.contains(message_id, folder_id, uid))
+    
+    def count_duplicates(self, stats, duplicates):
+        """Compter les emails écartés comme déjà traités"""
+        if duplicates:
+            stats['duplicates'] += duplicates
+            stats['total'] -= duplicates
+            self.log(f"♻️ {duplicates} emails déjà traités ignorés (Message-ID)", "info")
+    
+    def large_message_threshold(self):
+        """Taille (octets) au-delà de laquelle un email est un gros email (0: aucune limite)"""
+        try:
+            return max(0, int(float(self.large_message_mb_var.get()) * 1024 * 1024))
+        except (TypeError, ValueError):
+            return 0
     
-    def process_folder(self, connection, folder, stats):
+    def screen_batch(self, backend, batch, stats, folder_id=None):
+        """Trier un lot avant téléchargement: (UIDs à lire en entier, {uid: taille} des gros emails)
+        
+        Écarte les emails dont le Message-ID a déjà été traité (pendant cette
+        analyse, ou trié lors d'une précédente: voir MailIndex.handled) et met à
+        part ceux qui dépassent le seuil de taille; Message-ID et tailles arrivent
+        en une commande par lot.
+        """
+        dedup = self.dedup_enabled_var.get()
+        threshold = self.large_message_threshold()
+        if not dedup and not threshold:
+            return batch, {}
+        
+        try:
+            with self.perf.stage('prefetch'):
+                summaries = backend.summaries(batch, message_ids=dedup, sizes=bool(threshold))
+        except BackendError as e:
+            self.log(f"⚠️ Message-ID et tailles illisibles: {str(e)[:100]}", "warning")
+            return batch, {}
+        
+        remaining = []
+        large = {}
+        duplicates = 0
+        for uid in batch:
+            message_id, size = summaries.get(uid, (None, None))
+            if dedup and self.already_processed(normalize_message_id(message_id), folder_id, uid):
+                duplicates += 1
+            elif threshold and size and size > threshold:
+                large[uid] = size
+            else:
+                remaining.append(uid)
+        self.count_duplicates(stats, duplicates)
+        return remaining, large
+    
+    def fetch_large(self, backend, large, stats):
+        """Gros emails d'un lot selon la politique choisie: début seulement, ou ignorés
+        
+        Retourne les (uid, flags, début du contenu, taille réelle) lus; les
+        règles sur le corps ne voient alors que le début du message.
+        """
+        threshold = format_bytes(self.large_message_threshold())
+        if self.large_message_policy_var.get() == "skip":
+            for uid, size in large.items():
+                self.log(f"⏭️ Email {uid} ignoré: {format_bytes(size)} (seuil {threshold})", "warning")
+            stats['large'] += len(large)
+            stats['total'] -= len(large)
+            return []
+        
+        try:
+            fetched = [(uid, flags, raw, large[uid]) for uid, flags, raw in
+                       backend.fetch(list(large), peek=self.preserve_unread_var.get(),
+                                     limit=self.PARTIAL_FETCH_BYTES)]
+        except BackendError as e:
+            self.log(f"⚠️ Gros emails illisibles: {str(e)[:100]}", "error")
+            fetched = []
+        
+        missing = len(large) - len(fetched)
+        if missing:
+            stats['processed'] += missing
+            stats['errors'] += missing
+        stats['large'] += len(fetched)
+        for uid, _, _, size in fetched:
+            self.log(f"✂️ Email {uid} de {format_bytes(size)} (seuil {threshold}): "
+                     f"analyse sur ses {format_bytes(self.PARTIAL_FETCH_BYTES)} premiers", "info")
+        return fetched
+    
+    def fetch_envelopes(self, backend, batch):
+        """Enveloppes d'un lot (mode enveloppe): (uid, flags, Envelope, réception, taille)
+        
+        Sans préservation du non-lu, les emails sont marqués lus comme l'aurait
+        fait leur téléchargement.
+        """
+        fetched = list(backend.fetch_metadata(batch))
+        
+        if not self.preserve_unread_var.get():
+            unread = [item[0] for item in fetched if b'\\Seen' not in item[1]]
+            if unread:
+                backend.add_flags(unread, '\\Seen')
+        return fetched
+    
+    def skip_processed_envelopes(self, fetched, stats, folder_id=None):
+        """Retirer les emails déjà traités d'un lot d'enveloppes (Message-ID déjà reçu)"""
+        remaining = [item for item in fetched
+                     if not self.already_processed(normalize_message_id(item[2].message_id),
+                                                   folder_id, item[0])]
+        self.count_duplicates(stats, len(fetched) - len(remaining))
+        return remaining
+    
+    def process_folder(self, backend, folder, stats):
         """Traiter un dossier spécifique"""
         try:
             # Sélectionner le dossier - toujours en mode normal pour pouvoir effectuer les actions
             # Le mode PEEK sera utilisé uniquement pour la récupération des emails
-            connection.select(folder)
+            uidvalidity = backend.select(folder)
             self.log(f"📖 {folder} ouvert pour traitement", "info")
             
-            # Construire la requête de recherche
-            search_criteria = self.build_search_criteria()
-            result, data = connection.search(None, search_criteria)
+            folder_id = None
+            if self.index:
+                folder_id = self.index.folder_id(self.account_name(), folder, uidvalidity)
+            
+            # CONDSTORE: dossier inchangé depuis une analyse complète qui n'avait rien à faire
+            state_key = self.folder_state_key() if folder_id is not None else None
+            if (state_key and backend.highest_modseq is not None
+                    and self.index.folder_unchanged(folder_id, backend.highest_modseq, state_key)):
+                self.log(f"⏭️ {folder} inchangé depuis la dernière analyse (CONDSTORE), ignoré", "info")
+                return
+            errors_before = stats['errors']
             
-            if result != 'OK':
-                self.log(f"❌ Erreur lors de la recherche dans {folder}", "error")
+            # Construire la requête de recherche (UIDs: stables d'une analyse à l'autre)
+            search_criteria = self.build_search_criteria()
+            try:
+                email_ids = backend.search(search_criteria)
+            except BackendError as e:
+                self.log(f"❌ Erreur lors de la recherche dans {folder}: {str(e)}", "error")
                 return
             
-            email_ids = data[0].split()
+            # Ignorer les emails déjà analysés sans action avec les mêmes règles
+            if folder_id is not None and self.skip_indexed_var.get():
+                known = self.index.reusable_uids(
+                    folder_id, self.rules_version,
+                    recheck_flagged=self.cc_skip_important_var.get(),
+                    recent_seconds=86400 if self.cc_skip_recent_var.get() else 0)
+                if known:
+                    remaining = [uid for uid in email_ids if uid not in known]
+                    skipped = len(email_ids) - len(remaining)
+                    if skipped:
+                        stats['skipped'] += skipped
+                        self.log(f"⏭️ {skipped} emails déjà analysés ignorés (index local)", "info")
+                    email_ids = remaining
+            
             folder_total = len(email_ids)
             
             if folder_total == 0:
                 self.log(f"📭 Aucun email dans {folder}", "warning")
+                self.remember_folder_state(backend, folder_id, state_key)
                 return
             
             # Limiter si nécessaire
+            truncated = False
             try:
                 max_emails = int(self.max_emails_var.get())
                 if max_emails > 0 and folder_total > max_emails:
                     email_ids = email_ids[-max_emails:]
                     folder_total = max_emails
+                    truncated = True
             except:
                 pass
             
@@ -1848,220 +2602,320 @@ class EmailManager:
             
             stats['total'] += folder_total
             
-            # Traiter par lots
+            # Traiter par lots: un seul aller-retour de récupération par lot
             batch_size = int(self.batch_size_var.get())
+            folder_actions = 0
             
             for i in range(0, len(email_ids), batch_size):
                 batch = email_ids[i:i+batch_size]
+                batch_started = time.perf_counter()
                 
-                for num in batch:
-                    if not self.is_running:
-                        self.log("⏹️ Analyse interrompue", "warning")
-                        return
-                    
-                    stats['processed'] += 1
-                    
-                    # Mise à jour du statut
-                    if stats['processed'] % 10 == 0:
-                        self.status_var.set(f"🔄 {folder}: {stats['processed']}/{stats['total']} emails")
-                    
-                    try:
-                        # Récupérer l'email avec PEEK pour ne pas le marquer comme lu
-                        if self.preserve_unread_var.get():
-                            fetch_command = '(BODY.PEEK[] FLAGS)'
-                        else:
-                            fetch_command = '(RFC822 FLAGS)'
+                # Copies d'emails déjà traités (autre dossier, analyse précédente)
+                # et gros emails, avant de télécharger les contenus
+                large = {}
+                if not self.envelope_only:
+                    batch, large = self.screen_batch(backend, batch, stats, folder_id)
+                    if not batch and not large:
+                        continue
+                
+                # Récupérer les emails avec PEEK pour ne pas les marquer comme lus
+                # (ou leur seule enveloppe: une commande par lot, aucun contenu)
+                try:
+                    if self.envelope_only:
+                        fetched = self.fetch_envelopes(backend, batch)
+                    elif self.text_fetch:
+                        fetched = list(backend.fetch_text(batch, peek=self.preserve_unread_var.get(),
+                                                          limit=self.BODY_CHARS * 4,
+                                                          html_limit=self.PARTIAL_FETCH_BYTES)) if batch else []
+                    else:
+                        fetched = list(backend.fetch(batch, peek=self.preserve_unread_var.get())) if batch else []
+                except BackendError as e:
+                    self.log(f"⚠️ Lot illisible dans {folder}: {str(e)[:100]}", "error")
+                    fetched = []
+                
+                # Emails disparus entre la recherche et la récupération
+                missing = len(batch) - len(fetched)
+                if missing:
+                    stats['processed'] += missing
+                    stats['errors'] += missing
+                
+                # Gros emails: leur début seulement, ou rien
+                if large:
+                    fetched.extend(self.fetch_large(backend, large, stats))
+                
+                # En mode enveloppe, le Message-ID arrive avec l'enveloppe
+                if self.envelope_only and self.dedup_enabled_var.get():
+                    fetched = self.skip_processed_envelopes(fetched, stats, folder_id)
+                
+                # Actions du lot en pipeline: les commandes partent à la suite, les
+                # réponses sont lues à la fin du lot (un aller-retour pour le lot)
+                decided = []
+                interrupted = False
+                with backend.pipeline() as failed:
+                    for position, item in enumerate(fetched):
+                        # Le contenu brut n'est plus référencé une fois l'email extrait
+                        fetched[position] = None
+                        uid = item[0]
                         
-                        result, msg_data = connection.fetch(num, fetch_command)
+                        if not self.is_running:
+                            self.log("⏹️ Analyse interrompue", "warning")
+                            interrupted = True
+                            break
                         
-                        if result != 'OK':
-                            stats['errors'] += 1
-                            continue
+                        stats['processed'] += 1
                         
-                        # Parser l'email
-                        raw_email = msg_data[0][1]
-                        msg = email.message_from_bytes(raw_email)
+                        # Mise à jour du statut
+                        if stats['processed'] % 10 == 0:
+                            self.status_var.set(f"🔄 {folder}: {stats['processed']}/{stats['total']} emails")
                         
-                        # Récupérer les flags
-                        current_flags = self.extract_flags(msg_data)
-                        is_unread = b'\\Seen' not in current_flags
+                        started = time.perf_counter()
                         
-                        # Décoder les headers
-                        subject = self.decode_header(msg.get("Subject", ""))[:100]
-                        from_addr = self.decode_header(msg.get("From", ""))
-                        to_addr = self.decode_header(msg.get("To", ""))
-                        cc_addr = self.decode_header(msg.get("Cc", ""))
-                        date = msg.get("Date", "")
+                        try:
+                            # Champs utiles au tri; l'arbre MIME n'est pas construit
+                            if self.envelope_only:
+                                record = self.envelope_record(*item)
+                            elif self.text_fetch and len(item) == 5:
+                                record = self.text_record(*item)
+                            else:
+                                record = self.message_record(*item)
+                            
+                            # Analyser avec le nouveau système
+                            with self.perf.stage('classify', args={'uid': uid}):
+                                action = self.analyze_email_v3(record, stats)
+                            
+                            success = None
+                            if action:
+                                if not self.dry_run_var.get():
+                                    # Exécuter l'action (sans attendre la réponse dans le pipeline)
+                                    with self.perf.stage('action'):
+                                        success = self.execute_action(backend, record, action)
+                                else:
+                                    self.log(f"🧪 [TEST] {record.subject[:50]}... → {action.folder or action.kind}", "test")
+                            
+                            decided.append((record, action, success, started))
+                            
+                        except Exception as e:
+                            stats['errors'] += 1
+                            self.log(f"⚠️ Erreur sur un email: {str(e)[:100]}", "error")
+                
+                for record, action, success, started in decided:
+                    if action:
+                        folder_actions += 1
+                    try:
+                        if success and record.uid in failed:
+                            # Refus reçu à la fin du pipeline
+                            self.log(f"⚠️ {failed[record.uid]} refusé par le serveur: {record.subject[:50]}", "warning")
+                            success = self.retry_refused_move(backend, record, action, failed[record.uid])
+                        if action and not self.dry_run_var.get() and not success:
+                            stats['errors'] += 1
                         
-                        # Analyser avec le nouveau système
-                        action = self.analyze_email_v3(msg, subject, from_addr, to_addr, 
-                                                       cc_addr, date, current_flags, stats)
+                        if record.message_id:
+                            self.processed_emails.add(record.message_id)
+                            if success and self.handled_emails is not None:
+                                self.handled_emails.add(record.message_id)
                         
-                        if action:
-                            if not self.dry_run_var.get():
-                                # Exécuter l'action immédiatement
-                                success = self.execute_action(connection, num, action, subject, is_unread)
-                                if not success:
-                                    stats['errors'] += 1
-                            else:
-                                self.log(f"🧪 [TEST] {subject[:50]}... → {action.get('folder', action.get('action'))}", "test")
+                        if self.journal:
+                            self.record_decision(folder, record, action, success, started)
+                        
+                        if folder_id is not None:
+                            self.index_message(folder_id, record, action, success)
+                        
+                        self.perf.span('message', started, args={'uid': record.uid})
                         
                     except Exception as e:
                         stats['errors'] += 1
                         self.log(f"⚠️ Erreur sur un email: {str(e)[:100]}", "error")
+                
+                if interrupted:
+                    return
+                
+                if self.index:
+                    with self.perf.stage('index'):
+                        self.index.flush()
+                
+                self.perf.span('batch', batch_started, args={'folder': folder, 'size': len(batch)})
             
             # Expurger les messages marqués pour suppression
             if not self.dry_run_var.get():
                 try:
-                    result = connection.expunge()
-                    if result[0] == 'OK':
+                    if backend.expunge():
                         self.log(f"🗑️ Messages supprimés expurgés dans {folder}", "info")
                 except Exception as e:
                     self.log(f"⚠️ Erreur lors de l'expunge: {str(e)}", "warning")
+            
+            if not truncated and not folder_actions and stats['errors'] == errors_before:
+                self.remember_folder_state(backend, folder_id, state_key)
                 
         except Exception as e:
             self.log(f"⚠️ Erreur dans le dossier {folder}: {str(e)}", "error")
             stats['errors'] += 1
     
-    def analyze_email_v3(self, msg, subject, from_addr, to_addr, cc_addr, date, flags, stats):
-        """Analyser un email avec le système de chaînes et priorités"""
+    def folder_state_key(self):
+        """Empreinte des réglages dont dépend le saut d'un dossier inchangé (None: saut impossible)"""
+        # Emails récents ignorés par la gestion CC: à revoir même sans changement du dossier
+        if not self.skip_indexed_var.get() or self.cc_skip_recent_var.get():
+            return None
+        return rules_fingerprint(self.rules_version, self.build_search_criteria(),
+                                 self.large_message_mb_var.get(), self.large_message_policy_var.get())
+    
+    def remember_folder_state(self, backend, folder_id, state_key):
+        """Retenir le HIGHESTMODSEQ d'un dossier analysé entièrement sans aucune action"""
+        if state_key and backend.highest_modseq is not None:
+            self.index.save_folder_state(folder_id, backend.highest_modseq, state_key)
+    
+    def analyze_email_v3(self, record, stats, rules=None, chains=None, verbose=True, perf=None):
+        """Analyser un email (MessageRecord) avec le système de chaînes et priorités
+        
+        rules/chains: jeu de règles à utiliser à la place de la configuration
+        (simulation); verbose=False n'écrit rien dans la console; perf: où
+        chronométrer les étapes (self.perf, celles de l'analyse, par défaut).
+        Retourne une Action, ou None si aucune règle ne s'applique.
+        """
         user_email = self.email_var.get().lower()
+        if rules is None:
+            rules = self.rules
+        if chains is None:
+            chains = self.rule_chains
+        if perf is None:
+            perf = self.perf
         
         # Vérifier d'abord les chaînes de règles actives
-        for chain in sorted(self.rule_chains, key=lambda x: x.get('priority', 50)):
-            if not chain.get('enabled', True):
-                continue
-            
-            for rule in chain.get('rules', []):
-                if self.check_rule_v3(msg, subject, from_addr, to_addr, cc_addr, rule):
-                    self.log(f"⛓️ Chaîne '{chain['name']}' → Règle '{rule.get('name')}'", "info")
-                    stats['chains_applied'] += 1
+        with perf.stage('match_chains'):
+            for chain in sorted(chains, key=lambda x: x.get('priority', 50)):
+                if not chain.get('enabled', True):
+                    continue
+                
+                for rule in chain.get('rules', []):
+                    if self.check_rule_v3(record, rule):
+                        if verbose:
+                            self.log(f"⛓️ Chaîne '{chain['name']}' → Règle '{rule.get('name')}'", "info")
+                        stats['chains_applied'] += 1
+                        
+                        action = Action.from_rule(rule, chain=chain['name'])
+                        
+                        if chain.get('stop_on_match', True):
+                            return action
+                        
+                        if not rule.get('continue_chain', False):
+                            return action
+        
+        # Ensuite les règles individuelles par priorité
+        with perf.stage('match_rules'):
+            for rule in rules:
+                if self.check_rule_v3(record, rule):
+                    if verbose:
+                        self.log(f"📍 Règle: {rule.get('name', 'Sans nom')}", "info")
+                    stats['rules_applied'] += 1
                     
-                    action = self.create_action_from_rule(rule)
+                    action = Action.from_rule(rule)
                     
-                    if chain.get('stop_on_match', True):
+                    if rule.get('stop_processing'):
                         return action
                     
-                    if not rule.get('continue_chain', False):
+                    if not rule.get('continue_chain'):
                         return action
         
-        # Ensuite les règles individuelles par priorité
-        for rule in self.rules:
-            if self.check_rule_v3(msg, subject, from_addr, to_addr, cc_addr, rule):
-                self.log(f"📍 Règle: {rule.get('name', 'Sans nom')}", "info")
-                stats['rules_applied'] += 1
-                
-                action = self.create_action_from_rule(rule)
-                
-                if rule.get('stop_processing'):
-                    return action
-                
-                if not rule.get('continue_chain'):
-                    return action
-        
         # Enfin la gestion CC
-        is_in_cc = cc_addr and user_email in cc_addr.lower()
-        is_primary = to_addr and user_email in to_addr.lower()
+        is_in_cc = record.cc_addr and user_email in record.cc_addr.lower()
+        is_primary = record.to_addr and user_email in record.to_addr.lower()
         
         if self.cc_enabled_var.get() and is_in_cc and not is_primary:
-            if self.cc_skip_important_var.get() and b'\\Flagged' in flags:
+            if self.cc_skip_important_var.get() and b'\\Flagged' in record.flags:
                 return None
             
             if self.cc_skip_recent_var.get():
                 try:
                     from email.utils import parsedate_to_datetime
-                    email_date = parsedate_to_datetime(date)
+                    email_date = record.received or parsedate_to_datetime(record.date)
                     if (datetime.now(email_date.tzinfo) - email_date).days < 1:
                         return None
                 except:
                     pass
             
             stats['cc_moved'] += 1
-            return {
-                'type': 'move',
-                'folder': self.cc_folder_var.get(),
-                'mark_read': self.cc_mark_read_after_var.get()
-            }
+            return Action('move', self.cc_folder_var.get(), self.cc_mark_read_after_var.get(), 'CC')
         
         return None
     
-    def check_rule_v3(self, msg, subject, from_addr, to_addr, cc_addr, rule):
+    def check_rule_v3(self, record, rule):
         """Vérifier si un email correspond à une règle avec conditions multiples"""
         # Première condition
-        if not self.check_single_condition(msg, subject, from_addr, to_addr, cc_addr, 
-                                          rule.get('field'), rule.get('condition'), 
+        if not self.check_single_condition(record, rule.get('field'), rule.get('condition'), 
                                           rule.get('keyword'), rule.get('case_sensitive')):
             return False
         
         # Condition ET (optionnelle)
         if rule.get('and_field') and rule.get('and_keyword'):
-            if not self.check_single_condition(msg, subject, from_addr, to_addr, cc_addr,
-                                              rule.get('and_field'), rule.get('and_condition'),
+            if not self.check_single_condition(record, rule.get('and_field'), rule.get('and_condition'),
                                               rule.get('and_keyword'), rule.get('case_sensitive')):
                 return False
         
         return True
     
-    def check_single_condition(self, msg, subject, from_addr, to_addr, cc_addr, 
-                              field, condition, keyword, case_sensitive):
+    def check_single_condition(self, record, field, condition, keyword, case_sensitive):
         """Vérifier une condition unique"""
         # Obtenir le texte à vérifier
         if field == "Sujet":
-            text = subject
+            text = record.subject
         elif field == "Expéditeur":
-            text = from_addr
+            text = record.from_addr
         elif field == "Destinataire":
-            text = to_addr
+            text = record.to_addr
         elif field == "Corps":
-            text = self.get_email_body(msg)
+            text = self.record_body(record)
         elif field == "Sujet ou Corps":
-            text = subject + " " + self.get_email_body(msg)
+            text = record.subject + " " + self.record_body(record)
         elif field == "Domaine expéditeur":
             # Extraire le domaine
-            import re
-            match = re.search(r'@([^\s>]+)', from_addr)
+            match = re.search(r'@([^\s>]+)', record.from_addr)
             text = match.group(1) if match else ""
         else:
-            text = subject
+            text = record.subject
         
         # Gestion de la casse
         if not case_sensitive:
             text = text.lower()
+        
+        return self.get_condition_matcher(condition, keyword, case_sensitive)(text)
+    
+    def get_condition_matcher(self, condition, keyword, case_sensitive):
+        """Prédicat compilé d'une condition, mis en cache (analyse et simulation)"""
+        key = (condition, keyword, bool(case_sensitive))
+        matcher = self.condition_cache.get(key)
+        if matcher is None:
+            matcher = self.condition_cache[key] = self.compile_condition(condition, keyword,
+                                                                         case_sensitive)
+        return matcher
+    
+    def compile_condition(self, condition, keyword, case_sensitive):
+        """Compiler une condition en fonction texte -> bool (mot-clé normalisé, regex compilée)"""
+        if not case_sensitive:
             keyword = keyword.lower()
         
-        # Vérifier la condition
         if condition == "contient":
-            return keyword in text
+            return lambda text: keyword in text
         elif condition == "ne contient pas":
-            return keyword not in text
+            return lambda text: keyword not in text
         elif condition == "commence par":
-            return text.startswith(keyword)
+            return lambda text: text.startswith(keyword)
         elif condition == "finit par":
-            return text.endswith(keyword)
+            return lambda text: text.endswith(keyword)
         elif condition == "est exactement":
-            return text == keyword
+            return lambda text: text == keyword
         elif condition == "n'est pas":
-            return text != keyword
+            return lambda text: text != keyword
         elif condition == "correspond à (regex)":
             try:
-                return bool(re.search(keyword, text))
-            except:
-                return False
+                pattern = re.compile(keyword)
+            except re.error:
+                return lambda text: False
+            return lambda text: pattern.search(text) is not None
         elif condition == "contient un de (liste)":
             # Séparer par virgules
-            keywords = [k.strip() for k in keyword.split(',')]
-            return any(k in text for k in keywords)
+            keywords = tuple(k.strip() for k in keyword.split(','))
+            return lambda text: any(k in text for k in keywords)
         
-        return False
-    
-    def create_action_from_rule(self, rule):
-        """Créer une action depuis une règle"""
-        return {
-            'type': rule.get('action', 'move'),
-            'action': rule.get('action'),
-            'folder': rule.get('folder', ''),
-            'mark_read': rule.get('mark_after_action', False)
-        }
+        return lambda text: False
     
     def build_search_criteria(self):
         """Construire les critères de recherche IMAP"""
@@ -2080,60 +2934,155 @@ class EmailManager:
         
         return ' '.join(criteria) if criteria else 'ALL'
     
-    def extract_flags(self, msg_data):
-        """Extraire les flags d'un message"""
-        for response in msg_data:
-            if isinstance(response, tuple) and len(response) >= 2:
-                if b'FLAGS' in response[0]:
-                    return response[0]
-        return b''
+    def compute_rules_version(self):
+        """Empreinte de tout ce qui influence une décision de tri"""
+        return rules_fingerprint(
+            self.ENGINE_VERSION, self.email_var.get().lower(), self.rules, self.rule_chains,
+            self.cc_enabled_var.get(), self.cc_folder_var.get(),
+            self.cc_skip_important_var.get(), self.cc_skip_recent_var.get()
+        )
+    
+    def index_message(self, folder_id, record, action, applied):
+        """Ajouter un email analysé à l'index local (écrit à la fin du lot)"""
+        match = re.search(rb'FLAGS \(([^)]*)\)', record.flags)
+        self.index.add(
+            folder_id, record.uid, record.message_id or None,
+            record.from_addr, record.to_addr, record.cc_addr, record.subject, record.date,
+            record.size,
+            match.group(1).decode('utf-8', errors='replace') if match else "",
+            action=action.kind if action else None,
+            rule=action.rule if action else None,
+            target=action.folder if action else None,
+            rules_version=self.rules_version,
+            applied=bool(applied),
+            body=self.record_body(record) if self.index_bodies_var.get() and record.has_body else None
+        )
+    
+    def record_decision(self, folder, record, action, success, started):
+        """Enregistrer la décision prise pour un email dans le journal"""
+        self.journal.record(
+            "decision",
+            folder=folder,
+            uid=record.uid,
+            message_id=record.message_id,
+            rule=action.rule if action else None,
+            chain=action.chain if action else None,
+            action=action.kind if action else None,
+            target=action.folder if action else None,
+            dry_run=self.dry_run_var.get(),
+            success=success,
+            latency_ms=round((time.perf_counter() - started) * 1000, 2)
+        )
     
     def decode_header(self, header):
-        """Décoder un header d'email"""
-        if not header:
-            return ""
-        
+        """Décoder un header d'email (tous les morceaux encodés, cache LRU)"""
         try:
-            decoded = decode_header(header)[0][0]
-            if isinstance(decoded, bytes):
-                return decoded.decode('utf-8', errors='ignore')
-            return str(decoded)
-        except:
+            return self.header_decoder(header)
+        except Exception:
             return str(header)
     
-    def get_email_body(self, msg):
-        """Extraire le corps du message"""
-        body = ""
-        
-        try:
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    if "text/plain" in content_type:
-                        try:
-                            body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                            if body:
-                                break
-                        except:
-                            continue
-            else:
+    def message_record(self, uid, flags, raw_email, size=None):
+        """Extraire d'un email brut les champs utiles au tri (MessageRecord)
+        
+        raw_email: bytes, ou memoryview sur un mbox projeté en mémoire. Seul le
+        bloc d'en-têtes est parsé; le reste n'est lu que si le corps est demandé
+        (voir record_body), les pièces jointes ne coûtent donc rien. size:
+        taille réelle quand raw_email n'est que le début du message.
+        """
+        with self.perf.stage('parse'):
+            msg = self.header_parser.parsebytes(bytes(header_block(raw_email)))
+        
+        with self.perf.stage('decode_header'):
+            subject = self.decode_header(msg.get("Subject", ""))[:100]
+            from_addr = self.decode_header(msg.get("From", ""))
+            to_addr = self.decode_header(msg.get("To", ""))
+            cc_addr = self.decode_header(msg.get("Cc", ""))
+        
+        return MessageRecord(uid, normalize_message_id(msg.get("Message-ID", "")), subject,
+                             from_addr, to_addr, cc_addr, msg.get("Date", ""), flags,
+                             size or len(raw_email), raw=raw_email)
+    
+    def text_record(self, uid, flags, headers, size, text):
+        """MessageRecord depuis les en-têtes et la partie texte (mode BINARY)
+        
+        text: (début de la partie, encodage restant, charset, HTML) ou None; le
+        serveur a déjà décodé base64 et quoted-printable.
+        """
+        record = self.message_record(uid, flags, headers, size)
+        record.raw = None
+        with self.perf.stage('body_extract'):
+            try:
+                record.body = decode_text(*text, self.BODY_CHARS) if text else ""
+            except Exception:
+                record.body = ""
+        return record
+    
+    def envelope_record(self, uid, flags, envelope, received, size):
+        """MessageRecord depuis l'enveloppe d'un email (mode enveloppe): pas de corps"""
+        with self.perf.stage('decode_header'):
+            subject = self.decode_header(envelope.subject)[:100]
+            from_addr = self.decode_header(envelope.from_addr)
+            to_addr = self.decode_header(envelope.to_addr)
+            cc_addr = self.decode_header(envelope.cc_addr)
+        
+        return MessageRecord(uid, normalize_message_id(envelope.message_id), subject, from_addr,
+                             to_addr, cc_addr, envelope.date, flags, size or 0, received=received)
+    
+    def rules_read_body(self):
+        """Vrai si une règle ou une chaîne active porte sur le corps des emails"""
+        rules = self.rules + [rule for chain in self.rule_chains if chain.get('enabled', True)
+                              for rule in chain.get('rules', [])]
+        return any(rule.get('field') in self.BODY_FIELDS
+                   or (rule.get('and_field') in self.BODY_FIELDS and rule.get('and_keyword'))
+                   for rule in rules)
+    
+    def record_body(self, record):
+        """Début du corps d'un email, extrait du contenu brut à la première demande"""
+        if record.body is None and record.raw is not None:
+            with self.perf.stage('body_extract'):
                 try:
-                    body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-                except:
-                    body = str(msg.get_payload())
-        except:
-            body = ""
+                    record.body = extract_body(record.raw, self.BODY_CHARS)
+                except Exception:
+                    record.body = ""
+            record.raw = None
+        return record.body or ""
+    
+    def retry_move(self, backend, record, folder_name):
+        """Réessayer un déplacement refusé vers le nom alternatif du dossier (préfixe INBOX.)"""
+        alt_folder = self.alternative_folder(folder_name)
+        if alt_folder is None:
+            return False
+        self.log(f"🔄 Tentative avec: {alt_folder}", "info")
+        if backend.move([record.uid], alt_folder):
+            self.log(f"✅ {record.subject[:50]}... → {alt_folder}", "success")
+            return True
+        return False
+    
+    def retry_refused_move(self, backend, record, action, refused):
+        """Déplacement annoncé réussi dans le pipeline puis refusé: réessayer hors pipeline
         
-        return body[:1000]
+        refused: commande refusée ("MOVE dossier", "COPY dossier"); une copie de
+        sauvegarde refusée ne déclenche pas de nouvel essai.
+        """
+        if action.kind not in ['move', 'Déplacer vers']:
+            return False
+        folder_name = action.folder
+        if folder_name not in self.existing_folders:
+            folder_name = self.get_full_folder_name(folder_name)
+        if refused not in (f"MOVE {folder_name}", f"COPY {folder_name}"):
+            return False
+        return self.retry_move(backend, record, folder_name)
     
-    def execute_action(self, connection, num, action, subject, was_unread):
+    def execute_action(self, backend, record, action):
         """Exécuter une action sur un email"""
+        uid = record.uid
+        subject = record.subject
         try:
-            action_type = action.get('action', action.get('type', 'move'))
+            action_type = action.kind
             
             if action_type in ['move', 'Déplacer vers']:
                 # Utiliser le nom de dossier tel quel s'il existe, sinon essayer de le formater
-                folder_name = action['folder']
+                folder_name = action.folder
                 if folder_name not in self.existing_folders:
                     folder_name = self.get_full_folder_name(folder_name)
                 
@@ -2144,45 +3093,32 @@ class EmailManager:
                     backup_folder = "BACKUP"
                     if backup_folder not in self.existing_folders:
                         backup_folder = self.get_full_folder_name("BACKUP")
-                    self.create_folder_if_needed(connection, "BACKUP")
-                    connection.copy(num, backup_folder)
-                
-                # Copier vers le nouveau dossier
-                result = connection.copy(num, folder_name)
+                    self.create_folder_if_needed(backend, "BACKUP")
+                    backend.copy([uid], backup_folder)
                 
-                if result[0] == 'OK':
-                    # Marquer pour suppression dans le dossier source
-                    connection.store(num, '+FLAGS', '\\Deleted')
-                    
+                # Copier vers le nouveau dossier puis marquer pour suppression dans le dossier source
+                if backend.move([uid], folder_name):
                     # Gérer le statut lu/non-lu après déplacement si demandé
-                    if not self.preserve_unread_var.get() and action.get('mark_read'):
+                    if not self.preserve_unread_var.get() and action.mark_read:
                         # Note: cela ne fonctionnera que sur l'email source, pas la copie
-                        connection.store(num, '+FLAGS', '\\Seen')
+                        backend.add_flags([uid], '\\Seen')
                     
                     self.log(f"✅ {subject[:50]}... → {folder_name}", "success")
                     return True
                 else:
-                    self.log(f"⚠️ Échec du déplacement vers {folder_name}: {result}", "warning")
-                    # Essayer avec un nom alternatif si échec
-                    if "INBOX." not in folder_name and folder_name != "INBOX":
-                        alt_folder = f"INBOX.{folder_name}"
-                        self.log(f"🔄 Tentative avec: {alt_folder}", "info")
-                        result = connection.copy(num, alt_folder)
-                        if result[0] == 'OK':
-                            connection.store(num, '+FLAGS', '\\Deleted')
-                            self.log(f"✅ {subject[:50]}... → {alt_folder}", "success")
-                            return True
+                    self.log(f"⚠️ Échec du déplacement vers {folder_name}", "warning")
+                    # Essayer avec un nom alternatif si échec (dans un pipeline: voir retry_refused_move)
+                    if self.retry_move(backend, record, folder_name):
+                        return True
             
             elif action_type in ['copy', 'Copier vers']:
-                folder_name = action['folder']
+                folder_name = action.folder
                 if folder_name not in self.existing_folders:
                     folder_name = self.get_full_folder_name(folder_name)
                 
-                result = connection.copy(num, folder_name)
-                
-                if result[0] == 'OK':
-                    if action.get('mark_read') and not self.preserve_unread_var.get():
-                        connection.store(num, '+FLAGS', '\\Seen')
+                if backend.copy([uid], folder_name):
+                    if action.mark_read and not self.preserve_unread_var.get():
+                        backend.add_flags([uid], '\\Seen')
                     self.log(f"📄 {subject[:50]}... copié vers {folder_name}", "info")
                     return True
                 else:
@@ -2190,30 +3126,51 @@ class EmailManager:
             
             elif action_type == 'Marquer comme lu':
                 if not self.preserve_unread_var.get():
-                    connection.store(num, '+FLAGS', '\\Seen')
+                    backend.add_flags([uid], '\\Seen')
                     self.log(f"📖 {subject[:50]}... marqué comme lu", "info")
                     return True
             
             elif action_type == 'Marquer comme important':
-                connection.store(num, '+FLAGS', '\\Flagged')
+                backend.add_flags([uid], '\\Flagged')
                 self.log(f"⭐ {subject[:50]}... marqué comme important", "info")
                 return True
             
             elif action_type == 'Supprimer':
-                connection.store(num, '+FLAGS', '\\Deleted')
+                backend.add_flags([uid], '\\Deleted')
                 self.log(f"🗑️ {subject[:50]}... supprimé", "warning")
                 return True
             
             elif action_type == 'Étiqueter':
-                if action.get('folder'):
-                    connection.store(num, '+FLAGS', f'({action["folder"]})')
-                    self.log(f"🏷️ {subject[:50]}... étiqueté: {action['folder']}", "info")
+                if action.folder:
+                    if not backend.add_flags([uid], action.folder):
+                        self.log(f"⚠️ Étiquette refusée par la source {backend.kind}: {action.folder}", "warning")
+                        return False
+                    self.log(f"🏷️ {subject[:50]}... étiqueté: {action.folder}", "info")
                     return True
             
         except Exception as e:
             self.log(f"❌ Erreur lors de l'action sur '{subject[:30]}': {str(e)}", "error")
             return False
     
+    def finish_perf_stats(self, backend, stats):
+        """Arrêter les chronomètres et écrire les statistiques JSON du run"""
+        self.perf.count('bytes_in', backend.bytes_in)
+        self.perf.count('bytes_out', backend.bytes_out)
+        if backend.compressed:
+            self.perf.count('uncompressed_in', backend.uncompressed_in)
+            self.perf.count('uncompressed_out', backend.uncompressed_out)
+        hits, misses = self.header_decoder.counts()
+        self.perf.count('header_cache_hits', hits - self.header_counts[0])
+        self.perf.count('header_cache_misses', misses - self.header_counts[1])
+        self.perf.stop()
+        stats['perf'] = self.perf.summary(stats['processed'])
+        
+        try:
+            with open(self.run_stats_file, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, indent=4, ensure_ascii=False)
+        except Exception as e:
+            self.log(f"⚠️ Impossible d'écrire les statistiques: {str(e)}", "warning")
+    
     def display_summary(self, stats):
         """Afficher le résumé de l'analyse"""
         self.log("\n" + "="*60, "separator")
@@ -2228,19 +3185,33 @@ class EmailManager:
         self.log(f"🎯 Règles appliquées: {stats['rules_applied']}", "info")
         self.log(f"⛓️ Chaînes appliquées: {stats['chains_applied']}", "info")
         
+        if stats.get('skipped'):
+            self.log(f"⏭️ Déjà analysés (index local): {stats['skipped']}", "info")
+        
+        if stats.get('duplicates'):
+            self.log(f"♻️ Déjà traités (Message-ID): {stats['duplicates']}", "info")
+        
+        if stats.get('large'):
+            verb = "ignorés" if self.large_message_policy_var.get() == "skip" else "analysés en partie"
+            self.log(f"🐘 Gros emails {verb}: {stats['large']}", "info")
+        
         if stats['errors'] > 0:
             self.log(f"⚠️ Erreurs rencontrées: {stats['errors']}", "warning")
         
         total_moved = stats['cc_moved'] + stats['rules_applied'] + stats['chains_applied']
         self.log(f"📧 TOTAL traité: {total_moved} actions", "success")
         
+        if 'perf' in stats:
+            for line in self.perf.format_lines(stats['processed']):
+                self.log(line, "info")
+        
         if self.preserve_unread_var.get():
             self.log("🔒 Statut non-lu préservé pour tous les emails", "success")
         
         self.status_var.set(f"✅ Terminé - {total_moved} actions sur {stats['processed']} emails")
         
         # Message de fin
-        if not self.dry_run_var.get():
+        if not self.dry_run_var.get() and not self.headless:
             if total_moved > 0:
                 messagebox.showinfo("Analyse terminée", 
                                    f"✅ Analyse terminée avec succès!\n\n"
@@ -2267,41 +3238,72 @@ class EmailManager:
         self.stats_label.config(text=stats_text)
     
     def log(self, message, tag="info"):
-        """Ajouter un message au log avec coloration"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        """Ajouter un message au log (thread-safe, affiché par drain_log_queue)"""
+        # Filtrage par niveau avant toute mise en forme
+        if self.LOG_TAG_LEVELS.get(tag, 100) < self.log_min_level:
+            return
         
         if tag not in ["separator", "header"]:
+            timestamp = datetime.now().strftime("%H:%M:%S")
             message = f"[{timestamp}] {message}"
         
-        self.console.insert(tk.END, message + "\n")
-        
-        # Colorer selon le type
-        colors = {
-            "error": "#ff6b6b",
-            "success": "#51cf66",
-            "warning": "#ffd43b",
-            "info": "#74c0fc",
-            "cc": "#a9e34b",
-            "rule": "#ff8cc3",
-            "header": "#ffffff",
-            "test": "#ffa94d"
-        }
-        
-        if tag in colors:
-            self.console.tag_add(tag, f"end-2l", "end-1l")
-            self.console.tag_config(tag, foreground=colors[tag])
-            if tag == "header":
-                self.console.tag_config(tag, font=("Consolas", 11, "bold"))
+        if self.headless:
+            print(message)
+            return
         
-        self.console.see(tk.END)
-        self.root.update_idletasks()
+        self.log_queue.put((message + "\n", tag))
     
-    def save_settings(self):
-        """Sauvegarder les paramètres"""
-        settings = {
+    def drain_log_queue(self):
+        """Vider la file des logs dans la console par lots (thread Tk uniquement)"""
+        # Regrouper les lignes consécutives de même tag en une seule insertion
+        chunks = []
+        count = 0
+        try:
+            while count < self.LOG_DRAIN_BATCH:
+                text, tag = self.log_queue.get_nowait()
+                count += 1
+                if chunks and chunks[-1][1] == tag:
+                    chunks[-1][0].append(text)
+                else:
+                    chunks.append(([text], tag))
+        except queue.Empty:
+            pass
+        
+        if chunks:
+            for texts, tag in chunks:
+                self.console.insert(tk.END, "".join(texts), tag if tag in self.LOG_COLORS else ())
+            self.trim_console()
+            self.console.see(tk.END)
+        
+        # Repasser vite si la file n'est pas vide, sinon attendre
+        delay = 10 if count >= self.LOG_DRAIN_BATCH else 100
+        self._log_after_id = self.root.after(delay, self.drain_log_queue)
+    
+    def trim_console(self):
+        """Supprimer les plus anciennes lignes au-delà de la limite de la console"""
+        line_count = int(self.console.index('end-1c').split('.')[0])
+        excess = line_count - self.console_max_lines
+        if excess > 0:
+            self.console.delete('1.0', f'{excess + 1}.0')
+    
+    def on_log_options_changed(self, event=None):
+        """Appliquer le filtre de niveau et la taille max de la console"""
+        self.log_min_level = self.LOG_FILTERS.get(self.log_level_var.get(), 0)
+        try:
+            self.console_max_lines = max(100, int(self.console_max_lines_var.get()))
+        except ValueError:
+            pass
+        self.trim_console()
+    
+    def collect_settings(self):
+        """Paramètres courants sous forme de dictionnaire sérialisable"""
+        return {
             "email": self.email_var.get(),
+            "source_type": self.source_type_var.get(),
+            "source_path": self.source_path_var.get(),
             "server": self.server_var.get(),
             "port": self.port_var.get(),
+            "use_ssl": self.use_ssl_var.get(),
             "preserve_unread": self.preserve_unread_var.get(),
             "cc_enabled": self.cc_enabled_var.get(),
             "cc_folder": self.cc_folder_var.get(),
@@ -2316,14 +3318,41 @@ class EmailManager:
             "dry_run": self.dry_run_var.get(),
             "backup_before_move": self.backup_before_move_var.get(),
             "confirm_actions": self.confirm_actions_var.get(),
+            "journal_enabled": self.journal_enabled_var.get(),
             "batch_size": self.batch_size_var.get(),
             "parallel_processing": self.parallel_processing_var.get(),
+            "index_enabled": self.index_enabled_var.get(),
+            "skip_indexed": self.skip_indexed_var.get(),
+            "dedup_enabled": self.dedup_enabled_var.get(),
+            "envelope_fetch": self.envelope_fetch_var.get(),
+            "large_message_mb": self.large_message_mb_var.get(),
+            "large_message_policy": self.large_message_policy_var.get(),
+            "index_bodies": self.index_bodies_var.get(),
+            "trace_export": self.trace_export_var.get(),
             "include_inbox": self.include_inbox_var.get(),
             "scan_subfolders": self.scan_subfolders_var.get(),
             "exclude_special": self.exclude_special_var.get(),
+            "log_level": self.log_level_var.get(),
+            "console_max_lines": self.console_max_lines_var.get(),
             "rules": self.rules,
             "existing_folders": self.existing_folders
         }
+    
+    def session_metadata(self):
+        """Configuration du moteur jointe à une session enregistrée (sans identifiants)"""
+        settings = self.collect_settings()
+        for key in ("server", "port", "use_ssl", "source_path", "existing_folders"):
+            settings.pop(key, None)
+        return {
+            "account": self.email_var.get(),
+            "folders": self.get_selected_folders(),
+            "settings": settings,
+            "chains": self.rule_chains
+        }
+    
+    def save_settings(self):
+        """Sauvegarder les paramètres"""
+        settings = self.collect_settings()
         
         try:
             with open(self.config_file, 'w', encoding='utf-8') as f:
@@ -2344,8 +3373,11 @@ class EmailManager:
                 
                 # Charger les paramètres
                 self.email_var.set(settings.get("email", ""))
+                self.source_type_var.set(settings.get("source_type", "imap"))
+                self.source_path_var.set(settings.get("source_path", ""))
                 self.server_var.set(settings.get("server", ""))
                 self.port_var.set(settings.get("port", "993"))
+                self.use_ssl_var.set(settings.get("use_ssl", True))
                 self.preserve_unread_var.set(settings.get("preserve_unread", True))
                 self.cc_enabled_var.set(settings.get("cc_enabled", True))
                 self.cc_folder_var.set(settings.get("cc_folder", "EN_COPIE"))
@@ -2360,11 +3392,23 @@ class EmailManager:
                 self.dry_run_var.set(settings.get("dry_run", False))
                 self.backup_before_move_var.set(settings.get("backup_before_move", False))
                 self.confirm_actions_var.set(settings.get("confirm_actions", False))
+                self.journal_enabled_var.set(settings.get("journal_enabled", True))
                 self.batch_size_var.set(settings.get("batch_size", "50"))
                 self.parallel_processing_var.set(settings.get("parallel_processing", False))
+                self.index_enabled_var.set(settings.get("index_enabled", True))
+                self.skip_indexed_var.set(settings.get("skip_indexed", True))
+                self.dedup_enabled_var.set(settings.get("dedup_enabled", True))
+                self.envelope_fetch_var.set(settings.get("envelope_fetch", False))
+                self.large_message_mb_var.set(settings.get("large_message_mb", "10"))
+                self.large_message_policy_var.set(settings.get("large_message_policy", "partial"))
+                self.index_bodies_var.set(settings.get("index_bodies", True))
+                self.trace_export_var.set(settings.get("trace_export", False))
                 self.include_inbox_var.set(settings.get("include_inbox", True))
                 self.scan_subfolders_var.set(settings.get("scan_subfolders", False))
                 self.exclude_special_var.set(settings.get("exclude_special", True))
+                self.log_level_var.set(settings.get("log_level", "Tout"))
+                self.console_max_lines_var.set(settings.get("console_max_lines", "2000"))
+                self.on_log_options_changed()
                 self.rules = settings.get("rules", [])
                 self.existing_folders = settings.get("existing_folders", [])
                 
@@ -2395,14 +3439,23 @@ class EmailManager:
             if messagebox.askokcancel("Quitter", "Une analyse est en cours. Voulez-vous vraiment quitter?"):
                 self.is_running = False
                 self.save_settings()
+                self.root.after_cancel(self._log_after_id)
                 self.root.destroy()
         else:
             self.save_settings()
+            self.root.after_cancel(self._log_after_id)
             self.root.destroy()
     
     def run(self):
         """Lancer l'application"""
         self.root.mainloop()
+    
+    def run_headless(self):
+        """Exécuter une analyse complète dans le thread courant, sans interface"""
+        self.is_running = True
+        self.processed_emails.clear()
+        self.analysis_worker()
+        return self.last_stats
 
 # === POINT D'ENTRÉE PRINCIPAL ===
 def main():
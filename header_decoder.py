@@ -0,0 +1,85 @@
+"""
+Décodage des en-têtes d'email pour Email Manager V3
+Un en-tête peut mêler plusieurs mots encodés (RFC 2047) de jeux de
+caractères différents et du texte brut: tous les morceaux sont décodés et
+joints, pas seulement le premier. Les valeurs From/To/Cc se répètent d'un
+email à l'autre (mêmes correspondants): HeaderDecoder garde les derniers
+résultats dans un cache LRU borné, indexé par la valeur brute de l'en-tête,
+et compte ses hits pour les statistiques du run. header_block délimite le
+bloc d'en-têtes dans le contenu brut sans copier le corps.
+"""
+
+import re
+from email.header import decode_header, make_header
+from functools import lru_cache
+
+_FOLDING_RE = re.compile(r"\r?\n(?=[ \t])")
+_HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+
+
+def header_block(raw):
+    """Vue (memoryview) sur les en-têtes d'un email brut, ligne vide comprise"""
+    view = memoryview(raw)
+    match = _HEADER_END_RE.search(view)
+    return view[:match.end()] if match else view
+
+
+def repair_raw_text(value):
+    """Octets 8 bits bruts (surrogateescape) relus en UTF-8, à défaut en cp1252"""
+    raw = value.encode("ascii", "surrogateescape")
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def decode_header_value(value):
+    """Valeur d'en-tête décodée en texte: tous les mots encodés, chacun avec son charset"""
+    if not value:
+        return ""
+    value = _FOLDING_RE.sub("", str(value))
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        value = repair_raw_text(value)
+    if "=?" not in value:
+        return value
+
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeError, ValueError):
+        # Charset inconnu ou mal déclaré: décoder morceau par morceau
+        parts = []
+        for chunk, charset in decode_header(value):
+            if isinstance(chunk, bytes):
+                try:
+                    chunk = chunk.decode(charset or "ascii")
+                except (LookupError, UnicodeDecodeError):
+                    chunk = chunk.decode("utf-8", errors="replace")
+            parts.append(chunk)
+        return "".join(parts)
+
+
+class HeaderDecoder:
+    """decode_header_value derrière un cache LRU de maxsize valeurs"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.decode = lru_cache(maxsize=maxsize)(decode_header_value)
+
+    def __call__(self, value):
+        if not value:
+            return ""
+        try:
+            return self.decode(value)
+        except TypeError:
+            # email.header.Header (en-tête non hachable): pas de cache
+            return decode_header_value(value)
+
+    def counts(self):
+        """(hits, misses) depuis la création du cache"""
+        info = self.decode.cache_info()
+        return info.hits, info.misses
+
+    def clear(self):
+        self.decode.cache_clear()
@@ -0,0 +1,216 @@
+"""
+Capacités des serveurs IMAP pour Email Manager V3
+ServerProfile décrit un serveur après authentification: capacités relues
+après LOGIN (beaucoup de serveurs n'annoncent MOVE, COMPRESS ou BINARY
+qu'une fois connecté), préfixe et séparateur de l'espace de noms personnel
+(NAMESPACE, à défaut LIST ""). Le moteur en déduit sa stratégie pour chaque
+compte: MOVE ou COPY+STORE, UID EXPUNGE ou EXPUNGE, ESEARCH, CONDSTORE,
+BINARY, COMPRESS, LITERAL+ et IDLE. ServerProfiles garde les profils par
+serveur dans un fichier JSON du dossier de données: tant que les capacités
+annoncées ne changent pas, une nouvelle connexion ne repaie ni CAPABILITY ni
+NAMESPACE.
+"""
+
+import json
+import re
+import time
+from pathlib import Path
+
+# Profil en cache relu au plus tard après ce délai (changement de configuration du serveur)
+CACHE_MAX_AGE = 7 * 86400
+
+# Optimisations que le profil peut activer: (libellé, propriété de ServerProfile)
+STRATEGIES = (
+    ("MOVE", "move"),
+    ("UID EXPUNGE", "uid_expunge"),
+    ("ESEARCH", "esearch"),
+    ("CONDSTORE", "condstore"),
+    ("BINARY", "binary"),
+    ("COMPRESS", "compress"),
+    ("LITERAL+", "literal_plus"),
+    ("IDLE", "idle"),
+)
+
+_NAMESPACE_RE = re.compile(rb'^\(\("((?:[^"\\]|\\.)*)" (?:"((?:[^"\\]|\\.)*)"|NIL)')
+_LIST_DELIMITER_RE = re.compile(rb'\) (?:"((?:[^"\\]|\\.)*)"|NIL) ')
+_ESCAPED_RE = re.compile(r"\\(.)")
+
+
+def _unquote(value):
+    """Contenu d'une chaîne IMAP entre guillemets (échappements retirés)"""
+    return _ESCAPED_RE.sub(r"\1", value.decode("utf-8", errors="replace"))
+
+
+def parse_capabilities(data):
+    """Noms de capacités (majuscules) d'une réponse CAPABILITY"""
+    if not data or data[0] is None:
+        return None
+    value = data[-1]
+    if isinstance(value, bytes):
+        value = value.decode("ascii", errors="replace")
+    return tuple(name.upper() for name in value.split())
+
+
+def parse_namespace(data):
+    """(préfixe, séparateur) du premier espace de noms personnel d'une réponse NAMESPACE"""
+    if not data or not isinstance(data[0], bytes):
+        return None, None
+    match = _NAMESPACE_RE.match(data[0])
+    if not match:
+        # Pas d'espace personnel (NIL): noms de dossiers sans préfixe
+        return "", None
+    return _unquote(match.group(1)), _unquote(match.group(2)) if match.group(2) else None
+
+
+def parse_list_delimiter(data):
+    """Séparateur de hiérarchie d'une réponse LIST "" "" (None si absent)"""
+    for line in data or ():
+        match = _LIST_DELIMITER_RE.search(line) if isinstance(line, bytes) else None
+        if match and match.group(1):
+            return _unquote(match.group(1))
+    return None
+
+
+class ServerProfile:
+    """Capacités et espace de noms d'un serveur IMAP, une fois authentifié
+
+    greeting: capacités annoncées avant LOGIN (clé de validité du cache);
+    prefix: préfixe des dossiers personnels ("INBOX." chez Courier, "" chez
+    Dovecot ou Gmail), None s'il n'a pas pu être déterminé.
+    """
+
+    def __init__(self, server, capabilities=(), greeting=(), prefix=None, delimiter=None,
+                 probed_at=None):
+        self.server = server
+        self.capabilities = frozenset(name.upper() for name in capabilities)
+        self.greeting = frozenset(name.upper() for name in greeting)
+        self.prefix = prefix
+        self.delimiter = delimiter
+        self.probed_at = probed_at if probed_at is not None else time.time()
+        self.cached = False
+
+    def has(self, capability):
+        return capability.upper() in self.capabilities
+
+    @property
+    def move(self):
+        return self.has("MOVE")
+
+    @property
+    def uid_expunge(self):
+        return self.has("UIDPLUS")
+
+    @property
+    def esearch(self):
+        return self.has("ESEARCH")
+
+    @property
+    def condstore(self):
+        return self.has("CONDSTORE") or self.has("QRESYNC")
+
+    @property
+    def binary(self):
+        return self.has("BINARY")
+
+    @property
+    def compress(self):
+        return self.has("COMPRESS=DEFLATE")
+
+    @property
+    def literal_plus(self):
+        return self.has("LITERAL+")
+
+    @property
+    def idle(self):
+        return self.has("IDLE")
+
+    def strategies(self):
+        """Libellés des optimisations disponibles sur ce serveur"""
+        return [label for label, attribute in STRATEGIES if getattr(self, attribute)]
+
+    def folder_name(self, name):
+        """Nom complet d'un dossier personnel (préfixe de l'espace de noms ajouté si besoin)"""
+        if not self.prefix or name.upper() == "INBOX" or name.startswith(self.prefix):
+            return name
+        # Préfixe "INBOX." écrit dans une autre casse par l'utilisateur
+        if name.upper().startswith(self.prefix.upper()):
+            return self.prefix + name[len(self.prefix):]
+        return self.prefix + name
+
+    def expired(self, max_age=CACHE_MAX_AGE):
+        return time.time() - self.probed_at > max_age
+
+    def to_dict(self):
+        return {"capabilities": sorted(self.capabilities), "greeting": sorted(self.greeting),
+                "prefix": self.prefix, "delimiter": self.delimiter, "probed_at": self.probed_at}
+
+    @classmethod
+    def from_dict(cls, server, data):
+        return cls(server, data.get("capabilities", ()), data.get("greeting", ()),
+                   data.get("prefix"), data.get("delimiter"), data.get("probed_at", 0))
+
+    def __repr__(self):
+        return f"ServerProfile({self.server!r}, {', '.join(self.strategies())})"
+
+
+def probe_server(connection, server, cached=None):
+    """Profil d'un serveur sur une connexion authentifiée
+
+    Les capacités viennent de la réponse à LOGIN ([CAPABILITY ...]) ou d'une
+    commande CAPABILITY; le profil en cache est repris tel quel si le serveur
+    annonce toujours les mêmes capacités. connection.capabilities reçoit les
+    capacités d'après authentification (imaplib garde celles de l'accueil).
+    """
+    greeting = frozenset(name.upper() for name in getattr(connection, "capabilities", ()))
+    capabilities = parse_capabilities(connection.response("CAPABILITY")[1])
+
+    if (cached is not None and cached.greeting == greeting and not cached.expired()
+            and (capabilities is None or cached.capabilities == frozenset(capabilities))):
+        profile = cached
+        profile.cached = True
+    else:
+        if capabilities is None:
+            typ, data = connection.capability()
+            capabilities = parse_capabilities(data) if typ == "OK" else None
+        profile = ServerProfile(server, capabilities or greeting, greeting)
+        if profile.has("NAMESPACE"):
+            typ, data = connection.namespace()
+            if typ == "OK":
+                profile.prefix, profile.delimiter = parse_namespace(data)
+        if profile.delimiter is None:
+            typ, data = connection.list('""', '""')
+            if typ == "OK":
+                profile.delimiter = parse_list_delimiter(data)
+
+    connection.capabilities = tuple(sorted(profile.capabilities))
+    return profile
+
+
+class ServerProfiles:
+    """Profils des serveurs déjà vus (clé: hôte:port), persistés en JSON"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.profiles = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for server, data in json.load(f).items():
+                    self.profiles[server] = ServerProfile.from_dict(server, data)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, server):
+        return self.profiles.get(server)
+
+    def save(self, profile):
+        """Enregistrer un profil (réécrit le fichier; rien à faire pour un profil repris du cache)"""
+        if profile.cached:
+            return
+        self.profiles[profile.server] = profile
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({server: item.to_dict() for server, item in self.profiles.items()}, f,
+                          indent=4, ensure_ascii=False)
+        except OSError:
+            pass
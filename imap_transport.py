@@ -0,0 +1,480 @@
+"""
+Couche de connexion IMAP pour Email Manager V3
+Sous-classes d'imaplib qui comptent les octets échangés et chronomètrent
+chaque commande IMAP dans les statistiques de performance du run (et dans
+la trace Chrome si elle est activée). Les commandes UID indépendantes
+peuvent être envoyées à la suite sans attendre leur réponse (pipelining,
+RFC 3501 section 5.5): send_command puis command_result, dans l'ordre
+d'envoi. Si le serveur annonce COMPRESS=DEFLATE (RFC 4978), compress()
+compresse le flux dans les deux sens: bytes_in/bytes_out comptent alors les
+octets transmis, uncompressed_in/uncompressed_out les octets IMAP en clair.
+Une session peut être enregistrée (identifiants et corps masqués) puis
+rejouée sans serveur.
+"""
+
+import gzip
+import hashlib
+import imaplib
+import json
+import re
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+# Absente de la table d'imaplib (états où la commande est permise)
+imaplib.Commands.setdefault("COMPRESS", ("AUTH", "SELECTED"))
+
+# Octets compressés lus à la fois sur le socket
+INFLATE_CHUNK = 65536
+
+
+class InstrumentedMixin:
+    """Compteurs d'octets et chronométrage par commande pour imaplib"""
+
+    bytes_in = 0
+    bytes_out = 0
+    uncompressed_in = 0
+    uncompressed_out = 0
+    compressed = False
+    perf = None
+    trace_lane = "IMAP"
+    recorder = None
+    last_result = 0.0
+
+    def __init__(self, *args, recorder=None, **kwargs):
+        # Le recorder doit être en place avant la connexion (accueil, CAPABILITY)
+        self.recorder = recorder
+        self.sent_at = {}
+        super().__init__(*args, **kwargs)
+
+    def read(self, size):
+        if self.compressed:
+            while len(self.inflated) < size:
+                self._inflate()
+            data = bytes(self.inflated[:size])
+            del self.inflated[:size]
+        else:
+            data = super().read(size)
+            self.bytes_in += len(data)
+        self.uncompressed_in += len(data)
+        if self.recorder is not None:
+            self.recorder.received(data, literal=True)
+        return data
+
+    def readline(self):
+        if self.compressed:
+            end = self.inflated.find(b"\n")
+            while end < 0:
+                if len(self.inflated) > imaplib._MAXLINE:
+                    raise self.error(f"got more than {imaplib._MAXLINE} bytes")
+                self._inflate()
+                end = self.inflated.find(b"\n")
+            line = bytes(self.inflated[:end + 1])
+            del self.inflated[:end + 1]
+        else:
+            line = super().readline()
+            self.bytes_in += len(line)
+        self.uncompressed_in += len(line)
+        if self.recorder is not None:
+            self.recorder.received(line)
+        return line
+
+    def send(self, data):
+        wire = data
+        if self.compressed:
+            wire = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        super().send(wire)
+        self.bytes_out += len(wire)
+        self.uncompressed_out += len(data)
+        if self.recorder is not None:
+            self.recorder.sent(data)
+
+    def _inflate(self):
+        """Lire le prochain bloc compressé du socket et le décompresser"""
+        chunk = self.file.read1(INFLATE_CHUNK)
+        if not chunk:
+            raise self.abort("socket error: EOF")
+        self.bytes_in += len(chunk)
+        self.inflated += self.decompressor.decompress(chunk)
+
+    def compress(self):
+        """Activer COMPRESS DEFLATE si le serveur l'annonce; retourne True si le flux est compressé"""
+        if self.compressed:
+            return True
+        if "COMPRESS=DEFLATE" not in self.capabilities:
+            return False
+        try:
+            typ, _ = self._simple_command("COMPRESS", "DEFLATE")
+        except self.error:
+            return False
+        if typ != "OK":
+            # Compression TLS déjà active ([COMPRESSIONACTIVE]) ou refus
+            return False
+        # Flux deflate brut (sans en-tête zlib), dans chaque sens
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.decompressor = zlib.decompressobj(-15)
+        self.inflated = bytearray()
+        self.compressed = True
+        return True
+
+    def send_command(self, command, *args):
+        """Envoyer une commande UID sans attendre sa réponse; retourne son tag (voir command_result)"""
+        command = command.upper()
+        if self.state not in imaplib.Commands.get(command, ()):
+            raise self.error(f"commande UID {command} impossible dans l'état {self.state}")
+        tag = self._command("UID", command, *args)
+        if self.perf is not None:
+            self.sent_at[tag] = time.perf_counter()
+        return tag
+
+    def command_result(self, command, tag):
+        """Réponse d'une commande envoyée par send_command: (statut, données) comme uid()
+
+        Les réponses arrivent dans l'ordre d'envoi: lire les tags dans cet
+        ordre. Un refus (NO ou BAD) est rendu comme statut, sans exception.
+        """
+        command = command.upper()
+        try:
+            typ, data = self._command_complete("UID", tag)
+        except self.abort:
+            raise
+        except self.error as e:
+            typ, data = "BAD", [str(e).encode()]
+        if self.perf is not None:
+            # Attente propre à cette commande: depuis son envoi ou la réponse précédente
+            finished = time.perf_counter()
+            started = max(self.sent_at.pop(tag, finished), self.last_result)
+            self.last_result = finished
+            label = f"imap UID {command}"
+            self.perf.add(label, finished - started)
+            if self.perf.tracer is not None:
+                self.perf.tracer.complete(label, started, finished - started, lane=self.trace_lane,
+                                          category="imap", args={"pipelined": True})
+        return self._untagged_response(typ, data, command if command in ("SEARCH", "SORT", "THREAD")
+                                       else "FETCH")
+
+    def _simple_command(self, name, *args):
+        # Toutes les commandes d'imaplib passent par ici (UID FETCH, COPY, STORE...)
+        if self.perf is None:
+            return super()._simple_command(name, *args)
+
+        label = f"imap {name} {args[0]}" if name == "UID" and args else f"imap {name}"
+        started = time.perf_counter()
+        try:
+            return super()._simple_command(name, *args)
+        finally:
+            duration = time.perf_counter() - started
+            self.perf.add(label, duration)
+            if self.perf.tracer is not None:
+                self.perf.tracer.complete(label, started, duration, lane=self.trace_lane,
+                                          category="imap")
+
+
+class InstrumentedIMAP4(InstrumentedMixin, imaplib.IMAP4):
+    """Connexion IMAP en clair instrumentée"""
+
+
+class InstrumentedIMAP4_SSL(InstrumentedMixin, imaplib.IMAP4_SSL):
+    """Connexion IMAP SSL instrumentée"""
+
+
+_COMMAND_RE = re.compile(rb"^([A-Za-z]+\d+) ([^\r\n]*)\r\n$")
+_HEADER_FIELD_RE = re.compile(rb"^([!-9;-~]+)[ \t]*:")
+_BOUNDARY_RE = re.compile(rb'boundary\s*=\s*(?:"([^"\r\n]+)"|([^\s;"]+))', re.I)
+# Élément FETCH dont la valeur suit en littéral: "BODY[1.2]<0> {N}" en fin de ligne
+_LITERAL_ITEM_RE = re.compile(rb"([A-Z0-9.]+)(?:\[([^\]]*)\])?(?:<\d+>)? ~?\{\d+\}\r\n$", re.I)
+_CREDENTIAL_COMMANDS = ("LOGIN", "AUTHENTICATE")
+# Commandes suivies de données du client (littéral, DONE, réponse SASL)
+_CONTINUED_COMMANDS = _CREDENTIAL_COMMANDS + ("APPEND", "IDLE")
+
+
+def _filler(data, size):
+    """Remplissage déterministe de size octets (hexadécimal: valide en base64 et QP)"""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest().encode()
+    return (digest * (size // len(digest) + 1))[:size]
+
+
+def scrub_line(line):
+    """Remplacer le contenu d'une ligne en conservant sa longueur et sa fin de ligne"""
+    content = line.rstrip(b"\r\n")
+    return _filler(content, len(content)) + line[len(content):]
+
+
+def _header_field(line):
+    """Nom d'un champ d'en-tête (minuscules), "" pour une ligne de continuation, None sinon"""
+    if line[:1] in (b" ", b"\t"):
+        return ""
+    match = _HEADER_FIELD_RE.match(line)
+    return match.group(1).decode("ascii").lower() if match else None
+
+
+def _boundary(header_lines):
+    """Paramètre boundary du Content-Type d'un bloc d'en-têtes (None si absent)"""
+    content_type = None
+    for line in header_lines:
+        name = _header_field(line)
+        if name == "content-type":
+            content_type = line.split(b":", 1)[1]
+        elif name == "" and content_type is not None:
+            content_type += line
+        elif content_type is not None:
+            break
+    match = _BOUNDARY_RE.search(content_type) if content_type is not None else None
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+
+def literal_has_headers(line):
+    """Le littéral annoncé en fin de ligne commence-t-il par un bloc d'en-têtes ?
+
+    BODY[], RFC822, BODY[HEADER...] et BODY[n.MIME] en ont un; une partie seule
+    (BODY[n], BINARY[n]) ou BODY[TEXT] n'en a pas.
+    """
+    match = _LITERAL_ITEM_RE.search(line)
+    if not match:
+        return True
+    item, section = match.group(1).upper(), match.group(2)
+    if section is None:
+        return item != b"RFC822.TEXT"
+    section = section.upper()
+    return not section or b"HEADER" in section or section.endswith(b"MIME")
+
+
+def scrub_literal(data, scrub_headers=False, headers=True):
+    """Masquer un message reçu en conservant sa longueur exacte ({N} déjà enregistré)
+
+    Seuls sont conservés le bloc d'en-têtes du message, les délimiteurs
+    déclarés par ses paramètres boundary (parties imbriquées comprises) et les
+    en-têtes de partie qui les suivent: le parsing et la classification restent
+    représentatifs, tout le reste est remplacé. headers=False pour un littéral
+    sans en-têtes (partie seule, BODY[TEXT]); scrub_headers masque les sujets.
+    """
+    lines = data.splitlines(keepends=True)
+    scrubbed = []
+    boundaries = set()
+    block = [] if headers else None
+    subject = False
+    for line in lines:
+        if block is not None:
+            name = _header_field(line)
+            if name is not None and (name or block):
+                block.append(line)
+                subject = name == "subject" or (name == "" and subject)
+                if scrub_headers and subject:
+                    prefix = len(b"subject:") if name else 0
+                    scrubbed.append(line[:prefix] + scrub_line(line[prefix:]))
+                else:
+                    scrubbed.append(line)
+                continue
+            # Fin du bloc (ligne vide) ou ligne qui n'est pas un en-tête
+            boundary = _boundary(block)
+            if boundary:
+                boundaries.add(boundary)
+            block = None
+            if not line.strip():
+                scrubbed.append(line)
+                continue
+
+        delimiter = line.rstrip(b"\r\n").rstrip(b" \t")
+        if delimiter.startswith(b"--") and delimiter[2:] in boundaries:
+            # Délimiteur déclaré: les en-têtes de la partie suivent
+            block = []
+            scrubbed.append(line)
+        elif (delimiter.startswith(b"--") and delimiter.endswith(b"--")
+              and delimiter[2:-2] in boundaries):
+            scrubbed.append(line)
+        else:
+            scrubbed.append(scrub_line(line))
+    return b"".join(scrubbed)
+
+
+class SessionRecorder:
+    """Transcription d'une session IMAP réelle, masquée, en JSON lines gzip
+
+    Une ligne par échange (commande sans tag, réponse, durée mesurée): le
+    fichier peut être rejoué par ReplayIMAP4 sans serveur ni identifiants.
+    Plusieurs commandes peuvent être en cours (pipelining): les réponses non
+    taguées reviennent à la plus ancienne.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path, metadata=None, scrub_headers=False):
+        self.path = path
+        self.scrub_headers = scrub_headers
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.greeting = bytearray()
+        self.inflight = deque()
+        self.exchanges = 0
+        self._write({"type": "session", "version": self.VERSION,
+                     "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                     **(metadata or {})})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def sent(self, data):
+        """Octets envoyés par le client"""
+        match = _COMMAND_RE.match(data)
+        last = self.inflight[-1] if self.inflight else None
+        if match and (last is None or last["verb"] not in _CONTINUED_COMMANDS):
+            tag, command = match.group(1), match.group(2).decode("latin-1")
+            verb = command.split(" ", 1)[0].upper()
+            if verb in _CREDENTIAL_COMMANDS:
+                command = f"{verb} <masqué>"
+            self.inflight.append({"tag": tag, "command": command, "verb": verb,
+                                  "started": time.perf_counter(), "response": bytearray()})
+        elif last is not None:
+            # Suite de commande (DONE après IDLE, réponse à AUTHENTICATE...)
+            if last["verb"] in _CREDENTIAL_COMMANDS:
+                data = scrub_line(data)
+            last.setdefault("continuation", []).append(data.decode("latin-1"))
+
+    def received(self, data, literal=False):
+        """Octets reçus du serveur (ligne, ou littéral {N} lu par read)"""
+        if not self.inflight:
+            self.greeting += data
+            return
+
+        current = self.inflight[0]
+        if literal:
+            current["response"] += scrub_literal(data, self.scrub_headers,
+                                                 current.pop("headers", True))
+        else:
+            finished = next((exchange for exchange in self.inflight
+                             if data.startswith(exchange["tag"] + b" ")), None)
+            if finished is not None:
+                self._finish(finished, data[len(finished["tag"]) + 1:].decode("latin-1"))
+            else:
+                # Littéral annoncé: sans en-têtes pour une partie seule (fetch_parts)
+                current["headers"] = literal_has_headers(data)
+                current["response"] += data
+
+        if self.greeting:
+            self._write({"type": "greeting", "data": self.greeting.decode("latin-1")})
+            self.greeting = bytearray()
+
+    def _finish(self, current, status):
+        self.inflight.remove(current)
+        self._write({
+            "type": "exchange",
+            "command": current["command"],
+            "duration": round(time.perf_counter() - current["started"], 6),
+            "response": current["response"].decode("latin-1"),
+            "status": status,
+            "continuation": current.get("continuation")
+        })
+        self.exchanges += 1
+
+    def close(self):
+        """Fermer la transcription (le fichier est fermé même si l'écriture échoue)"""
+        try:
+            while self.inflight:
+                # LOGOUT: imaplib s'arrête au BYE sans lire la réponse taguée
+                self._finish(self.inflight[0], None)
+            if self.greeting:
+                self._write({"type": "greeting", "data": self.greeting.decode("latin-1")})
+        finally:
+            self.file.close()
+
+
+def load_session(path):
+    """Lire une transcription: (métadonnées, accueil, échanges)"""
+    metadata, greeting, exchanges = {}, b"", []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            kind = record.pop("type")
+            if kind == "session":
+                metadata = record
+            elif kind == "greeting":
+                greeting += record["data"].encode("latin-1")
+            else:
+                exchanges.append(record)
+    return metadata, greeting, exchanges
+
+
+class _ReplayTransport(imaplib.IMAP4):
+    """Transport imaplib alimenté par une transcription au lieu d'un socket
+
+    latency: "recorded" (durées enregistrées, divisées par speed), un délai
+    fixe en secondes par commande, ou None pour aucune attente.
+    """
+
+    def __init__(self, path, latency="recorded", speed=1.0):
+        self.metadata, self.greeting, exchanges = load_session(path)
+        self.latency = latency
+        self.speed = speed
+        self.pending = {}
+        for exchange in exchanges:
+            self.pending.setdefault(self.replay_key(exchange["command"]), deque()).append(exchange)
+        self.unmatched = []
+        super().__init__("replay", 0)
+
+    @staticmethod
+    def replay_key(command):
+        """Clé de correspondance d'une commande (sans tag, identifiants ignorés)"""
+        verb = command.split(" ", 1)[0].upper()
+        return verb if verb in _CREDENTIAL_COMMANDS else command
+
+    def open(self, host="", port=0, timeout=None):
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.buffer = bytearray(self.greeting)
+        self.position = 0
+
+    def read(self, size):
+        data = bytes(self.buffer[self.position:self.position + size])
+        self.position += len(data)
+        return data
+
+    def readline(self):
+        end = self.buffer.find(b"\n", self.position)
+        end = len(self.buffer) if end < 0 else end + 1
+        line = bytes(self.buffer[self.position:end])
+        self.position = end
+        if not line:
+            raise self.abort("fin de la transcription")
+        return line
+
+    def send(self, data):
+        match = _COMMAND_RE.match(data)
+        if not match:
+            return  # suite de commande: déjà incluse dans la réponse enregistrée
+
+        tag, command = match.group(1), match.group(2).decode("latin-1")
+        queue = self.pending.get(self.replay_key(command))
+        if queue:
+            exchange = queue.popleft()
+            response = exchange["response"].encode("latin-1")
+            status = exchange["status"]
+            delay = exchange["duration"] / self.speed if self.latency == "recorded" else self.latency
+        else:
+            # Divergence: commande absente de l'enregistrement
+            self.unmatched.append(command)
+            response, status = b"", "OK [REPLAY] commande absente de l'enregistrement\r\n"
+            delay = 0 if self.latency == "recorded" else self.latency
+
+        if delay:
+            time.sleep(delay)
+        # Compacter le tampon déjà lu puis ajouter la réponse
+        del self.buffer[:self.position]
+        self.position = 0
+        self.buffer += response
+        if status is not None:
+            self.buffer += tag + b" " + status.encode("latin-1")
+
+    def shutdown(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+
+class ReplayIMAP4(InstrumentedMixin, _ReplayTransport):
+    """Connexion rejouée et instrumentée (mêmes compteurs qu'une vraie connexion)"""
+
+    def compress(self):
+        # La transcription est enregistrée en clair
+        return False
@@ -0,0 +1,1353 @@
+"""
+Sources de messages pour Email Manager V3: serveur IMAP, Maildir et mbox
+Le moteur de tri ne parle qu'à l'interface MailboxBackend: lister les
+dossiers, sélectionner un dossier, chercher les UIDs, récupérer les messages
+par lots, copier, déplacer et poser des flags en masse. IMAPBackend enveloppe
+une connexion imaplib authentifiée (instrumentée, enregistrée ou rejouée);
+MaildirBackend et MboxBackend trient des dossiers locaux (profil Thunderbird,
+archives exportées) à la vitesse du disque, sans serveur.
+
+Conventions communes: les UIDs sont des entiers stables tant que
+l'UIDVALIDITY du dossier ne change pas, et les flags sont rendus au format
+de la réponse IMAP: b"FLAGS (\\Seen \\Flagged)". fetch_metadata donne
+l'enveloppe (Envelope) d'un lot sans télécharger les messages: une seule
+commande FETCH ENVELOPE INTERNALDATE RFC822.SIZE sur IMAP. Sur un serveur
+BINARY (RFC 3516), fetch_text ne télécharge que les en-têtes et le début de la
+partie texte, décodée par le serveur. Dans un bloc pipeline(), les
+commandes IMAP indépendantes partent à la suite et leurs réponses sont lues
+à la sortie du bloc. IMAPBackend suit les capacités négociées de la connexion
+(voir imap_capabilities): UID MOVE, UID EXPUNGE des seuls messages marqués
+par l'analyse, SEARCH RETURN (ESEARCH) et HIGHESTMODSEQ (CONDSTORE).
+"""
+
+import hashlib
+import itertools
+import json
+import mailbox
+import mmap
+import os
+import re
+import struct
+import time
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesHeaderParser
+from email.utils import mktime_tz, parsedate_tz
+from pathlib import Path
+
+_UID_RE = re.compile(rb"UID (\d+)")
+_FLAGS_RE = re.compile(rb"FLAGS \(([^)]*)\)")
+_HEADER_END_RE = re.compile(rb"\r?\n\r?\n")
+_ESEARCH_ALL_RE = re.compile(rb"\bALL ([0-9:,]+)")
+_MESSAGE_ID_RE = re.compile(rb"^Message-ID:[ \t]*(?:\r?\n[ \t]+)?(<[^>\r\n]*>|\S+)", re.M | re.I)
+_SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+_MOZILLA_STATUS_RE = re.compile(rb"^X-Mozilla-Status: *([0-9A-Fa-f]{1,4})\s", re.M | re.I)
+_STATUS_RE = re.compile(rb"^(?:X-)?Status: *([A-Z]*)", re.M)
+# Éléments d'une réponse IMAP: parenthèses, chaîne entre guillemets, atome
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"([^"\\]*(?:\\.[^"\\]*)*)"|([^\s()"]+))')
+_ESCAPE_RE = re.compile(rb"\\(.)")
+_INTERNALDATE_RE = re.compile(r"\s*(\d{1,2})-(\w{3})-(\d{4}) (\d\d):(\d\d):(\d\d) ([-+])(\d\d)(\d\d)")
+_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+class BackendError(Exception):
+    """Opération impossible sur la source de messages"""
+
+
+def flags_bytes(flags):
+    """Flags IMAP (noms) au format de la réponse FETCH"""
+    return b"FLAGS (" + " ".join(sorted(flags)).encode() + b")"
+
+
+def uid_set(uids):
+    """Ensemble d'UIDs IMAP ("1,5,7")"""
+    return ",".join(str(uid) for uid in uids)
+
+
+def parse_uid_set(text):
+    """UIDs (entiers croissants) d'un ensemble IMAP compact ("1:3,7")"""
+    uids = []
+    for part in text.split(","):
+        first, _, last = part.partition(":")
+        first, last = int(first), int(last or first)
+        uids.extend(range(min(first, last), max(first, last) + 1))
+    return sorted(set(uids))
+
+
+def parse_list_line(line):
+    """Nom du dossier d'une ligne de réponse LIST (None si illisible)"""
+    folder_str = line.decode('utf-8') if isinstance(line, bytes) else str(line)
+
+    # Format typique: '(\\HasNoChildren) "." "INBOX.Dossier"'
+    # ou: '(\\HasChildren) "/" "Folder Name"'
+    folder_name = None
+
+    # Essayer d'abord avec des guillemets
+    if '"' in folder_str:
+        parts = folder_str.split('"')
+        if len(parts) >= 2:
+            # Le nom est généralement le dernier élément entre guillemets
+            folder_name = parts[-2]
+
+    # Si pas de guillemets ou échec, essayer avec des espaces
+    if not folder_name or folder_name in ['.', '/', '|']:
+        parts = folder_str.split()
+        if len(parts) >= 3:
+            folder_name = parts[-1].strip('"')
+
+    # Sinon prendre le dernier élément après un espace
+    if not folder_name or folder_name in ['.', '/', '|']:
+        parts = folder_str.rsplit(' ', 1)
+        if len(parts) > 1:
+            folder_name = parts[-1].strip('"\'')
+        else:
+            folder_name = folder_str.strip('"\' ')
+
+    if folder_name:
+        folder_name = folder_name.strip().strip('"')
+    if not folder_name or folder_name in ['.', '/', '|']:
+        return None
+    return folder_name
+
+
+def parse_response(pieces):
+    """Réponse IMAP découpée par imaplib (texte et littéraux {N} alternés) en listes imbriquées
+
+    Chaînes et atomes en bytes, NIL en None.
+    """
+    stack = [[]]
+    current = stack[0]
+    for position, piece in enumerate(pieces):
+        if position % 2:
+            current.append(piece)
+            continue
+        end = len(piece)
+        if piece.endswith(b"}"):
+            # Annonce du littéral qui suit: "{123}", ou "~{123}" (literal8, BINARY)
+            brace = piece.rfind(b"{")
+            if brace >= 0 and piece[brace + 1:-1].isdigit():
+                end = brace - 1 if piece[brace - 1:brace] == b"~" else brace
+        for opening, closing, string, atom in _TOKEN_RE.findall(piece, 0, end):
+            if atom:
+                current.append(None if atom == b"NIL" else atom)
+            elif opening:
+                current = []
+                stack.append(current)
+            elif closing:
+                if len(stack) > 1:
+                    closed = stack.pop()
+                    current = stack[-1]
+                    current.append(closed)
+            else:
+                current.append(_ESCAPE_RE.sub(rb"\1", string) if b"\\" in string else string)
+    while len(stack) > 1:
+        closed = stack.pop()
+        stack[-1].append(closed)
+    return stack[0]
+
+
+def fetch_responses(data):
+    """Réponses FETCH d'imaplib regroupées par message: listes [texte, littéral, texte...]"""
+    pieces = []
+    for response in data:
+        if isinstance(response, tuple):
+            pieces.extend(response)
+        elif isinstance(response, bytes):
+            pieces.append(response)
+            yield pieces
+            pieces = []
+    if pieces:
+        pieces.append(b"")
+        yield pieces
+
+
+def fetch_items(pieces):
+    """Éléments d'une réponse FETCH: {b"UID": b"12", b"ENVELOPE": [...], ...}"""
+    parsed = parse_response(pieces)
+    items = next((value for value in parsed if isinstance(value, list)), [])
+    return {(name.upper() if isinstance(name, bytes) else name): value
+            for name, value in zip(items[::2], items[1::2])}
+
+
+def _body_parts(structure, section, depth=0):
+    """Itérer sur les parties texte non jointes d'une BODYSTRUCTURE, dans l'ordre
+
+    Valeurs: (section, sous-type, charset, Content-Transfer-Encoding), en minuscules.
+    """
+    if not isinstance(structure, list) or not structure or depth > 8:
+        return
+    if isinstance(structure[0], list):
+        # multipart: les sous-parties, puis le sous-type et les extensions
+        for number, child in enumerate(itertools.takewhile(lambda item: isinstance(item, list),
+                                                           structure), 1):
+            yield from _body_parts(child, f"{section}.{number}" if section else str(number),
+                                   depth + 1)
+        return
+
+    maintype, subtype = (_text(value).lower() for value in structure[:2])
+    section = section or "1"
+    if (maintype, subtype) == ("message", "rfc822") and len(structure) > 8:
+        inner = structure[8]
+        # Email joint: ses parties sont numérotées sous la sienne
+        inner_section = section if isinstance(inner, list) and inner and \
+            isinstance(inner[0], list) else f"{section}.1"
+        yield from _body_parts(inner, inner_section, depth + 1)
+        return
+    if maintype != "text":
+        return
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and \
+            _text(disposition[0]).lower() == "attachment":
+        return
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = next((_text(value) for name, value in zip(params[::2], params[1::2])
+                    if _text(name).lower() == "charset"), None)
+    encoding = _text(structure[5]).lower() if len(structure) > 5 else ""
+    yield section, subtype, charset, encoding
+
+
+def text_section(structure):
+    """Partie à lire pour le corps d'après BODYSTRUCTURE: (section, sous-type, charset, encodage)
+
+    Première partie text/plain non jointe, sinon première text/html; None sans partie texte.
+    """
+    html = None
+    for part in _body_parts(structure, ""):
+        if part[1] != "html":
+            return part
+        html = html or part
+    return html
+
+
+def parse_internaldate(value):
+    """INTERNALDATE IMAP ("17-Jul-1996 02:44:25 -0700") en datetime avec fuseau"""
+    if isinstance(value, bytes):
+        value = value.decode("ascii", errors="replace")
+    match = _INTERNALDATE_RE.match(value or "")
+    if not match or match.group(2).lower() not in _MONTHS:
+        return None
+    day, month, year, hour, minute, second, sign, zone_hours, zone_minutes = match.groups()
+    offset = timedelta(hours=int(zone_hours), minutes=int(zone_minutes))
+    try:
+        return datetime(int(year), _MONTHS.index(month.lower()) + 1, int(day), int(hour),
+                        int(minute), int(second),
+                        tzinfo=timezone(-offset if sign == "-" else offset))
+    except ValueError:
+        return None
+
+
+def _text(value):
+    """Chaîne d'une réponse IMAP en str (octets 8 bits conservés par surrogateescape)"""
+    if value is None:
+        return ""
+    return value.decode("ascii", "surrogateescape")
+
+
+def _address_list(addresses):
+    """Liste d'adresses d'une ENVELOPE en valeur d'en-tête ("Nom <boite@domaine>, ...")"""
+    formatted = []
+    for address in addresses or ():
+        if not isinstance(address, list) or len(address) < 4:
+            continue
+        name, _, mailbox_name, host = address[:4]
+        if host is None:
+            # Début ou fin de groupe (RFC 3501, 7.4.2)
+            continue
+        addr = f"{_text(mailbox_name)}@{_text(host)}"
+        formatted.append(f"{_text(name)} <{addr}>" if name else addr)
+    return ", ".join(formatted)
+
+
+class Envelope:
+    """En-têtes utiles au tri, encore encodés (RFC 2047): ENVELOPE IMAP ou bloc d'en-têtes"""
+
+    __slots__ = ("date", "subject", "from_addr", "to_addr", "cc_addr", "message_id")
+
+    def __init__(self, date="", subject="", from_addr="", to_addr="", cc_addr="", message_id=""):
+        self.date = date
+        self.subject = subject
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.cc_addr = cc_addr
+        self.message_id = message_id
+
+    @classmethod
+    def from_imap(cls, fields):
+        """Structure ENVELOPE parsée (voir parse_response)"""
+        fields = list(fields or ()) + [None] * 10
+        return cls(_text(fields[0]), _text(fields[1]), _address_list(fields[2]),
+                   _address_list(fields[5]), _address_list(fields[6]), _text(fields[9]))
+
+    @classmethod
+    def from_headers(cls, headers):
+        """Bloc d'en-têtes brut (bytes ou memoryview)"""
+        msg = BytesHeaderParser().parsebytes(bytes(headers))
+        return cls(msg.get("Date", ""), msg.get("Subject", ""), msg.get("From", ""),
+                   msg.get("To", ""), msg.get("Cc", ""), msg.get("Message-ID", ""))
+
+
+class LocalCriteria:
+    """Critères de recherche du moteur (ALL, UNSEEN, SINCE jj-Mmm-aaaa) évalués localement"""
+
+    def __init__(self, criteria):
+        self.unseen = False
+        self.since = None
+        tokens = (criteria or "ALL").split()
+        position = 0
+        while position < len(tokens):
+            token = tokens[position].upper()
+            if token == "UNSEEN":
+                self.unseen = True
+            elif token == "SINCE" and position + 1 < len(tokens):
+                position += 1
+                self.since = datetime.strptime(tokens[position], "%d-%b-%Y").timestamp()
+            elif token != "ALL":
+                raise BackendError(f"critère de recherche non supporté: {tokens[position]}")
+            position += 1
+
+    @property
+    def needs_date(self):
+        return self.since is not None
+
+    def matches(self, flags, date=None):
+        """flags: noms IMAP; date: timestamp de réception (None: inconnue)"""
+        if self.unseen and "\\Seen" in flags:
+            return False
+        if self.since is not None and date is not None and date < self.since:
+            return False
+        return True
+
+
+class MailboxBackend:
+    """Interface commune des sources de messages (voir le module)"""
+
+    kind = None
+    bytes_in = 0
+    bytes_out = 0
+    compressed = False
+    # HIGHESTMODSEQ du dossier ouvert (CONDSTORE), None si inconnu
+    highest_modseq = None
+
+    def describe(self):
+        """Libellé de la source pour la console"""
+        raise NotImplementedError
+
+    def list_folders(self):
+        """Noms des dossiers, INBOX compris"""
+        raise NotImplementedError
+
+    def select(self, folder, readonly=False):
+        """Ouvrir un dossier, retourner son UIDVALIDITY"""
+        raise NotImplementedError
+
+    def search(self, criteria="ALL"):
+        """UIDs (entiers croissants) du dossier ouvert qui satisfont les critères"""
+        raise NotImplementedError
+
+    def fetch(self, uids, peek=True, headers_only=False, limit=None):
+        """Itérer sur (uid, flags, contenu brut) pour un lot d'UIDs
+
+        Les UIDs disparus entre-temps sont simplement absents du résultat.
+        peek=False laisse un serveur IMAP marquer les messages comme lus.
+        limit: ne lire que les limit premiers octets de chaque message.
+        """
+        raise NotImplementedError
+
+    def message_size(self, uid):
+        """Taille d'un message du dossier ouvert, sans le lire (None si inconnue)"""
+        return None
+
+    def summaries(self, uids, message_ids=True, sizes=True):
+        """Message-ID et taille d'un lot d'UIDs, sans les contenus: {uid: (message_id, taille)}
+
+        Chaque valeur vaut None si elle n'est pas demandée ou absente du message.
+        """
+        found = {}
+        if message_ids:
+            for uid, _, headers in self.fetch(uids, headers_only=True):
+                match = _MESSAGE_ID_RE.search(headers)
+                if uid is not None:
+                    found[uid] = (match.group(1).decode("ascii", errors="replace")
+                                  if match else None, None)
+        if sizes:
+            for uid in uids:
+                size = self.message_size(uid)
+                if size is not None:
+                    found[uid] = (found.get(uid, (None, None))[0], size)
+        return found
+
+    # Vrai si fetch_text est disponible (serveur IMAP avec l'extension BINARY)
+    binary = False
+
+    def fetch_text(self, uids, peek=True, limit=4096, html_limit=65536):
+        """Itérer sur (uid, flags, en-têtes, taille, texte) sans les pièces jointes
+
+        texte: (début de la partie, encodage restant à décoder, charset, HTML)
+        pour la partie lue (text/plain, sinon text/html; limit ou html_limit
+        octets), None si le message n'a pas de partie texte.
+        """
+        raise NotImplementedError
+
+    def fetch_metadata(self, uids):
+        """Itérer sur (uid, flags, Envelope, date de réception, taille) sans les corps
+
+        Date de réception (datetime) et taille valent None si la source ne les
+        donne pas directement.
+        """
+        for uid, flags, headers in self.fetch(uids, headers_only=True):
+            yield uid, flags, Envelope.from_headers(headers), None, None
+
+    def copy(self, uids, folder):
+        """Copier des messages vers un dossier, retourner True si réussi"""
+        raise NotImplementedError
+
+    def add_flags(self, uids, *flags):
+        """Ajouter des flags (\\Seen, \\Flagged, \\Deleted...) à des messages"""
+        raise NotImplementedError
+
+    def move(self, uids, folder):
+        """Déplacer des messages: copie puis marquage pour suppression (voir expunge)"""
+        if not self.copy(uids, folder):
+            return False
+        return self.add_flags(uids, "\\Deleted")
+
+    @contextmanager
+    def pipeline(self):
+        """Bloc dans lequel copy, move et add_flags peuvent partir sans attendre leur réponse
+
+        Donne un dictionnaire {uid: commande refusée}, complété à la sortie du
+        bloc: une action annoncée réussie pendant le bloc a pu échouer. Les
+        sources locales exécutent tout immédiatement (dictionnaire vide).
+        """
+        yield {}
+
+    def expunge(self):
+        """Supprimer définitivement les messages marqués du dossier ouvert"""
+        raise NotImplementedError
+
+    def create_folder(self, folder):
+        """Créer un dossier, retourner True si réussi"""
+        raise NotImplementedError
+
+    def close(self):
+        """Fermer la source (écrire ce qui reste, déconnexion)"""
+
+
+class IMAPBackend(MailboxBackend):
+    """Source IMAP autour d'une connexion imaplib authentifiée"""
+
+    kind = "imap"
+
+    def __init__(self, connection, label="IMAP"):
+        self.connection = connection
+        self.label = label
+        self.selected = None
+        # Pipeline en cours: commandes envoyées [(tag, commande, uids)], messages
+        # déplacés (UID MOVE, ou copie qui sera marquée pour suppression), tags
+        # de ces copies et refus ({uid: "COPY dossier", "MOVE dossier" ou "STORE"})
+        self.pending = None
+        self.pending_uids = set()
+        self.moved = set()
+        self.moving = set()
+        self.failed = {}
+        # UIDs marqués \Deleted par l'analyse dans le dossier ouvert (voir expunge)
+        self.deleted = set()
+        self.highest_modseq = None
+
+    @property
+    def bytes_in(self):
+        return getattr(self.connection, "bytes_in", 0)
+
+    @property
+    def bytes_out(self):
+        return getattr(self.connection, "bytes_out", 0)
+
+    @property
+    def compressed(self):
+        return getattr(self.connection, "compressed", False)
+
+    @property
+    def uncompressed_in(self):
+        """Octets reçus avant compression (égal à bytes_in sans COMPRESS)"""
+        return getattr(self.connection, "uncompressed_in", self.bytes_in)
+
+    @property
+    def uncompressed_out(self):
+        return getattr(self.connection, "uncompressed_out", self.bytes_out)
+
+    def describe(self):
+        return self.label
+
+    def supports(self, capability):
+        """Capacité annoncée par le serveur (après authentification si le profil a été lu)"""
+        return capability in getattr(self.connection, "capabilities", ())
+
+    @property
+    def binary(self):
+        return self.supports("BINARY")
+
+    @property
+    def can_pipeline(self):
+        return hasattr(self.connection, "send_command")
+
+    def list_folders(self):
+        result, data = self.connection.list()
+        if result != 'OK':
+            raise BackendError(f"LIST refusé: {data}")
+        folders = []
+        for line in data:
+            name = parse_list_line(line) if line else None
+            if name and name not in folders:
+                folders.append(name)
+        return folders
+
+    def select(self, folder, readonly=False):
+        # SELECT ... (CONDSTORE): HIGHESTMODSEQ garanti dans la réponse
+        mailbox = f"{folder} (CONDSTORE)" if self.supports("CONDSTORE") else folder
+        result, data = self.connection.select(mailbox, readonly=readonly)
+        self.deleted = set()
+        self.highest_modseq = None
+        if result != 'OK':
+            # Sélection refusée: le serveur n'a plus de dossier ouvert
+            self.selected = None
+            raise BackendError(f"impossible d'ouvrir {folder}: {data}")
+        self.selected = folder
+        _, data = self.connection.response('HIGHESTMODSEQ')
+        try:
+            self.highest_modseq = int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            pass
+        _, data = self.connection.response('UIDVALIDITY')
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return 0
+
+    def search(self, criteria="ALL"):
+        if self.supports("ESEARCH"):
+            # ESEARCH (RFC 4731): UIDs en intervalles ("1:5000") au lieu d'une liste complète
+            result, data = self.connection.uid('SEARCH', 'RETURN', '(ALL)', criteria)
+            if result != 'OK':
+                raise BackendError(f"recherche refusée dans {self.selected}: {data}")
+            _, data = self.connection.response('ESEARCH')
+            match = _ESEARCH_ALL_RE.search(data[-1] or b"") if data else None
+            return parse_uid_set(match.group(1).decode()) if match else []
+        result, data = self.connection.uid('SEARCH', None, criteria)
+        if result != 'OK':
+            raise BackendError(f"recherche refusée dans {self.selected}: {data}")
+        return [int(uid) for uid in data[0].split()]
+
+    def fetch(self, uids, peek=True, headers_only=False, limit=None):
+        if not uids:
+            return
+        if headers_only:
+            item = "BODY.PEEK[HEADER]" if peek else "RFC822.HEADER"
+        elif limit:
+            # Début du message seulement (RFC 3501: partie partielle <origine.longueur>)
+            item = f"{'BODY.PEEK' if peek else 'BODY'}[]<0.{int(limit)}>"
+        else:
+            item = "BODY.PEEK[]" if peek else "RFC822"
+        result, data = self.connection.uid('FETCH', uid_set(uids), f'(UID {item} FLAGS)')
+        if result != 'OK':
+            raise BackendError(f"FETCH refusé: {data}")
+
+        # Chaque message: (en-tête FETCH, littéral) puis la fin de la ligne,
+        # où certains serveurs placent FLAGS après le contenu
+        message = None
+        for response in data:
+            if isinstance(response, tuple):
+                if message is not None:
+                    yield self._fetched(*message)
+                message = [response[0], response[1]]
+            elif message is not None and isinstance(response, bytes):
+                message[0] += response
+        if message is not None:
+            yield self._fetched(*message)
+
+    def summaries(self, uids, message_ids=True, sizes=True):
+        # Une commande par lot: RFC822.SIZE et le seul en-tête Message-ID,
+        # quelques dizaines d'octets par message
+        if not uids or not (message_ids or sizes):
+            return {}
+        items = ["UID"]
+        if sizes:
+            items.append("RFC822.SIZE")
+        if message_ids:
+            items.append("BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)]")
+        result, data = self.connection.uid('FETCH', uid_set(uids), f"({' '.join(items)})")
+        if result != 'OK':
+            raise BackendError(f"FETCH refusé: {data}")
+        found = {}
+        for pieces in fetch_responses(data):
+            # Texte de la réponse hors littéraux (positions paires)
+            text = b" ".join(pieces[::2])
+            uid = _UID_RE.search(text)
+            if not uid:
+                continue
+            size = _SIZE_RE.search(text)
+            match = _MESSAGE_ID_RE.search(pieces[1]) if len(pieces) > 1 else None
+            found[int(uid.group(1))] = (
+                match.group(1).decode("ascii", errors="replace") if match else None,
+                int(size.group(1)) if size else None)
+        return found
+
+    def fetch_text(self, uids, peek=True, limit=4096, html_limit=65536):
+        if not uids:
+            return
+        # Structure et en-têtes du lot, puis une commande BINARY par section lue
+        header = "BODY.PEEK[HEADER]" if peek else "BODY[HEADER]"
+        result, data = self.connection.uid('FETCH', uid_set(uids),
+                                           f'(UID FLAGS RFC822.SIZE BODYSTRUCTURE {header})')
+        if result != 'OK':
+            raise BackendError(f"FETCH refusé: {data}")
+        messages = {}
+        sections = {}
+        for pieces in fetch_responses(data):
+            items = fetch_items(pieces)
+            uid = items.get(b"UID")
+            if uid is None:
+                continue
+            size = items.get(b"RFC822.SIZE")
+            part = text_section(items.get(b"BODYSTRUCTURE"))
+            messages[int(uid)] = (b"FLAGS (" + b" ".join(items.get(b"FLAGS") or ()) + b")",
+                                  items.get(b"BODY[HEADER]") or b"",
+                                  int(size) if size is not None else None, part)
+            if part:
+                section, subtype = part[:2]
+                key = (section, html_limit if subtype == "html" else limit)
+                sections.setdefault(key, []).append(int(uid))
+
+        texts = {}
+        for decoded, contents in self.fetch_parts(sections, peek):
+            for uid, content in contents.items():
+                _, subtype, charset, encoding = messages[uid][3]
+                texts[uid] = (content, "" if decoded else encoding, charset, subtype == "html")
+
+        for uid, (flags, headers, size, _) in messages.items():
+            yield uid, flags, headers, size, texts.get(uid)
+
+    def fetch_parts(self, sections, peek=True):
+        """Début de sections de messages {(section, limite): [uids]}: [(décodée, {uid: octets})]
+
+        BINARY rend la partie décodée; si le serveur ne sait pas la décoder
+        ([UNKNOWN-CTE]), elle est relue encodée (BODY) pour décodage local.
+        Les commandes des différentes sections partent à la suite (pipelining).
+        """
+        binary = 'BINARY.PEEK' if peek else 'BINARY'
+        commands = [(uids, f"(UID {binary}[{section}]<0.{int(limit)}>)")
+                    for (section, limit), uids in sections.items()]
+        responses = self.uid_commands([('FETCH', uid_set(uids), items) for uids, items in commands])
+
+        parts = []
+        for ((section, limit), uids), (result, data) in zip(sections.items(), responses):
+            decoded = result == 'OK'
+            if not decoded:
+                item = f"{'BODY.PEEK' if peek else 'BODY'}[{section}]<0.{int(limit)}>"
+                result, data = self.connection.uid('FETCH', uid_set(uids), f'(UID {item})')
+                if result != 'OK':
+                    raise BackendError(f"FETCH refusé: {data}")
+            parts.append((decoded, self._part_contents(data)))
+        return parts
+
+    @staticmethod
+    def _part_contents(data):
+        contents = {}
+        for pieces in fetch_responses(data):
+            items = fetch_items(pieces)
+            uid = items.get(b"UID")
+            if uid is None:
+                continue
+            content = next((value for name, value in items.items()
+                            if name.startswith((b"BINARY[", b"BODY["))), None)
+            contents[int(uid)] = content if isinstance(content, bytes) else b""
+        return contents
+
+    def uid_commands(self, commands):
+        """Commandes UID indépendantes [(commande, arguments...)]: [(statut, données)]
+
+        Envoyées à la suite sans attendre les réponses, lues ensuite dans l'ordre.
+        """
+        if not self.can_pipeline or len(commands) < 2:
+            return [self.connection.uid(*command) for command in commands]
+        tags = [self.connection.send_command(*command) for command in commands]
+        return [self.connection.command_result(command[0], tag)
+                for command, tag in zip(commands, tags)]
+
+    def fetch_metadata(self, uids):
+        if not uids:
+            return
+        result, data = self.connection.uid('FETCH', uid_set(uids),
+                                           '(UID FLAGS INTERNALDATE RFC822.SIZE ENVELOPE)')
+        if result != 'OK':
+            raise BackendError(f"FETCH refusé: {data}")
+        for pieces in fetch_responses(data):
+            items = fetch_items(pieces)
+            uid = items.get(b"UID")
+            if uid is None:
+                continue
+            flags = b"FLAGS (" + b" ".join(items.get(b"FLAGS") or ()) + b")"
+            size = items.get(b"RFC822.SIZE")
+            yield (int(uid), flags, Envelope.from_imap(items.get(b"ENVELOPE")),
+                   parse_internaldate(items.get(b"INTERNALDATE")),
+                   int(size) if size is not None else None)
+
+    @staticmethod
+    def _fetched(header, raw):
+        uid = _UID_RE.search(header)
+        flags = _FLAGS_RE.search(header)
+        return (int(uid.group(1)) if uid else None,
+                b"FLAGS (" + (flags.group(1) if flags else b"") + b")",
+                raw)
+
+    def copy(self, uids, folder):
+        return self.update('COPY', uids, folder)
+
+    def add_flags(self, uids, *flags):
+        if "\\Deleted" in flags:
+            self.deleted.update(uids)
+        return self.update('STORE', uids, '+FLAGS', f"({' '.join(flags)})")
+
+    def move(self, uids, folder):
+        if self.supports("MOVE"):
+            # UID MOVE (RFC 6851): une seule commande, atomique
+            return self.update('MOVE', uids, folder)
+        if self.pending is None:
+            return super().move(uids, folder)
+        # Les copies du lot partent à la suite; le marquage pour suppression
+        # part à la lecture de la réponse de chaque copie acceptée (drain)
+        if not self.copy(uids, folder):
+            return False
+        self.moving.add(self.pending[-1][0])
+        self.moved.update(uids)
+        return True
+
+    def update(self, command, uids, *args):
+        """UID COPY, STORE ou MOVE; dans un pipeline, envoyée sans attendre (succès supposé)"""
+        if self.pending is None:
+            result, _ = self.connection.uid(command, uid_set(uids), *args)
+            return result == 'OK'
+        if command == 'STORE' and self.moved.issuperset(uids):
+            # Flags sur des messages déjà partis du dossier: sans effet
+            return True
+        # Commande sur des messages déjà concernés: attendre les réponses en cours
+        if self.pending_uids.intersection(uids):
+            self.drain()
+        self.send(command, uids, *args)
+        if command == 'MOVE':
+            self.moved.update(uids)
+        return True
+
+    def send(self, command, uids, *args):
+        """Envoyer une commande UID dans le pipeline (réponse lue par drain)"""
+        tag = self.connection.send_command(command, uid_set(uids), *args)
+        # Libellé d'un refus: commande et dossier de destination
+        label = f"{command} {args[0]}" if command in ('COPY', 'MOVE') else command
+        self.pending.append((tag, command, uids, label))
+        self.pending_uids.update(uids)
+
+    def drain(self):
+        """Lire les réponses des commandes envoyées dans le pipeline (refus dans failed)
+
+        Une copie acceptée d'un déplacement (move sans MOVE) envoie son marquage
+        pour suppression, lu au tour suivant. Retourne les tags des commandes refusées.
+        """
+        refused = set()
+        while self.pending:
+            pending, self.pending = self.pending, []
+            self.pending_uids = set()
+            for tag, command, uids, label in pending:
+                result, _ = self.connection.command_result(command, tag)
+                if result != 'OK':
+                    refused.add(tag)
+                    for uid in uids:
+                        self.failed[uid] = label
+                elif tag in self.moving:
+                    self.deleted.update(uids)
+                    self.send('STORE', uids, '+FLAGS', "(\\Deleted)")
+                self.moving.discard(tag)
+        return refused
+
+    @contextmanager
+    def pipeline(self):
+        if self.pending is not None or not self.can_pipeline:
+            yield {}
+            return
+        self.pending = []
+        self.failed = failed = {}
+        try:
+            yield failed
+        finally:
+            try:
+                self.drain()
+            finally:
+                self.pending = None
+                self.moved = set()
+                self.moving = set()
+                self.failed = {}
+
+    def expunge(self):
+        if not self.deleted:
+            # Rien marqué pour suppression par l'analyse (UID MOVE, mode test)
+            return False
+        deleted, self.deleted = sorted(self.deleted), set()
+        if self.supports("UIDPLUS"):
+            # UID EXPUNGE (RFC 4315): les messages marqués par un autre client restent
+            return self.connection.uid('EXPUNGE', uid_set(deleted))[0] == 'OK'
+        return self.connection.expunge()[0] == 'OK'
+
+    def create_folder(self, folder):
+        result = self.connection.create(folder)
+        if result[0] != 'OK':
+            return False
+        self.connection.subscribe(folder)
+        return True
+
+    def close(self):
+        try:
+            if self.selected is not None:
+                self.connection.close()
+        finally:
+            self.connection.logout()
+
+
+class LocalBackend(MailboxBackend):
+    """Base des sources locales: lecture directe des fichiers, écriture à la fermeture"""
+
+    def __init__(self, root):
+        self.root = Path(root).expanduser()
+        if not self.root.exists():
+            raise BackendError(f"{self.root} introuvable")
+        self.selected = None
+        self.deleted = set()
+
+    def describe(self):
+        return f"{self.kind} {self.root}"
+
+    @staticmethod
+    def read_headers(path, chunk_size=65536):
+        """Bloc d'en-têtes d'un fichier message, sans lire les pièces jointes"""
+        data = b""
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                data += chunk
+                for separator in (b"\r\n\r\n", b"\n\n"):
+                    end = data.find(separator)
+                    if end >= 0:
+                        return data[:end + len(separator)]
+                if not chunk:
+                    return data
+
+
+class MaildirBackend(LocalBackend):
+    """Source Maildir (Maildir++: INBOX à la racine, sous-dossiers .Dossier.Sous)
+
+    Les UIDs sont attribués par ordre d'arrivée et conservés dans state_dir
+    (fichier JSON par dossier): la source n'est jamais modifiée en mode test.
+    """
+
+    kind = "maildir"
+    SEPARATOR = "."
+    FLAG_LETTERS = {"S": "\\Seen", "R": "\\Answered", "F": "\\Flagged", "T": "\\Deleted",
+                    "D": "\\Draft"}
+    LETTER_FLAGS = {flag: letter for letter, flag in FLAG_LETTERS.items()}
+
+    def __init__(self, root, state_dir=None):
+        super().__init__(root)
+        self.state_dir = Path(state_dir) if state_dir else self.root / ".email_manager"
+        self.messages = {}
+
+    def folder_path(self, folder):
+        if folder.upper() == "INBOX":
+            return self.root
+        return self.root / f".{folder}"
+
+    def list_folders(self):
+        folders = ["INBOX"]
+        for entry in sorted(os.scandir(self.root), key=lambda entry: entry.name):
+            if entry.name.startswith(".") and entry.is_dir() and (Path(entry.path) / "cur").is_dir():
+                folders.append(entry.name[1:])
+        return folders
+
+    def scan(self, path):
+        """Clé unique -> (chemin, lettres de flags) pour new/ et cur/"""
+        files = {}
+        for subdir in ("new", "cur"):
+            directory = path / subdir
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory):
+                if entry.name.startswith("."):
+                    continue
+                key, _, info = entry.name.partition(mailbox.Maildir.colon)
+                letters = info[2:] if info.startswith("2,") else ""
+                files[key] = (entry.path, letters)
+        return files
+
+    def select(self, folder, readonly=False):
+        path = self.folder_path(folder)
+        if not (path / "cur").is_dir():
+            raise BackendError(f"dossier Maildir introuvable: {path}")
+        files = self.scan(path)
+
+        # Attribution des UIDs: les anciens sont conservés, les nouveaux suivent
+        state_file = self.state_dir / f"{hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:16]}.json"
+        try:
+            with open(state_file, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {"uidvalidity": int(time.time()), "next_uid": 1, "uids": {}}
+        uids = {key: uid for key, uid in state["uids"].items() if key in files}
+        for key in sorted(set(files) - set(uids)):
+            uids[key] = state["next_uid"]
+            state["next_uid"] += 1
+        if uids != state["uids"]:
+            state["uids"] = uids
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with open(state_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+        self.selected = folder
+        self.messages = {uid: (key, *files[key]) for key, uid in uids.items()}
+        self.deleted = set()
+        return state["uidvalidity"]
+
+    def flags_of(self, letters):
+        return {self.FLAG_LETTERS[letter] for letter in letters if letter in self.FLAG_LETTERS}
+
+    def search(self, criteria="ALL"):
+        criteria = LocalCriteria(criteria)
+        found = []
+        for uid in sorted(self.messages):
+            _, path, letters = self.messages[uid]
+            # Date de réception: date de modification du fichier (comme Dovecot)
+            date = os.stat(path).st_mtime if criteria.needs_date else None
+            if criteria.matches(self.flags_of(letters), date):
+                found.append(uid)
+        return found
+
+    def fetch(self, uids, peek=True, headers_only=False, limit=None):
+        for uid in uids:
+            entry = self.messages.get(uid)
+            if entry is None:
+                continue
+            _, path, letters = entry
+            try:
+                if headers_only:
+                    raw = self.read_headers(path)
+                else:
+                    with open(path, "rb") as f:
+                        raw = f.read(limit or -1)
+            except FileNotFoundError:
+                continue
+            self.bytes_in += len(raw)
+            yield uid, flags_bytes(self.flags_of(letters)), raw
+
+    def message_size(self, uid):
+        entry = self.messages.get(uid)
+        if entry is None:
+            return None
+        try:
+            return os.stat(entry[1]).st_size
+        except FileNotFoundError:
+            return None
+
+    def copy(self, uids, folder):
+        path = self.folder_path(folder)
+        if not (path / "cur").is_dir():
+            return False
+        target = mailbox.Maildir(path, factory=None, create=False)
+        for uid in uids:
+            entry = self.messages.get(uid)
+            if entry is None:
+                return False
+            _, source, letters = entry
+            with open(source, "rb") as f:
+                message = mailbox.MaildirMessage(f.read())
+            message.set_subdir("cur" if letters else "new")
+            message.set_flags(letters)
+            target.add(message)
+        return True
+
+    def add_flags(self, uids, *flags):
+        if any(flag not in self.LETTER_FLAGS for flag in flags):
+            return False  # mots-clés IMAP: pas d'équivalent Maildir portable
+        for uid in uids:
+            entry = self.messages.get(uid)
+            if entry is None:
+                return False
+            key, path, letters = entry
+            letters = "".join(sorted(set(letters) | {self.LETTER_FLAGS[flag] for flag in flags}))
+            new_path = str(self.folder_path(self.selected) / "cur" /
+                           f"{key}{mailbox.Maildir.colon}2,{letters}")
+            if new_path != path:
+                os.rename(path, new_path)
+            self.messages[uid] = (key, new_path, letters)
+            if "\\Deleted" in flags:
+                self.deleted.add(uid)
+        return True
+
+    def expunge(self):
+        for uid in sorted(self.deleted):
+            _, path, _ = self.messages.pop(uid)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self.deleted = set()
+        return True
+
+    def create_folder(self, folder):
+        path = self.folder_path(folder)
+        for subdir in ("tmp", "new", "cur"):
+            (path / subdir).mkdir(parents=True, exist_ok=True)
+        (path / "maildirfolder").touch()
+        return True
+
+
+class MboxReader:
+    """Lecture d'un fichier mbox projeté en mémoire (mmap), avec index des offsets persistant
+
+    Le début de chaque message (ligne "From ") est indexé au premier
+    parcours puis conservé dans index_dir: rouvrir un mbox de plusieurs Go est
+    immédiat et seuls les messages ajoutés depuis sont parcourus. Les messages
+    sont rendus en memoryview sur la projection, sans copie: seules les pages
+    lues sont chargées par le système.
+    """
+
+    MAGIC = b"EMMBOX1\n"
+    # inode, taille du fichier indexée, nombre d'offsets
+    HEADER = struct.Struct("<QQQ")
+
+    def __init__(self, path, index_dir=None):
+        self.path = Path(path)
+        self.index_file = None
+        if index_dir is not None:
+            name = hashlib.sha1(str(self.path.resolve()).encode()).hexdigest()[:16]
+            self.index_file = Path(index_dir) / f"{name}.offsets"
+        self.file = open(self.path, "rb")
+        stat = os.fstat(self.file.fileno())
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+        # mmap refuse les fichiers vides
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.view = memoryview(self.map)
+        self.offsets = self.load_offsets()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def load_offsets(self):
+        """Index persistant s'il correspond encore au fichier, complété par les ajouts"""
+        offsets = array("Q")
+        indexed = 0
+        if self.index_file is not None:
+            try:
+                with open(self.index_file, "rb") as f:
+                    if f.read(len(self.MAGIC)) == self.MAGIC:
+                        inode, size, count = self.HEADER.unpack(f.read(self.HEADER.size))
+                        if inode == self.inode and size <= self.size:
+                            offsets.fromfile(f, count)
+                            indexed = size
+            except (OSError, EOFError, struct.error):
+                offsets, indexed = array("Q"), 0
+
+        # Fichier réécrit sur place (même inode): on repart de zéro
+        if offsets and self.view[offsets[-1]:offsets[-1] + 5] != b"From ":
+            offsets, indexed = array("Q"), 0
+
+        if indexed < self.size:
+            self.scan(offsets, indexed)
+            self.save_offsets(offsets)
+        return offsets
+
+    def scan(self, offsets, start):
+        """Ajouter les débuts de message (lignes "From ") situés après start"""
+        if start == 0 and self.view[:5] == b"From ":
+            offsets.append(0)
+        position = max(start - 1, 0)
+        while True:
+            position = self.map.find(b"\nFrom ", position)
+            if position < 0:
+                break
+            offsets.append(position + 1)
+            position += 1
+
+    def save_offsets(self, offsets):
+        if self.index_file is None:
+            return
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.index_file.with_suffix(".tmp")
+            with open(temporary, "wb") as f:
+                f.write(self.MAGIC)
+                f.write(self.HEADER.pack(self.inode, self.size, len(offsets)))
+                offsets.tofile(f)
+            os.replace(temporary, self.index_file)
+        except OSError:
+            pass  # l'index sera reconstruit à la prochaine ouverture
+
+    def bounds(self, index):
+        """(fin de la ligne From, début du contenu, fin du contenu) du message index"""
+        start = self.offsets[index]
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else self.size
+        content = self.map.find(b"\n", start, end) + 1 or end
+        # Ligne vide qui sépare le message du suivant
+        if end - content >= 2 and self.view[end - 2:end] == b"\n\n":
+            end -= 1
+        elif end - content >= 3 and self.view[end - 3:end] == b"\n\r\n":
+            end -= 2
+        return start, content, end
+
+    def message(self, index):
+        """Message complet (sans la ligne From), en memoryview"""
+        _, content, end = self.bounds(index)
+        return self.view[content:end]
+
+    def headers(self, index):
+        """Bloc d'en-têtes du message, en memoryview"""
+        _, content, end = self.bounds(index)
+        match = _HEADER_END_RE.search(self.map, content, end)
+        return self.view[content:match.end() if match else end]
+
+    def from_line(self, index):
+        """Ligne "From expéditeur date" (sans le saut de ligne)"""
+        start, content, _ = self.bounds(index)
+        return bytes(self.view[start:content]).rstrip(b"\r\n")
+
+    def date(self, index):
+        """Date de la ligne From (date de réception), en timestamp; None si illisible"""
+        parts = self.from_line(index).decode("ascii", errors="replace").split(None, 2)
+        parsed = parsedate_tz(parts[2]) if len(parts) > 2 else None
+        return mktime_tz(parsed) if parsed else None
+
+    def close(self):
+        self.view.release()
+        if isinstance(self.map, mmap.mmap):
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # des memoryview sont encore utilisées: libérée avec elles
+        self.file.close()
+
+
+class MboxBackend(LocalBackend):
+    """Source mbox: dossier Thunderbird (Inbox, Archives.sbd/2024...) ou fichier exporté
+
+    Un fichier seul est ouvert comme INBOX; les dossiers créés sont placés à
+    côté. UID = rang du message dans le fichier. La lecture passe par
+    MboxReader (offsets conservés dans state_dir); les modifications par le
+    module mailbox, qui réécrit le fichier en le remplaçant: l'inode, qui sert
+    d'UIDVALIDITY, change alors. Fermer Thunderbird avant un tri qui modifie
+    ses dossiers.
+    """
+
+    kind = "mbox"
+    SEPARATOR = "/"
+    MOZILLA_FLAGS = ((0x0001, "\\Seen"), (0x0002, "\\Answered"), (0x0004, "\\Flagged"),
+                     (0x0008, "\\Deleted"))
+    STATUS_FLAGS = {"R": "\\Seen", "A": "\\Answered", "F": "\\Flagged", "D": "\\Deleted"}
+    LETTER_FLAGS = {flag: letter for letter, flag in STATUS_FLAGS.items()}
+    SUFFIXES = ("", ".mbox", ".mbx")
+
+    def __init__(self, root, state_dir=None):
+        super().__init__(root)
+        self.state_dir = state_dir
+        if self.root.is_file():
+            self.directory = self.root.parent
+            self.inbox = self.root
+        else:
+            self.directory = self.root
+            self.inbox = next((self.root / name for name in ("Inbox", "INBOX", "inbox")
+                               if (self.root / name).is_file()), self.root / "Inbox")
+        self.reader = None
+        self.box = None
+        self.targets = {}
+        self.modified = False
+
+    def folder_path(self, folder):
+        if folder.upper() == "INBOX":
+            return self.inbox
+        parts = folder.split(self.SEPARATOR)
+        path = self.directory
+        for part in parts[:-1]:
+            path = path / f"{part}.sbd"
+        for suffix in self.SUFFIXES:
+            candidate = path / f"{parts[-1]}{suffix}"
+            if candidate.is_file():
+                return candidate
+        return path / parts[-1]
+
+    def list_folders(self):
+        folders = ["INBOX"]
+
+        def walk(directory, prefix):
+            for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+                name, suffix = os.path.splitext(entry.name)
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir() and suffix == ".sbd":
+                    walk(entry.path, f"{prefix}{name}{self.SEPARATOR}")
+                elif (entry.is_file() and suffix != ".msf" and Path(entry.path) != self.inbox
+                      and self.is_mbox(entry.path)):
+                    folder = f"{prefix}{name if suffix in self.SUFFIXES[1:] else entry.name}"
+                    if folder not in folders:
+                        folders.append(folder)
+
+        walk(self.directory, "")
+        return folders
+
+    @staticmethod
+    def is_mbox(path):
+        """Fichier vide ou qui commence par une ligne "From " (pas un .msf, .json...)"""
+        with open(path, "rb") as f:
+            start = f.read(5)
+        return start in (b"", b"From ")
+
+    def select(self, folder, readonly=False):
+        self.flush()
+        path = self.folder_path(folder)
+        if not path.is_file():
+            raise BackendError(f"fichier mbox introuvable: {path}")
+        self.reader = MboxReader(path, self.state_dir)
+        self.selected = folder
+        self.deleted = set()
+        return self.reader.inode & 0xFFFFFFFF
+
+    def header_flags(self, headers):
+        """Flags IMAP depuis X-Mozilla-Status (Thunderbird) ou Status/X-Status"""
+        flags = set()
+        match = _MOZILLA_STATUS_RE.search(headers)
+        if match:
+            value = int(match.group(1), 16)
+            flags.update(flag for bit, flag in self.MOZILLA_FLAGS if value & bit)
+        for match in _STATUS_RE.finditer(headers):
+            flags.update(self.STATUS_FLAGS[letter] for letter in match.group(1).decode()
+                         if letter in self.STATUS_FLAGS)
+        return flags
+
+    def search(self, criteria="ALL"):
+        criteria = LocalCriteria(criteria)
+        found = []
+        for index in range(len(self.reader)):
+            date = self.reader.date(index) if criteria.needs_date else None
+            if criteria.matches(self.header_flags(self.reader.headers(index)), date):
+                found.append(index + 1)
+        return found
+
+    def fetch(self, uids, peek=True, headers_only=False, limit=None):
+        for uid in uids:
+            if not 0 < uid <= len(self.reader):
+                continue
+            headers = self.reader.headers(uid - 1)
+            raw = headers if headers_only else self.reader.message(uid - 1)[:limit]
+            self.bytes_in += len(raw)
+            yield uid, flags_bytes(self.header_flags(headers)), raw
+
+    def message_size(self, uid):
+        if not 0 < uid <= len(self.reader):
+            return None
+        _, content, end = self.reader.bounds(uid - 1)
+        return end - content
+
+    def source_box(self):
+        """Dossier ouvert par le module mailbox, pour le modifier (verrouillé)"""
+        if self.box is None:
+            self.box = mailbox.mbox(self.reader.path, factory=None, create=False)
+            self.box.lock()
+        return self.box
+
+    def target(self, folder):
+        path = self.folder_path(folder)
+        if not path.is_file():
+            return None
+        box = self.targets.get(path)
+        if box is None:
+            box = self.targets[path] = mailbox.mbox(path, factory=None, create=False)
+            box.lock()
+        return box
+
+    def copy(self, uids, folder):
+        target = self.target(folder)
+        if target is None:
+            return False
+        for uid in uids:
+            if not 0 < uid <= len(self.reader):
+                return False
+            message = mailbox.mboxMessage(self.reader.message(uid - 1).tobytes())
+            message.set_from(self.reader.from_line(uid - 1)[5:].decode("ascii", errors="replace"))
+            target.add(message)
+        return True
+
+    def add_flags(self, uids, *flags):
+        if any(flag not in self.LETTER_FLAGS for flag in flags):
+            return False  # mots-clés IMAP: pas d'équivalent mbox portable
+        for uid in uids:
+            try:
+                message = self.source_box().get_message(uid - 1)
+            except KeyError:
+                return False
+            for flag in flags:
+                message.add_flag(self.LETTER_FLAGS[flag])
+            # Thunderbird relit X-Mozilla-Status quand il reconstruit son index .msf
+            if message["X-Mozilla-Status"]:
+                try:
+                    value = int(message["X-Mozilla-Status"].strip(), 16)
+                except ValueError:
+                    value = 0
+                for bit, flag in self.MOZILLA_FLAGS:
+                    if flag in flags:
+                        value |= bit
+                message.replace_header("X-Mozilla-Status", f"{value:04x}")
+            self.box[uid - 1] = message
+            self.modified = True
+            if "\\Deleted" in flags:
+                self.deleted.add(uid)
+        return True
+
+    def expunge(self):
+        if self.deleted:
+            box = self.source_box()
+            for uid in self.deleted:
+                box.discard(uid - 1)
+            self.deleted = set()
+            self.modified = True
+        return True
+
+    def flush(self):
+        """Réécrire le dossier ouvert s'il a été modifié"""
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.box is None:
+            return
+        if self.modified:
+            self.box.flush()
+            self.modified = False
+        self.box.unlock()
+        self.box.close()
+        self.box = None
+
+    def create_folder(self, folder):
+        path = self.folder_path(folder)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+        return True
+
+    def close(self):
+        self.flush()
+        for box in self.targets.values():
+            box.flush()
+            box.unlock()
+            box.close()
+        self.targets = {}
+
+
+def open_local_backend(kind, path, state_dir=None):
+    """Source locale d'après le type choisi dans l'interface ("maildir" ou "mbox")"""
+    if kind == "maildir":
+        return MaildirBackend(path, state_dir=state_dir)
+    if kind == "mbox":
+        return MboxBackend(path, state_dir=state_dir)
+    raise BackendError(f"type de source inconnu: {kind}")
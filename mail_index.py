@@ -0,0 +1,357 @@
+"""
+Index local SQLite des emails vus par Email Manager V3
+Une ligne par message, clé (compte, dossier, UIDVALIDITY, UID): Message-ID,
+en-têtes décodés, date, taille, flags et action décidée. Écrit par lots
+(une transaction par lot de process_folder), il évite de retélécharger les
+emails déjà analysés avec les mêmes règles et sert aux rapports et aux
+simulations de règles hors ligne (début du corps conservé en option).
+Un index plein texte FTS5 (trigrammes, sans copie des textes) sur le sujet
+et le corps répond à "quels emails en cache contiennent X" sans parcourir
+les messages; sans tokenizer trigram (SQLite antérieur à 3.34), l'index
+fonctionne sans lui.
+folder_state retient le HIGHESTMODSEQ (CONDSTORE) des dossiers dont la
+dernière analyse complète n'a rien eu à faire: tant qu'il ne change pas, le
+dossier peut être sauté sans recherche.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+SCHEMA_VERSION = 5
+# Version écrite sans index plein texte: table search à reconstruire dès que possible
+NO_FULLTEXT_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    UNIQUE (account, folder, uidvalidity)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    folder_id INTEGER NOT NULL REFERENCES folders(id),
+    uid INTEGER NOT NULL,
+    message_id TEXT,
+    from_addr TEXT,
+    to_addr TEXT,
+    cc_addr TEXT,
+    subject TEXT,
+    date INTEGER,
+    size INTEGER,
+    flags TEXT,
+    action TEXT,
+    rule TEXT,
+    target TEXT,
+    rules_version TEXT,
+    seen_at INTEGER NOT NULL,
+    applied INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (folder_id, uid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id);
+CREATE TABLE IF NOT EXISTS bodies (
+    folder_id INTEGER NOT NULL,
+    uid INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (folder_id, uid)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS folder_state (
+    folder_id INTEGER PRIMARY KEY REFERENCES folders(id),
+    modseq INTEGER NOT NULL,
+    settings TEXT NOT NULL
+);
+"""
+
+# Index plein texte, facultatif (FTS5 et tokenizer trigram: SQLite 3.34 ou plus).
+# Sans contenu (content=''): les textes restent dans messages et bodies, la
+# table ne garde que l'index; flush la tient à jour.
+FULLTEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+    subject, body, content = '', tokenize = 'trigram'
+)
+"""
+
+# Textes indexés d'un message, tels qu'enregistrés dans messages et bodies; clé
+# dans search: (folder_id << 32) | uid (les UIDs tiennent sur 32 bits)
+SEARCH_SOURCE = ("SELECT {command}(m.folder_id << 32) | m.uid, coalesce(m.subject, ''), "
+                 "coalesce(b.body, '') FROM messages m LEFT JOIN bodies b "
+                 "ON b.folder_id = m.folder_id AND b.uid = m.uid")
+
+COLUMNS = ("folder_id", "uid", "message_id", "from_addr", "to_addr", "cc_addr", "subject",
+           "date", "size", "flags", "action", "rule", "target", "rules_version", "seen_at",
+           "applied")
+
+# Actions après lesquelles le message n'est plus dans son dossier d'origine
+MOVE_ACTIONS = ("move", "Déplacer vers", "Supprimer")
+
+# Actions qui laissent une copie du message dans un autre dossier
+COPY_ACTIONS = MOVE_ACTIONS + ("copy", "Copier vers")
+
+# Messages encore dans leur dossier, pour le dernier UIDVALIDITY connu de chaque dossier
+CURRENT_MESSAGES = ("f.account = ? AND NOT (m.applied AND m.action IN "
+                    f"({', '.join('?' * len(MOVE_ACTIONS))})) "
+                    "AND f.id = (SELECT MAX(id) FROM folders "
+                    "WHERE account = f.account AND folder = f.folder)")
+
+
+# Message d'une ligne de search: clé primaire de messages (et non l'expression
+# (folder_id << 32) | uid, qui obligerait SQLite à parcourir tout le dossier)
+SEARCH_JOIN = "JOIN messages m ON m.folder_id = s.rowid >> 32 AND m.uid = s.rowid & 0xFFFFFFFF"
+
+
+def match_expression(terms, columns=("subject", "body")):
+    """Requête FTS5 vraie si l'une des sous-chaînes (3 caractères minimum) est dans l'une des colonnes"""
+    phrases = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f"{{{' '.join(columns)}}} : ({phrases})"
+
+
+def parse_date(value):
+    """En-tête Date en timestamp Unix (None si illisible)"""
+    if not value:
+        return None
+    try:
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def rules_fingerprint(*parts):
+    """Empreinte courte de la configuration de tri (règles, chaînes, options CC)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class MailIndex:
+    """Index SQLite des enveloppes, écrit par lots depuis le thread d'analyse"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        try:
+            if version < SCHEMA_VERSION:
+                # Table search d'une version précédente (copie des textes) ou pas à jour
+                self.db.execute("DROP TABLE IF EXISTS search")
+            self.db.execute(FULLTEXT_SCHEMA)
+            self.fulltext = True
+        except sqlite3.OperationalError:
+            # Pas de présélection plein texte: les simulations parcourent tout le cache
+            self.fulltext = False
+        self.migrate(version)
+        self.pending = []
+        self.pending_bodies = []
+        self.folder_ids = {}
+
+    def migrate(self, version):
+        """Mettre à niveau une base créée par une version précédente
+
+        La table search est remplie depuis les messages quand elle vient d'être
+        créée; une base écrite sans index plein texte garde NO_FULLTEXT_VERSION.
+        """
+        if version < 2:
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(messages)")}
+            if "applied" not in columns:
+                self.db.execute("ALTER TABLE messages ADD COLUMN applied INTEGER NOT NULL DEFAULT 0")
+        if self.fulltext and version < SCHEMA_VERSION:
+            with self.db:
+                self.db.execute("INSERT INTO search (rowid, subject, body) "
+                                + SEARCH_SOURCE.format(command=""))
+        self.db.execute("PRAGMA user_version="
+                        f"{SCHEMA_VERSION if self.fulltext else NO_FULLTEXT_VERSION}")
+
+    def folder_id(self, account, folder, uidvalidity):
+        """Identifiant du dossier (créé au besoin); un nouvel UIDVALIDITY repart de zéro"""
+        key = (account, folder, int(uidvalidity or 0))
+        folder_id = self.folder_ids.get(key)
+        if folder_id is None:
+            with self.lock, self.db:
+                self.db.execute("INSERT OR IGNORE INTO folders (account, folder, uidvalidity) "
+                                "VALUES (?, ?, ?)", key)
+                folder_id = self.db.execute(
+                    "SELECT id FROM folders WHERE account = ? AND folder = ? AND uidvalidity = ?",
+                    key).fetchone()[0]
+            self.folder_ids[key] = folder_id
+        return folder_id
+
+    def add(self, folder_id, uid, message_id, from_addr, to_addr, cc_addr, subject, date,
+            size, flags, action=None, rule=None, target=None, rules_version=None,
+            applied=False, body=None):
+        """Mettre un message en attente d'écriture (voir flush)"""
+        self.pending.append((folder_id, uid, message_id, from_addr, to_addr, cc_addr, subject,
+                             parse_date(date), size, flags, action, rule, target, rules_version,
+                             int(time.time()), int(bool(applied))))
+        self.pending_bodies.append((folder_id, uid, subject or "", body))
+
+    def flush(self):
+        """Écrire les messages en attente en une seule transaction"""
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        bodies, self.pending_bodies = self.pending_bodies, []
+        placeholders = ", ".join("?" * len(COLUMNS))
+        # Dernière version de chaque message du lot
+        latest = {(folder_id, uid): (subject, body) for folder_id, uid, subject, body in bodies}
+        with self.lock, self.db:
+            if self.fulltext:
+                # Table sans contenu: une ligne se retire en redonnant les textes indexés
+                self.db.executemany("INSERT INTO search (search, rowid, subject, body) "
+                                    + SEARCH_SOURCE.format(command="'delete', ")
+                                    + " WHERE m.folder_id = ? AND m.uid = ?", latest)
+            self.db.executemany(f"INSERT OR REPLACE INTO messages ({', '.join(COLUMNS)}) "
+                                f"VALUES ({placeholders})", rows)
+            self.db.executemany("INSERT OR REPLACE INTO bodies (folder_id, uid, body) "
+                                "VALUES (?, ?, ?)",
+                                ((folder_id, uid, body) for folder_id, uid, _, body in bodies
+                                 if body is not None))
+            if self.fulltext:
+                # Sans nouveau corps, celui déjà conservé dans bodies reste indexé
+                self.db.executemany("INSERT INTO search (rowid, subject, body) VALUES "
+                                    "((? << 32) | ?, ?, coalesce(?, (SELECT body FROM bodies "
+                                    "WHERE folder_id = ? AND uid = ?), ''))",
+                                    ((folder_id, uid, subject, body, folder_id, uid)
+                                     for (folder_id, uid), (subject, body) in latest.items()))
+        return len(rows)
+
+    def reusable_uids(self, folder_id, rules_version, recheck_flagged=False, recent_seconds=0):
+        """UIDs déjà analysés sans action avec la même configuration de tri
+
+        recheck_flagged: exclure les messages marqués importants (la décision CC
+        dépend du flag); recent_seconds: exclure ceux qui étaient récents au
+        moment de l'analyse (option CC "ignorer les emails récents").
+        """
+        query = ("SELECT uid FROM messages WHERE folder_id = ? AND rules_version = ? "
+                 "AND action IS NULL")
+        params = [folder_id, rules_version]
+        if recheck_flagged:
+            query += " AND instr(flags, '\\Flagged') = 0"
+        if recent_seconds:
+            query += " AND date IS NOT NULL AND date < seen_at - ?"
+            params.append(recent_seconds)
+        with self.lock:
+            return {row[0] for row in self.db.execute(query, params)}
+
+    def folder_unchanged(self, folder_id, modseq, settings):
+        """Vrai si le dossier n'a pas changé (même HIGHESTMODSEQ) depuis une analyse sans action
+
+        settings: empreinte des réglages de tri de cette analyse (voir save_folder_state).
+        """
+        with self.lock:
+            row = self.db.execute("SELECT modseq, settings FROM folder_state WHERE folder_id = ?",
+                                  (folder_id,)).fetchone()
+        return row is not None and row[0] == modseq and row[1] == settings
+
+    def save_folder_state(self, folder_id, modseq, settings):
+        """Retenir le HIGHESTMODSEQ d'un dossier entièrement analysé sans aucune action"""
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO folder_state (folder_id, modseq, settings) "
+                            "VALUES (?, ?, ?)", (folder_id, modseq, settings))
+
+    def handled(self, account, message_id, folder_id=None, uid=None, rules_version=None):
+        """Vrai si l'email (folder_id, uid) de ce Message-ID est déjà trié sur le compte
+
+        C'est le cas d'une copie d'un email copié ou déplacé (COPY_ACTIONS)
+        depuis un autre dossier; un email traité sur place (marqué lu, étiqueté,
+        original d'une copie) ne l'est que pour la même version des règles.
+        """
+        query = ("SELECT 1 FROM messages m JOIN folders f ON f.id = m.folder_id "
+                 "WHERE m.message_id = ? AND f.account = ? AND m.applied "
+                 "AND m.action IS NOT NULL AND CASE WHEN m.folder_id IS ? AND m.uid IS ? "
+                 "THEN m.rules_version IS ? "
+                 f"ELSE m.action IN ({', '.join('?' * len(COPY_ACTIONS))}) END LIMIT 1")
+        params = (message_id, account, folder_id, uid, rules_version, *COPY_ACTIONS)
+        with self.lock:
+            return self.db.execute(query, params).fetchone() is not None
+
+    def cached_messages(self, account, folders=None, match=None):
+        """Messages encore dans leur dossier (pas déplacés ni supprimés), pour simulation
+
+        Itère sur des tuples (folder, uid, subject, from_addr, to_addr, cc_addr,
+        date, flags, body); body vaut None si le corps n'a pas été conservé.
+        match: requête FTS5 (voir match_expression) qui restreint les messages,
+        ignorée sans index plein texte (fulltext).
+        """
+        params = []
+        if match and self.fulltext:
+            # Parcours des seules lignes trouvées par l'index plein texte
+            source = f"search s {SEARCH_JOIN}"
+            condition = "search MATCH ? AND "
+            params.append(match)
+        else:
+            source = "messages m"
+            condition = ""
+        query = ("SELECT f.folder, m.uid, m.subject, m.from_addr, m.to_addr, m.cc_addr, "
+                 f"m.date, m.flags, b.body FROM {source} "
+                 "JOIN folders f ON f.id = m.folder_id "
+                 "LEFT JOIN bodies b ON b.folder_id = m.folder_id AND b.uid = m.uid "
+                 f"WHERE {condition}{CURRENT_MESSAGES}")
+        params += [account, *MOVE_ACTIONS]
+        if folders:
+            query += f" AND f.folder IN ({', '.join('?' * len(folders))})"
+            params.extend(folders)
+        with self.lock:
+            rows = self.db.execute(query, params).fetchall()
+        return rows
+
+    def count_cached(self, account):
+        """Nombre de messages que cached_messages parcourrait sans restriction"""
+        query = ("SELECT COUNT(*) FROM messages m JOIN folders f ON f.id = m.folder_id "
+                 f"WHERE {CURRENT_MESSAGES}")
+        with self.lock:
+            return self.db.execute(query, [account, *MOVE_ACTIONS]).fetchone()[0]
+
+    def search(self, account, text, columns=("subject", "body"), limit=100):
+        """Emails en cache (encore dans leur dossier) dont le sujet ou le corps contient text
+
+        text: 3 caractères minimum (index trigrammes). Retourne des dictionnaires
+        (folder, uid, subject, from_addr, date), les plus récents d'abord. Sans
+        index plein texte, les messages sont parcourus (LIKE).
+        """
+        if self.fulltext:
+            query = ("SELECT f.folder, m.uid, m.subject, m.from_addr, m.date FROM search s "
+                     f"{SEARCH_JOIN} JOIN folders f ON f.id = m.folder_id "
+                     f"WHERE search MATCH ? AND {CURRENT_MESSAGES} ORDER BY m.date DESC LIMIT ?")
+            params = [match_expression([text], columns), account, *MOVE_ACTIONS, limit]
+        else:
+            fields = {"subject": "m.subject", "body": "b.body"}
+            condition = " OR ".join(f"{fields[column]} LIKE ? ESCAPE '\\'" for column in columns)
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            query = ("SELECT f.folder, m.uid, m.subject, m.from_addr, m.date FROM messages m "
+                     "JOIN folders f ON f.id = m.folder_id "
+                     "LEFT JOIN bodies b ON b.folder_id = m.folder_id AND b.uid = m.uid "
+                     f"WHERE ({condition}) AND {CURRENT_MESSAGES} ORDER BY m.date DESC LIMIT ?")
+            params = [*[pattern] * len(columns), account, *MOVE_ACTIONS, limit]
+        with self.lock:
+            return [{"folder": row[0], "uid": row[1], "subject": row[2], "from_addr": row[3],
+                     "date": row[4]}
+                    for row in self.db.execute(query, params)]
+
+    def summary(self, account=None):
+        """Nombre de messages et actions par dossier (rapports)"""
+        query = ("SELECT f.account, f.folder, COUNT(*), SUM(m.action IS NOT NULL), SUM(m.size) "
+                 "FROM messages m JOIN folders f ON f.id = m.folder_id")
+        params = []
+        if account:
+            query += " WHERE f.account = ?"
+            params.append(account)
+        query += " GROUP BY f.id ORDER BY f.account, f.folder"
+        with self.lock:
+            return [{"account": row[0], "folder": row[1], "messages": row[2],
+                     "actions": row[3] or 0, "bytes": row[4] or 0}
+                    for row in self.db.execute(query, params)]
+
+    def close(self):
+        """Écrire ce qui reste et fermer la base"""
+        self.flush()
+        with self.lock:
+            self.db.execute("PRAGMA optimize")
+            self.db.close()
@@ -0,0 +1,148 @@
+"""
+Déduplication des emails par Message-ID pour Email Manager V3
+Un filtre de Bloom extensible, conservé sur disque par compte, retient les
+Message-ID des emails déjà triés (action appliquée): une copie faite par une
+règle "Copier vers" n'est pas réexaminée, ni retraitée, dans le dossier de
+destination. La mémoire reste bornée (environ 1,8 octet par email trié pour
+un taux de faux positifs de 1/1000), quelle que soit la taille des dossiers;
+une réponse positive peut être confirmée sur un ensemble exact (l'index local).
+"""
+
+import hashlib
+import math
+import os
+import re
+import struct
+from pathlib import Path
+
+_MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+
+
+def normalize_message_id(value):
+    """Message-ID sans espaces ni repli d'en-tête ("" si absent)"""
+    if not value:
+        return ""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value).decode("ascii", errors="replace")
+    match = _MESSAGE_ID_RE.search(value)
+    return match.group(0) if match else value.strip()
+
+
+class BloomFilter:
+    """Filtre de Bloom à double hachage (blake2b), dimensionné pour capacity clés"""
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def positions(self, key):
+        h1, h2 = struct.unpack("<QQ", hashlib.blake2b(key.encode("utf-8", errors="replace"),
+                                                      digest_size=16).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(key))
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+class ProcessedMessages:
+    """Message-ID déjà triés d'un compte: filtres de Bloom successifs persistés
+
+    Quand un filtre est plein, un filtre deux fois plus grand (et plus strict)
+    prend le relais: le taux de faux positifs global reste sous error_rate.
+    confirm(message_id, *contexte) -> bool, si fourni, vérifie les réponses
+    positives (contexte: arguments supplémentaires de contains).
+    """
+
+    MAGIC = b"EMBLOOM1"
+    FILTER_HEADER = struct.Struct("<QdQ")  # capacité, taux d'erreur, nombre de clés
+
+    def __init__(self, path, confirm=None, capacity=10000, error_rate=0.001):
+        self.path = Path(path)
+        self.confirm = confirm
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.filters = []
+        self.dirty = False
+        self.positives = 0
+        self.false_positives = 0
+        self.load()
+
+    def load(self):
+        """Relire les filtres enregistrés (filtre vide si absent ou illisible)"""
+        self.filters = []
+        try:
+            with open(self.path, "rb") as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return
+                count, = struct.unpack("<I", f.read(4))
+                for _ in range(count):
+                    capacity, error_rate, keys = self.FILTER_HEADER.unpack(
+                        f.read(self.FILTER_HEADER.size))
+                    bloom = BloomFilter(capacity, error_rate, count=keys)
+                    bits = f.read(len(bloom.bits))
+                    if len(bits) != len(bloom.bits):
+                        raise EOFError
+                    bloom.bits = bytearray(bits)
+                    self.filters.append(bloom)
+        except (OSError, EOFError, struct.error):
+            self.filters = []
+
+    def save(self):
+        """Écrire les filtres (fichier temporaire puis remplacement)"""
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack("<I", len(self.filters)))
+            for bloom in self.filters:
+                f.write(self.FILTER_HEADER.pack(bloom.capacity, bloom.error_rate, bloom.count))
+                f.write(bloom.bits)
+        os.replace(temporary, self.path)
+        self.dirty = False
+
+    def add(self, message_id):
+        if not message_id or message_id in self:
+            return
+        if not self.filters or self.filters[-1].full:
+            generation = len(self.filters)
+            # Somme des taux d'erreur bornée par error_rate (série géométrique)
+            self.filters.append(BloomFilter(self.initial_capacity * 2 ** generation,
+                                            self.error_rate / 2 ** (generation + 1)))
+        self.filters[-1].add(message_id)
+        self.dirty = True
+
+    def __contains__(self, message_id):
+        return self.contains(message_id)
+
+    def contains(self, message_id, *context):
+        """Vrai si ce Message-ID a déjà été trié (context transmis à confirm)"""
+        if not message_id or not any(message_id in bloom for bloom in self.filters):
+            return False
+        self.positives += 1
+        if self.confirm is not None and not self.confirm(message_id, *context):
+            self.false_positives += 1
+            return False
+        return True
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def memory_bytes(self):
+        return sum(len(bloom.bits) for bloom in self.filters)
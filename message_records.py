@@ -0,0 +1,71 @@
+"""
+Enregistrements compacts du pipeline de tri d'Email Manager V3
+MessageRecord porte les seuls champs utiles au tri d'un email (en-têtes
+décodés, flags, taille, début du corps): seuls les en-têtes sont analysés,
+le contenu brut n'est parsé que si une règle ou l'index demande le corps, et
+la mémoire d'un run est bornée par la taille des lots et non par celle des
+dossiers. Action décrit la décision prise pour un email, de la
+classification à l'exécution, au journal et à l'index. Les deux classes
+utilisent __slots__ (pas de dictionnaire par instance).
+"""
+
+
+class MessageRecord:
+    """Champs d'un email nécessaires au tri
+
+    body: début du corps, None tant qu'il n'est pas extrait; raw: contenu brut
+    conservé jusqu'à l'extraction du corps (None pour un email de l'index ou
+    lu depuis son enveloppe); received: date de réception (INTERNALDATE).
+    """
+
+    __slots__ = ("uid", "message_id", "subject", "from_addr", "to_addr", "cc_addr", "date",
+                 "flags", "size", "body", "raw", "received")
+
+    def __init__(self, uid, message_id, subject, from_addr, to_addr, cc_addr, date, flags,
+                 size=0, body=None, raw=None, received=None):
+        self.uid = uid
+        self.message_id = message_id
+        self.subject = subject
+        self.from_addr = from_addr
+        self.to_addr = to_addr
+        self.cc_addr = cc_addr
+        self.date = date
+        self.flags = flags
+        self.size = size
+        self.body = body
+        self.raw = raw
+        self.received = received
+
+    @property
+    def is_unread(self):
+        return b'\\Seen' not in self.flags
+
+    @property
+    def has_body(self):
+        """Corps disponible (déjà extrait, ou contenu brut conservé)"""
+        return self.body is not None or self.raw is not None
+
+    def __repr__(self):
+        return f"MessageRecord(uid={self.uid!r}, subject={self.subject!r})"
+
+
+class Action:
+    """Décision de tri: action (nom de l'interface, ou "move" pour la gestion CC) et cible"""
+
+    __slots__ = ("kind", "folder", "mark_read", "rule", "chain")
+
+    def __init__(self, kind, folder="", mark_read=False, rule=None, chain=None):
+        self.kind = kind
+        self.folder = folder
+        self.mark_read = mark_read
+        self.rule = rule
+        self.chain = chain
+
+    @classmethod
+    def from_rule(cls, rule, chain=None):
+        """Action d'une règle (et de sa chaîne éventuelle)"""
+        return cls(rule.get('action'), rule.get('folder', ''),
+                   rule.get('mark_after_action', False), rule.get('name', 'Sans nom'), chain)
+
+    def __repr__(self):
+        return f"Action({self.kind!r}, {self.folder!r}, rule={self.rule!r})"
@@ -0,0 +1,281 @@
+"""
+Instrumentation des performances pour Email Manager V3
+Chronomètres par étape (horloge monotone), histogrammes de latence p50/p95/p99,
+compteurs d'octets, trace Chrome/Perfetto optionnelle et capture d'un profil
+(cProfile ou pyinstrument).
+"""
+
+import cProfile
+import json
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    from pyinstrument import Profiler as PyInstrumentProfiler
+except ImportError:
+    PyInstrumentProfiler = None
+
+
+class LatencyHistogram:
+    """Échantillons de latence d'une étape (réservoir borné pour les percentiles)"""
+
+    MAX_SAMPLES = 10000
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        """Ajouter une mesure en secondes"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        # Échantillonnage en réservoir: mémoire bornée quel que soit le volume
+        if len(self.samples) < self.MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < self.MAX_SAMPLES:
+                self.samples[index] = seconds
+
+    def percentile(self, p, ordered=None):
+        """Percentile p (0-100) en secondes"""
+        if ordered is None:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def summary(self):
+        """Résumé en millisecondes"""
+        ordered = sorted(self.samples)
+
+        def pick(p):
+            return self.percentile(p, ordered)
+
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(pick(50) * 1000, 3),
+            "p95_ms": round(pick(95) * 1000, 3),
+            "p99_ms": round(pick(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+
+class TraceRecorder:
+    """Évènements au format Chrome trace (chrome://tracing, ui.perfetto.dev)"""
+
+    def __init__(self, process_name="Email Manager V3"):
+        self.process_name = process_name
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lanes = {}
+        self.lock = threading.Lock()
+
+    def lane_id(self, lane):
+        """Numéro de piste (tid) associé à un nom de thread ou de connexion"""
+        tid = self.lanes.get(lane)
+        if tid is None:
+            with self.lock:
+                tid = self.lanes.setdefault(lane, len(self.lanes) + 1)
+        return tid
+
+    def complete(self, name, started, duration, lane=None, category="engine", args=None):
+        """Ajouter une tranche (évènement 'X') mesurée avec time.perf_counter()"""
+        if lane is None:
+            lane = threading.current_thread().name
+        self.events.append((name, category, started, duration, self.lane_id(lane), args))
+
+    def export(self, path):
+        """Écrire la trace JSON et retourner son chemin"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        trace_events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0,
+                         "args": {"name": self.process_name}}]
+        for lane, tid in self.lanes.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                                 "args": {"name": lane}})
+
+        for name, category, started, duration, tid, args in self.events:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((started - self.origin) * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": 1,
+                "tid": tid
+            }
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f,
+                      ensure_ascii=False, default=str)
+        return path
+
+
+class _StageTimer:
+    """Gestionnaire de contexte léger qui chronomètre une étape"""
+
+    __slots__ = ("perf", "name", "trace_name", "args", "started")
+
+    def __init__(self, perf, name, trace_name, args):
+        self.perf = perf
+        self.name = name
+        self.trace_name = trace_name
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.perf.span(self.name, self.started, self.trace_name, self.args)
+        return False
+
+
+class PerfStats:
+    """Statistiques de performance d'une analyse"""
+
+    def __init__(self, tracer=None):
+        self.stages = {}
+        self.counters = {}
+        self.tracer = tracer
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def stage(self, name, trace_name=None, args=None):
+        """Chronométrer un bloc: with perf.stage('fetch'): ...
+
+        trace_name et args ne servent qu'à la trace Chrome (nom affiché, détails).
+        """
+        return _StageTimer(self, name, trace_name, args)
+
+    def span(self, name, started, trace_name=None, args=None):
+        """Enregistrer une étape commencée à started (time.perf_counter())"""
+        duration = time.perf_counter() - started
+        self.add(name, duration)
+        if self.tracer is not None:
+            self.tracer.complete(trace_name or name, started, duration, args=args)
+
+    def add(self, name, seconds):
+        """Ajouter une mesure à l'histogramme d'une étape"""
+        histogram = self.stages.get(name)
+        if histogram is None:
+            histogram = self.stages[name] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def count(self, name, value=1):
+        """Incrémenter un compteur (octets, messages...)"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stop(self):
+        """Figer la durée totale du run"""
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        """Durée écoulée en secondes"""
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self, messages=0):
+        """Résumé sérialisable en JSON"""
+        elapsed = self.elapsed
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "messages": messages,
+            "messages_per_s": round(messages / elapsed, 2) if elapsed > 0 else 0.0,
+            "counters": dict(self.counters),
+            "stages": {name: histogram.summary() for name, histogram in self.stages.items()}
+        }
+
+    def format_lines(self, messages=0):
+        """Lignes lisibles pour la console, étapes triées par temps total"""
+        summary = self.summary(messages)
+        lines = [f"⏱️ Durée: {summary['elapsed_s']:.1f} s - "
+                 f"{summary['messages_per_s']:.1f} emails/s"]
+
+        counters = summary["counters"]
+        if "bytes_in" in counters or "bytes_out" in counters:
+            lines.append(f"📶 Reçu: {format_bytes(counters.get('bytes_in', 0))}"
+                         f"{compression_text(counters.get('uncompressed_in'), counters.get('bytes_in'))}"
+                         f" - Envoyé: {format_bytes(counters.get('bytes_out', 0))}"
+                         f"{compression_text(counters.get('uncompressed_out'), counters.get('bytes_out'))}")
+        lookups = counters.get("header_cache_hits", 0) + counters.get("header_cache_misses", 0)
+        if lookups:
+            lines.append(f"🧠 Cache des en-têtes: {counters['header_cache_hits'] / lookups:.0%} "
+                         f"de valeurs déjà décodées ({lookups} en-têtes)")
+
+        ordered = sorted(summary["stages"].items(), key=lambda item: -item[1]["total_ms"])
+        for name, stage in ordered:
+            lines.append(f"  • {name}: n={stage['count']} total={stage['total_ms'] / 1000:.2f}s "
+                         f"p50={stage['p50_ms']:.1f}ms p95={stage['p95_ms']:.1f}ms "
+                         f"p99={stage['p99_ms']:.1f}ms")
+        return lines
+
+
+def compression_text(uncompressed, transferred):
+    """Suffixe " (X décompressés, ×ratio)" d'un flux compressé, vide sinon"""
+    if not uncompressed or not transferred:
+        return ""
+    return f" ({format_bytes(uncompressed)} décompressés, ×{uncompressed / transferred:.1f})"
+
+
+def format_bytes(size):
+    """Formater une taille en octets"""
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if size < 1024 or unit == "Go":
+            return f"{size:.0f} {unit}" if unit == "o" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class RunProfiler:
+    """Capture d'un profil pour une seule analyse (pyinstrument si installé, sinon cProfile)"""
+
+    def __init__(self):
+        if PyInstrumentProfiler is not None:
+            self.kind = "pyinstrument"
+            self.profiler = PyInstrumentProfiler()
+        else:
+            self.kind = "cProfile"
+            self.profiler = cProfile.Profile()
+
+    def start(self):
+        """Démarrer la capture (dans le thread à profiler)"""
+        if self.kind == "pyinstrument":
+            self.profiler.start()
+        else:
+            self.profiler.enable()
+
+    def stop(self, directory):
+        """Arrêter la capture et l'écrire dans le dossier de données
+
+        La capture est arrêtée même si l'écriture échoue (OSError).
+        """
+        if self.kind == "pyinstrument":
+            self.profiler.stop()
+        else:
+            self.profiler.disable()
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if self.kind == "pyinstrument":
+            path = directory / f"profile_{stamp}.html"
+            path.write_text(self.profiler.output_html(), encoding="utf-8")
+        else:
+            path = directory / f"profile_{stamp}.prof"
+            self.profiler.dump_stats(str(path))
+        return path
@@ -0,0 +1,127 @@
+"""
+Journal d'exécution JSONL pour Email Manager V3
+Chaque décision de tri est écrite sur une ligne JSON par un thread dédié,
+avec vidage périodique et rotation des fichiers par taille.
+"""
+
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+
+class RunJournal:
+    """Écrivain asynchrone de journal JSONL avec rotation"""
+
+    _STOP = object()
+
+    def __init__(self, directory, base_name="run_journal", max_bytes=10 * 1024 * 1024,
+                 backup_count=5, flush_interval=1.0):
+        self.directory = Path(directory)
+        self.base_name = base_name
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.run_id = None
+        self.queue = queue.Queue()
+        self.thread = None
+        self.file = None
+        self.errors = 0
+
+    @property
+    def path(self):
+        """Chemin du fichier de journal courant"""
+        return self.directory / f"{self.base_name}.jsonl"
+
+    def start(self, **run_info):
+        """Démarrer le thread d'écriture et enregistrer le début du run"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.run_id = uuid.uuid4().hex[:12]
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True,
+                                       name="run-journal")
+        self.thread.start()
+        self.record("run_start", **run_info)
+
+    def record(self, event, **fields):
+        """Ajouter un évènement au journal (ne touche jamais le disque)"""
+        fields["event"] = event
+        fields["run_id"] = self.run_id
+        fields["ts"] = datetime.now().isoformat(timespec="milliseconds")
+        self.queue.put(fields)
+
+    def close(self, **run_info):
+        """Enregistrer la fin du run, vider la file et arrêter le thread"""
+        if not self.thread:
+            return
+        self.record("run_end", **run_info)
+        self.queue.put(self._STOP)
+        self.thread.join(timeout=10)
+        self.thread = None
+
+    def _writer_loop(self):
+        """Boucle du thread d'écriture: regroupe les lignes et vide périodiquement"""
+        pending = []
+        last_flush = time.monotonic()
+        running = True
+
+        while running:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout)
+                if item is self._STOP:
+                    running = False
+                else:
+                    pending.append(item)
+                    # Récupérer tout ce qui est déjà disponible
+                    while True:
+                        item = self.queue.get_nowait()
+                        if item is self._STOP:
+                            running = False
+                            break
+                        pending.append(item)
+            except queue.Empty:
+                pass
+
+            if pending and (not running or time.monotonic() - last_flush >= self.flush_interval):
+                self._write(pending)
+                pending = []
+                last_flush = time.monotonic()
+            elif not pending:
+                last_flush = time.monotonic()
+
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _write(self, entries):
+        """Écrire un lot de lignes puis vérifier la rotation"""
+        try:
+            if self.file is None:
+                self.file = open(self.path, "a", encoding="utf-8")
+            lines = [json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in entries]
+            self.file.write("".join(lines))
+            self.file.flush()
+
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+        except Exception:
+            # Le journal ne doit jamais interrompre le tri
+            self.errors += 1
+
+    def _rotate(self):
+        """Faire tourner les fichiers: run_journal.jsonl -> run_journal.1.jsonl -> ..."""
+        self.file.close()
+        self.file = None
+
+        for index in range(self.backup_count - 1, 0, -1):
+            source = self.directory / f"{self.base_name}.{index}.jsonl"
+            if source.exists():
+                source.replace(self.directory / f"{self.base_name}.{index + 1}.jsonl")
+
+        if self.backup_count > 0:
+            self.path.replace(self.directory / f"{self.base_name}.1.jsonl")
+        else:
+            self.path.unlink()
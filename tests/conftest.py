@@ -0,0 +1,8 @@
+"""Configuration pytest: modules de l'application importables depuis tests/"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
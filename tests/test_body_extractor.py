@@ -0,0 +1,79 @@
+"""Tests de l'extraction du début du corps (body_extractor)"""
+
+import base64
+
+from body_extractor import extract_body
+
+
+def multipart(*parts, subtype="mixed", boundary="limite"):
+    """Email multipart à partir de parties (en-têtes, contenu) en bytes"""
+    lines = [b"From: a@exemple.nc", b"Subject: Test",
+             b"Content-Type: multipart/%s; boundary=\"%s\"" % (subtype.encode(), boundary.encode()),
+             b"", b"Ceci est un message MIME."]
+    for headers, content in parts:
+        lines += [b"--" + boundary.encode(), headers, b"", content]
+    lines.append(b"--" + boundary.encode() + b"--")
+    return b"\r\n".join(lines) + b"\r\n"
+
+
+def test_plain_text():
+    raw = b"From: a@exemple.nc\r\nSubject: Test\r\n\r\nBonjour,\r\nla facture est jointe.\r\n"
+    assert extract_body(raw) == "Bonjour,\r\nla facture est jointe.\r\n"
+    assert extract_body(raw, limit=7) == "Bonjour"
+
+
+def test_attachment_before_text():
+    raw = multipart(
+        (b"Content-Type: text/plain; name=\"notes.txt\"\r\n"
+         b"Content-Disposition: attachment; filename=\"notes.txt\"", b"contenu du fichier joint"),
+        (b"Content-Type: application/pdf\r\nContent-Transfer-Encoding: base64",
+         base64.encodebytes(b"%PDF-1.4 ...").rstrip()),
+        (b"Content-Type: text/plain; charset=iso-8859-1\r\nContent-Transfer-Encoding: quoted-printable",
+         b"Voici le re=E7u de la commande."))
+    assert extract_body(raw) == "Voici le reçu de la commande."
+
+
+def test_html_only():
+    html = ("<html><head><style>p { color: red }</style><script>alert(1)</script></head>"
+            "<body><p>Relance&nbsp;: devis <b>42</b></p><p>Cordialement</p></body></html>")
+    raw = multipart(
+        (b"Content-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: base64",
+         base64.encodebytes(html.encode())),
+        (b"Content-Type: image/png\r\nContent-Disposition: inline", b"iVBORw0KGgo="),
+        subtype="related")
+    assert extract_body(raw) == "Relance : devis 42\nCordialement"
+
+
+def test_plain_text_preferred_to_html():
+    raw = multipart(
+        (b"Content-Type: text/html", b"<p>Version HTML</p>"),
+        (b"Content-Type: text/plain", b"Version texte"),
+        subtype="alternative")
+    assert extract_body(raw) == "Version texte"
+
+
+def test_forwarded_message():
+    forwarded = b"From: b@exemple.nc\r\nSubject: Origine\r\n\r\nTexte d'origine"
+    raw = multipart((b"Content-Type: message/rfc822\r\nContent-Disposition: attachment", forwarded))
+    assert extract_body(raw) == "Texte d'origine"
+
+
+def test_truncated_input():
+    text = "Début du rapport mensuel. " * 200
+    encoded = base64.encodebytes(text.encode("utf-8"))
+    raw = multipart((b"Content-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: base64",
+                     encoded))
+    # Lecture partielle: coupé au milieu du base64, sans délimiteur de fin
+    cut = raw[:raw.index(encoded) + len(encoded) // 2 + 3]
+    body = extract_body(cut, limit=100000)
+    assert body and text.startswith(body.rstrip("�"))
+    assert extract_body(cut, limit=50) == text[:50]
+    # Coupé dans les en-têtes de la partie
+    assert extract_body(raw[:raw.index(b"Content-Transfer-Encoding")]) == ""
+
+
+def test_no_text_part():
+    raw = multipart((b"Content-Type: application/pdf\r\nContent-Transfer-Encoding: base64",
+                     b"JVBERi0xLjQ="))
+    assert extract_body(raw) == ""
+    assert extract_body(memoryview(raw)) == ""
@@ -0,0 +1,155 @@
+"""Tests de bout en bout du moteur (run_headless) sur le serveur IMAP local et des sources locales"""
+
+import mailbox
+from email.header import Header, decode_header, make_header
+
+import pytest
+
+from benchmarks.app_loader import create_manager
+from benchmarks.imap_stub_server import DEFAULT_CAPABILITIES, IMAPStubServer, MailStore
+
+USER = "moi@exemple.nc"
+
+# (sujet, expéditeur, Cc, corps) et dossier attendu avec les règles par défaut
+MESSAGES = [
+    ("Facture 42", "compta@fournisseur.fr", None, "Ci-joint la facture.", "CA"),
+    ("Offre du jour", "offres@promo.com", None, "Promotions.", "Newsletters"),
+    ("Rapport mensuel", "jean@krysto.nc", None, "Chiffres du mois.", "rapport"),
+    ("Réunion", "paul@entreprise.nc", USER, "Mardi 9h.", "EN_COPIE"),
+    ("Point projet", "marie@entreprise.nc", None, "Voir avec Velten demain.", "important"),
+    ("Bonjour", "ami@exemple.fr", None, "Des nouvelles?", "INBOX"),
+]
+
+REFUSED_RULES = [
+    {"name": "Factures", "field": "Sujet", "condition": "contient", "keyword": "facture",
+     "action": "Déplacer vers", "folder": "Absent", "case_sensitive": False, "priority": 1},
+    {"name": "Rapports", "field": "Sujet", "condition": "contient", "keyword": "rapport",
+     "action": "Copier vers", "folder": "Absent", "case_sensitive": False, "priority": 1},
+]
+
+
+def raw_message(n, subject, sender, cc, body):
+    headers = [f"From: {sender}", f"To: {'equipe@entreprise.nc' if cc else USER}"]
+    if cc:
+        headers.append(f"Cc: {cc}")
+    headers += [f"Subject: {Header(subject, 'utf-8').encode()}", "Date: Mon, 1 Jan 2024 10:00:00 +0000",
+                f"Message-ID: <{n}@exemple.nc>", "Content-Type: text/plain; charset=utf-8"]
+    return ("\r\n".join(headers) + "\r\n\r\n" + body + "\r\n").encode()
+
+
+def raw_messages():
+    return [raw_message(n, *fields[:4]) for n, fields in enumerate(MESSAGES)]
+
+
+def expected_folders(prefix=""):
+    folders = {}
+    for subject, *_, folder in MESSAGES:
+        name = folder if folder == "INBOX" else prefix + folder
+        folders.setdefault(name, []).append(subject)
+    return {folder: sorted(subjects) for folder, subjects in folders.items()}
+
+
+def subject_of(message):
+    return str(make_header(decode_header(message["Subject"])))
+
+
+def store_folders(store):
+    folders = {}
+    for name, box in store.mailboxes.items():
+        subjects = [subject_of(mailbox.Message(message.raw)) for message in box.messages
+                    if "\\Deleted" not in message.flags]
+        if subjects:
+            folders[name] = sorted(subjects)
+    return folders
+
+
+def counts(stats):
+    return {key: value for key, value in stats.items() if key != "perf"}
+
+
+@pytest.fixture
+def store():
+    store = MailStore()
+    for raw in raw_messages():
+        store.add_message("INBOX", raw)
+    return store
+
+
+@pytest.mark.parametrize("capabilities", [DEFAULT_CAPABILITIES,
+                                          tuple(c for c in DEFAULT_CAPABILITIES if c != "MOVE")],
+                         ids=["MOVE", "COPY+STORE"])
+def test_imap_run(tmp_path, store, capabilities):
+    with IMAPStubServer(store, capabilities=capabilities) as server:
+        manager = create_manager(tmp_path, *server.address)
+        stats = manager.run_headless()
+        assert counts(stats)["processed"] == len(MESSAGES)
+        assert stats["errors"] == 0
+        assert stats["cc_moved"] == 1
+        assert store_folders(store) == expected_folders("INBOX.")
+
+        # Deuxième analyse: plus rien à trier
+        stats = create_manager(tmp_path, *server.address).run_headless()
+        assert stats["errors"] == 0
+        assert store_folders(store) == expected_folders("INBOX.")
+
+
+def test_imap_dry_run(tmp_path, store):
+    with IMAPStubServer(store) as server:
+        stats = create_manager(tmp_path, *server.address, dry_run=True).run_headless()
+    assert stats["processed"] == len(MESSAGES) and stats["errors"] == 0
+    assert store_folders(store) == {"INBOX": sorted(subject for subject, *_ in MESSAGES)}
+
+
+@pytest.mark.parametrize("capabilities", [DEFAULT_CAPABILITIES,
+                                          tuple(c for c in DEFAULT_CAPABILITIES if c != "MOVE")],
+                         ids=["MOVE", "COPY+STORE"])
+def test_refused_pipelined_actions_are_errors(tmp_path, store, capabilities):
+    with IMAPStubServer(store, capabilities=capabilities) as server:
+        manager = create_manager(tmp_path, *server.address, rules=REFUSED_RULES, cc_enabled=False)
+        # Dossier annoncé présent mais absent du serveur: MOVE/COPY refusés en fin de pipeline
+        manager.create_folder_if_needed = lambda backend, folder_name: True
+        stats = manager.run_headless()
+    assert stats["errors"] == 2
+    assert store_folders(store) == {"INBOX": sorted(subject for subject, *_ in MESSAGES)}
+    assert set(store.mailboxes) == {"INBOX"}
+
+
+def local_folders(kind, root):
+    """Sujets par dossier d'une source locale"""
+    if kind == "maildir":
+        source = mailbox.Maildir(root, create=False)
+        boxes = {"INBOX": source}
+        boxes.update((name, source.get_folder(name)) for name in source.list_folders())
+    else:
+        boxes = {("INBOX" if path.name == "Inbox" else path.name): mailbox.mbox(path, create=False)
+                 for path in root.parent.iterdir() if path.is_file()}
+    folders = {}
+    for name, box in boxes.items():
+        subjects = sorted(subject_of(message) for message in box)
+        if subjects:
+            folders[name] = subjects
+    return folders
+
+
+@pytest.mark.parametrize("kind", ["maildir", "mbox"])
+def test_local_run(tmp_path, kind):
+    if kind == "maildir":
+        root = tmp_path / "Mail"
+        source = mailbox.Maildir(root)
+    else:
+        root = tmp_path / "Mail" / "Inbox"
+        root.parent.mkdir()
+        source = mailbox.mbox(root)
+    for raw in raw_messages():
+        source.add(raw)
+    source.close()
+
+    manager = create_manager(tmp_path / "data", source_type=kind, source_path=str(root))
+    stats = manager.run_headless()
+    assert stats["processed"] == len(MESSAGES)
+    assert stats["errors"] == 0
+    assert local_folders(kind, root) == expected_folders()
+
+    stats = create_manager(tmp_path / "data", source_type=kind, source_path=str(root)).run_headless()
+    assert stats["errors"] == 0
+    assert local_folders(kind, root) == expected_folders()
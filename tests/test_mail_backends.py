@@ -0,0 +1,137 @@
+"""Tests des sources de messages (mail_backends)"""
+
+import os
+
+import pytest
+
+from benchmarks.imap_stub_server import DEFAULT_CAPABILITIES, IMAPStubServer, MailStore
+from imap_transport import InstrumentedIMAP4
+from mail_backends import IMAPBackend, MboxReader
+
+WITHOUT_MOVE = tuple(c for c in DEFAULT_CAPABILITIES if c != "MOVE")
+
+
+def mbox_message(n):
+    return (f"From expediteur@exemple.nc Mon Jan  1 10:00:{n:02d} 2024\n"
+            f"From: expediteur@exemple.nc\nSubject: Message {n}\n\nCorps {n}\n>From ici\n\n").encode()
+
+
+def count_scans(monkeypatch):
+    """Liste des positions de départ des parcours du fichier"""
+    starts = []
+    scan = MboxReader.scan
+    monkeypatch.setattr(MboxReader, "scan",
+                        lambda reader, offsets, start: (starts.append(start),
+                                                        scan(reader, offsets, start)))
+    return starts
+
+
+def test_mbox_offsets_persisted(tmp_path, monkeypatch):
+    path = tmp_path / "Inbox"
+    path.write_bytes(b"".join(mbox_message(n) for n in range(3)))
+    starts = count_scans(monkeypatch)
+
+    reader = MboxReader(path, tmp_path / "state")
+    assert len(reader) == 3
+    assert bytes(reader.message(1)) == b"From: expediteur@exemple.nc\nSubject: Message 1\n\nCorps 1\n>From ici\n"
+    assert bytes(reader.headers(2)).endswith(b"Subject: Message 2\n\n")
+    assert reader.date(0) == 1704103200
+    reader.close()
+    assert len(list((tmp_path / "state").glob("*.offsets"))) == 1
+
+    # Réouverture sans parcours: index repris tel quel
+    reader = MboxReader(path, tmp_path / "state")
+    assert starts == [0]
+    assert list(reader.offsets) == [0, len(mbox_message(0)), 2 * len(mbox_message(0))]
+    reader.close()
+
+
+def test_mbox_rescan_after_append(tmp_path, monkeypatch):
+    path = tmp_path / "Inbox"
+    path.write_bytes(b"".join(mbox_message(n) for n in range(3)))
+    MboxReader(path, tmp_path / "state").close()
+    size = path.stat().st_size
+    starts = count_scans(monkeypatch)
+
+    with open(path, "ab") as f:
+        f.write(mbox_message(3) + mbox_message(4))
+    reader = MboxReader(path, tmp_path / "state")
+    # Seule la fin ajoutée est parcourue
+    assert starts == [size]
+    assert len(reader) == 5
+    assert bytes(reader.headers(4)).endswith(b"Subject: Message 4\n\n")
+    reader.close()
+
+    reader = MboxReader(path, tmp_path / "state")
+    assert starts == [size] and len(reader) == 5
+    reader.close()
+
+
+def test_mbox_rewritten_in_place(tmp_path, monkeypatch):
+    path = tmp_path / "Inbox"
+    path.write_bytes(b"".join(mbox_message(n) for n in range(3)))
+    MboxReader(path, tmp_path / "state").close()
+    starts = count_scans(monkeypatch)
+
+    # Fichier réécrit sur place (même inode): les offsets connus ne tombent plus
+    # sur des lignes From
+    inode = path.stat().st_ino
+    longer = mbox_message(1).replace(b"Corps 1", b"Corps 1 beaucoup plus long")
+    with open(path, "r+b") as f:
+        f.write(longer + mbox_message(2) + mbox_message(3) + mbox_message(4))
+    assert path.stat().st_ino == inode
+    reader = MboxReader(path, tmp_path / "state")
+    assert starts == [0]
+    assert len(reader) == 4
+    assert bytes(reader.message(0)).endswith(b"Corps 1 beaucoup plus long\n>From ici\n")
+    reader.close()
+
+
+def test_mbox_without_index_dir(tmp_path):
+    path = tmp_path / "Inbox"
+    path.write_bytes(b"")
+    reader = MboxReader(path)
+    assert len(reader) == 0
+    reader.close()
+    assert os.listdir(tmp_path) == ["Inbox"]
+
+
+@pytest.fixture
+def store():
+    store = MailStore()
+    for n in range(1, 5):
+        store.add_message("INBOX", f"From: a@exemple.nc\r\nSubject: Message {n}\r\n"
+                                   f"Message-ID: <{n}@exemple.nc>\r\n\r\nCorps\r\n".encode())
+    store.create("INBOX.CA")
+    return store
+
+
+def subjects(store, folder):
+    return sorted(message.raw.split(b"Subject: ")[1].split(b"\r\n")[0].decode()
+                  for message in store.mailboxes[folder].messages)
+
+
+@pytest.mark.parametrize("capabilities", [DEFAULT_CAPABILITIES, WITHOUT_MOVE],
+                         ids=["MOVE", "COPY+STORE"])
+def test_pipeline_refusals(store, capabilities):
+    with IMAPStubServer(store, capabilities=capabilities) as server:
+        connection = InstrumentedIMAP4(*server.address)
+        connection.login("moi@exemple.nc", "secret")
+        backend = IMAPBackend(connection)
+        backend.select("INBOX")
+        assert backend.can_pipeline
+        with backend.pipeline() as failed:
+            # Réponses attendues à la fin du pipeline: tout semble accepté
+            assert backend.move([1], "INBOX.CA")
+            assert backend.move([2], "INBOX.Absent")
+            assert backend.copy([3], "INBOX.Absent")
+            assert backend.move([4], "INBOX.CA")
+        refused = "MOVE INBOX.Absent" if "MOVE" in capabilities else "COPY INBOX.Absent"
+        assert failed == {2: refused, 3: "COPY INBOX.Absent"}
+        backend.expunge()
+        backend.close()
+
+    assert subjects(store, "INBOX.CA") == ["Message 1", "Message 4"]
+    # L'original d'un déplacement refusé n'est pas supprimé
+    assert subjects(store, "INBOX") == ["Message 2", "Message 3"]
+    assert all("\\Deleted" not in message.flags for message in store.mailboxes["INBOX"].messages)
@@ -0,0 +1,176 @@
+"""Tests de l'index local (mail_index)"""
+
+import time
+
+import pytest
+
+import mail_index
+from mail_index import MailIndex, match_expression
+
+DATE = "Mon, 1 Jan 2024 10:00:00 +0000"
+
+
+def fill(index, count, folders=3, marker_every=500):
+    """count messages répartis sur plusieurs dossiers; "zqxjv" dans un corps sur marker_every"""
+    folder_ids = [index.folder_id("moi@exemple.nc", f"INBOX.F{n}", 1) for n in range(folders)]
+    marked = set()
+    for n in range(count):
+        folder_id, uid = folder_ids[n % folders], n // folders + 1
+        body = f"message {n} facture projet"
+        if n % marker_every == 0:
+            body += " zqxjv"
+            marked.add((f"INBOX.F{n % folders}", uid))
+        index.add(folder_id, uid, f"<{n}@exemple.nc>", "a@exemple.nc", "moi@exemple.nc", "",
+                  f"Sujet {n}", DATE, 1000, "", body=body)
+    index.flush()
+    return marked
+
+
+def query_plans(index, call):
+    """Plans d'exécution des requêtes SQL faites par call()"""
+    statements = []
+    index.db.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        index.db.set_trace_callback(None)
+    return [" / ".join(row[3] for row in index.db.execute("EXPLAIN QUERY PLAN " + statement))
+            for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MailIndex(tmp_path / "index.sqlite3")
+    yield index
+    index.close()
+
+
+def test_search_finds_only_matching_messages(index):
+    marked = fill(index, 3000)
+    found = index.search("moi@exemple.nc", "zqxjv", limit=100)
+    assert {(row["folder"], row["uid"]) for row in found} == marked
+    assert len(index.search("moi@exemple.nc", "facture", limit=50)) == 50
+    assert index.search("autre@exemple.nc", "zqxjv") == []
+
+
+def test_fulltext_queries_use_messages_primary_key(index):
+    fill(index, 300)
+    plans = query_plans(index, lambda: index.search("moi@exemple.nc", "zqxjv"))
+    plans += query_plans(index, lambda: index.cached_messages(
+        "moi@exemple.nc", match=match_expression(["zqxjv"])))
+    assert len(plans) == 2
+    for plan in plans:
+        # Une recherche par clé pour chaque ligne trouvée, pas un parcours du dossier
+        assert "SEARCH m USING PRIMARY KEY (folder_id=? AND uid=?)" in plan
+
+
+def test_cached_messages_match(index):
+    marked = fill(index, 1500)
+    rows = index.cached_messages("moi@exemple.nc", match=match_expression(["zqxjv"]))
+    assert {(row[0], row[1]) for row in rows} == marked
+    assert len(index.cached_messages("moi@exemple.nc")) == 1500
+
+
+def test_without_trigram_tokenizer(tmp_path, monkeypatch):
+    monkeypatch.setattr(mail_index, "FULLTEXT_SCHEMA",
+                        mail_index.FULLTEXT_SCHEMA.replace("trigram", "absent"))
+    index = MailIndex(tmp_path / "index.sqlite3")
+    assert not index.fulltext
+    marked = fill(index, 600)
+    assert {(row["folder"], row["uid"]) for row in index.search("moi@exemple.nc", "zqxjv")} == marked
+    # Sans présélection, la simulation parcourt tout le cache
+    assert len(index.cached_messages("moi@exemple.nc", match=match_expression(["zqxjv"]))) == 600
+    index.close()
+
+    # Tokenizer de nouveau disponible: la table search est remplie depuis les messages
+    monkeypatch.undo()
+    index = MailIndex(tmp_path / "index.sqlite3")
+    assert index.fulltext
+    assert {(row["folder"], row["uid"]) for row in index.search("moi@exemple.nc", "zqxjv")} == marked
+    index.close()
+
+
+def test_search_follows_rewritten_messages(index):
+    folder_id = index.folder_id("moi@exemple.nc", "INBOX", 1)
+    index.add(folder_id, 7, "<7@exemple.nc>", "a", "b", "", "Ancien sujet", DATE, 10, "",
+              body="texte périmé")
+    index.flush()
+    index.add(folder_id, 7, "<7@exemple.nc>", "a", "b", "", "Nouveau sujet", DATE, 10, "\\Seen",
+              body="texte actuel")
+    index.flush()
+    assert index.search("moi@exemple.nc", "périmé") == []
+    assert index.search("moi@exemple.nc", "Ancien") == []
+    assert [row["uid"] for row in index.search("moi@exemple.nc", "actuel")] == [7]
+    # Sans nouveau corps, le corps conservé reste indexé
+    index.add(folder_id, 7, "<7@exemple.nc>", "a", "b", "", "Dernier sujet", DATE, 10, "\\Seen")
+    index.flush()
+    assert [row["uid"] for row in index.search("moi@exemple.nc", "actuel")] == [7]
+    assert index.search("moi@exemple.nc", "Nouveau") == []
+    # Table sans contenu: aucun texte recopié, index cohérent
+    assert index.db.execute("SELECT subject FROM search").fetchone() == (None,)
+    index.db.execute("INSERT INTO search (search) VALUES ('integrity-check')")
+
+
+def test_content_table_from_version_4_is_rebuilt(tmp_path):
+    path = tmp_path / "index.sqlite3"
+    index = MailIndex(path)
+    marked = fill(index, 300, marker_every=100)
+    index.close()
+    # Base de la version 4: la table search gardait sa propre copie des textes
+    index = MailIndex(path)
+    index.db.executescript("DROP TABLE search; "
+                           "CREATE VIRTUAL TABLE search USING fts5 (subject, body, tokenize = 'trigram'); "
+                           "PRAGMA user_version = 4;")
+    index.close()
+
+    index = MailIndex(path)
+    sql = index.db.execute("SELECT sql FROM sqlite_master WHERE name = 'search'").fetchone()[0]
+    assert "content = ''" in sql
+    assert {(row["folder"], row["uid"]) for row in index.search("moi@exemple.nc", "zqxjv")} == marked
+    index.close()
+
+
+def test_handled(index):
+    inbox = index.folder_id("moi@exemple.nc", "INBOX", 1)
+    archive = index.folder_id("moi@exemple.nc", "INBOX.Archives", 1)
+    copies = index.folder_id("moi@exemple.nc", "INBOX.CA", 1)
+    add = lambda folder_id, uid, n, **decision: index.add(
+        folder_id, uid, f"<{n}@exemple.nc>", "a@exemple.nc", "moi@exemple.nc", "",
+        f"Sujet {n}", DATE, 1000, "", rules_version="v1", applied=True, **decision)
+    add(inbox, 1, 1, action="Déplacer vers", target="INBOX.CA")
+    add(inbox, 2, 2, action="Marquer comme lu")
+    add(inbox, 3, 3, action="Copier vers", target="INBOX.CA")
+    add(archive, 4, 4)
+    index.flush()
+
+    # Copie arrivée dans un autre dossier: triée quelle que soit la version des règles
+    assert index.handled("moi@exemple.nc", "<1@exemple.nc>", copies, 1, "v2")
+    assert index.handled("moi@exemple.nc", "<3@exemple.nc>", copies, 7, "v2")
+    assert not index.handled("autre@exemple.nc", "<1@exemple.nc>", copies, 1, "v1")
+    # Traité sur place: seulement pour la même version des règles
+    assert index.handled("moi@exemple.nc", "<2@exemple.nc>", inbox, 2, "v1")
+    assert not index.handled("moi@exemple.nc", "<2@exemple.nc>", inbox, 2, "v2")
+    assert not index.handled("moi@exemple.nc", "<2@exemple.nc>", archive, 9, "v1")
+    assert index.handled("moi@exemple.nc", "<3@exemple.nc>", inbox, 3, "v1")
+    assert not index.handled("moi@exemple.nc", "<3@exemple.nc>", inbox, 3, "v2")
+    # Analysé sans action, ou inconnu
+    assert not index.handled("moi@exemple.nc", "<4@exemple.nc>", inbox, 4, "v1")
+    assert not index.handled("moi@exemple.nc", "<5@exemple.nc>", inbox, 5, "v1")
+
+
+def test_reusable_uids(index):
+    inbox = index.folder_id("moi@exemple.nc", "INBOX", 1)
+    recent = time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())
+    for uid, flags, date, action in ((1, "", DATE, None), (2, "\\Seen \\Flagged", DATE, None),
+                                     (3, "\\Seen", recent, None), (4, "", DATE, "Déplacer vers")):
+        index.add(inbox, uid, f"<{uid}@exemple.nc>", "a@exemple.nc", "moi@exemple.nc", "",
+                  f"Sujet {uid}", date, 1000, flags, action=action, rules_version="v1")
+    index.add(inbox, 5, "<5@exemple.nc>", "a@exemple.nc", "moi@exemple.nc", "", "Sujet 5",
+              DATE, 1000, "", rules_version="v0")
+    index.flush()
+
+    assert index.reusable_uids(inbox, "v1") == {1, 2, 3}
+    assert index.reusable_uids(inbox, "v1", recheck_flagged=True) == {1, 3}
+    assert index.reusable_uids(inbox, "v1", recent_seconds=3600) == {1, 2}
+    assert index.reusable_uids(inbox, "v2") == set()
+    assert index.reusable_uids(index.folder_id("moi@exemple.nc", "INBOX", 2), "v1") == set()